@@ -0,0 +1,132 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any
+from langchain_classic.agents.agent import RunnableAgent
+from langchain_classic.agents.format_scratchpad import format_log_to_str
+from langchain_core.agents import AgentFinish
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Ограничения одного запроса к агенту: секунды на весь ответ и токены модели (запрос + ответ, все шаги)
+AGENT_DEADLINE = float(os.getenv("AGENT_DEADLINE", 60))
+AGENT_TOKEN_BUDGET = int(os.getenv("AGENT_TOKEN_BUDGET", 12000))
+# Оценка токенов, когда модель не сообщает token_usage
+CHARS_PER_TOKEN = 4
+# Продолжение сценария, после которого модель пишет только окончательный ответ
+FINAL_ANSWER_PREFIX = "Теперь у меня есть окончательный ответ\nFinal Answer:"
+
+_current_budget = contextvars.ContextVar("agent_budget", default=None)
+
+
+def estimate_tokens(text):
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+
+class BudgetStats:
+    """Сколько запросов агент закончил сам, а сколько оборвано по времени или токенам, и сколько токенов потрачено"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.stopped = {"deadline": 0, "tokens": 0}
+        self.tokens = 0
+
+    def record(self, budget):
+        with self._lock:
+            self.requests += 1
+            self.tokens += budget.tokens
+            if budget.stopped:
+                self.stopped[budget.stopped] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "stopped_by_deadline": self.stopped["deadline"],
+                "stopped_by_tokens": self.stopped["tokens"],
+                "tokens": self.tokens,
+                "avg_tokens": round(self.tokens / self.requests, 1) if self.requests else 0.0,
+            }
+
+
+budget_stats = BudgetStats()
+
+
+class RequestBudget(BaseCallbackHandler):
+    """
+    Время и токены одного запроса. Как callback считает токены каждого вызова модели
+    (token_usage, если модель его возвращает, иначе оценка по длине текста).
+    Бюджет исчерпан, если прошёл срок или следующий шаг, не дешевле предыдущего, в токены уже не поместится.
+    """
+
+    def __init__(self, deadline=AGENT_DEADLINE, token_budget=AGENT_TOKEN_BUDGET):
+        self.deadline = time.monotonic() + deadline if deadline else None
+        self.token_budget = token_budget
+        self.tokens = 0
+        self.last_call_tokens = 0
+        self.stopped = None     # "deadline" или "tokens", если агента остановили до его собственного ответа
+        self._prompts = {}
+        self._lock = threading.Lock()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._prompts[run_id] = sum(estimate_tokens(prompt) for prompt in prompts)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        total = usage.get("total_tokens") if isinstance(usage, dict) else getattr(usage, "total_tokens", None)
+        prompt = self._prompts.pop(run_id, 0)
+        if total is None:
+            total = prompt + sum(estimate_tokens(generation.text) for generations in response.generations for generation in generations)
+        with self._lock:
+            self.tokens += total
+            self.last_call_tokens = total
+
+    def remaining_seconds(self):
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+    def exhausted(self):
+        """Причина остановки ("deadline"/"tokens") или None, пока бюджета хватает"""
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return "deadline"
+        if self.token_budget and self.tokens + self.last_call_tokens > self.token_budget:
+            return "tokens"
+        return None
+
+
+def current_budget():
+    return _current_budget.get()
+
+
+@contextmanager
+def budgeted(budget):
+    """На время выполнения агента делает budget доступным ConcurrentAgentExecutor и ForcedAnswerAgent"""
+    _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.set(None)
+        if budget is not None:
+            budget_stats.record(budget)
+
+
+class ForcedAnswerAgent(RunnableAgent):
+    """
+    RunnableAgent, который при остановке (лимит итераций, срок или токены запроса) с early_stopping_method="generate"
+    не возвращает "Agent stopped...", а ещё одним вызовом модели просит окончательный ответ по уже собранным наблюдениям.
+    """
+
+    final_answer: Any = None    # prompt | llm: {"input", "agent_scratchpad"} -> текст
+
+    def return_stopped_response(self, early_stopping_method, intermediate_steps, **kwargs):
+        if early_stopping_method != "generate" or self.final_answer is None:
+            return super().return_stopped_response(early_stopping_method, intermediate_steps, **kwargs)
+        budget = current_budget()
+        scratchpad = format_log_to_str(intermediate_steps) + FINAL_ANSWER_PREFIX
+        text = self.final_answer.invoke(
+            {**kwargs, "agent_scratchpad": scratchpad},
+            config={"callbacks": [budget] if budget is not None else None},
+        )
+        text = str(getattr(text, "content", text)).split("Final Answer:")[-1].strip()
+        return AgentFinish({"output": text}, text)
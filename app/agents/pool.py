@@ -0,0 +1,98 @@
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from .budget import AGENT_DEADLINE, AGENT_TOKEN_BUDGET, RequestBudget, budget_stats
+
+# Сколько готовых агентов держит пул; столько запросов к агенту выполняется одновременно
+AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", 2))
+# Сколько секунд запрос ждёт свободного агента, прежде чем получить отказ
+AGENT_CHECKOUT_TIMEOUT = float(os.getenv("AGENT_CHECKOUT_TIMEOUT", 10))
+
+
+class AgentPoolBusy(Exception):
+    """Все агенты заняты дольше AGENT_CHECKOUT_TIMEOUT"""
+
+
+class AgentPool:
+    """
+    Пул заранее созданных ReActAgent, общий для всех запросов. Агент выдаётся одному запросу
+    (checkout) и возвращается после ответа, так что одновременно работает не больше size агентов,
+    а это ограничивает нагрузку на модель и её стоимость. Каждый запрос получает срок и бюджет токенов.
+    """
+
+    def __init__(self, factory, size=AGENT_POOL_SIZE, checkout_timeout=AGENT_CHECKOUT_TIMEOUT,
+                 deadline=AGENT_DEADLINE, token_budget=AGENT_TOKEN_BUDGET):
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+        self.deadline = deadline
+        self.token_budget = token_budget
+        # LIFO: чаще всего выдаётся последний вернувшийся агент с прогретыми соединениями
+        self._idle = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(factory())
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._waiting = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """Свободный агент на время блока with; AgentPoolBusy, если его не дождаться за timeout секунд"""
+        started = time.perf_counter()
+        with self._lock:
+            self._waiting += 1
+        try:
+            agent = self._idle.get(timeout=self.checkout_timeout if timeout is None else timeout)
+        except queue.Empty:
+            with self._lock:
+                self._timeouts += 1
+            raise AgentPoolBusy(f"all {self.size} agents are busy")
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._checkouts += 1
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+            self._wait_seconds += waited
+            self._max_wait_seconds = max(self._max_wait_seconds, waited)
+        try:
+            yield agent
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._idle.put(agent)
+
+    def budget(self):
+        return RequestBudget(self.deadline, self.token_budget)
+
+    def ask(self, question):
+        with self.checkout() as agent:
+            return agent.ask(question, self.budget())
+
+    def ask_stream(self, question):
+        """Агент занят, пока генератор не исчерпан или не закрыт"""
+        with self.checkout() as agent:
+            yield from agent.ask_stream(question, self.budget())
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+                "peak_in_use": self._peak_in_use,
+                "saturation": round(self._in_use / self.size, 4) if self.size else 0.0,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "avg_wait_ms": round(self._wait_seconds * 1000 / self._checkouts, 1) if self._checkouts else 0.0,
+                "max_wait_ms": round(self._max_wait_seconds * 1000, 1),
+                **budget_stats.stats(),
+            }
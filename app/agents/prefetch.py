@@ -0,0 +1,182 @@
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from langchain_classic.agents import AgentExecutor
+from langchain_core.agents import AgentAction, AgentStep
+from .budget import current_budget
+
+# Потоки для инструментов агента: предзапуск и одновременные действия одного шага
+TOOL_WORKERS = int(os.getenv("AGENT_TOOL_WORKERS", 8))
+# Инструменты, которые запускаются на исходном вопросе сразу при вызове ask(), например "rag_query_tool,search_web_tool"
+PREFETCH_TOOLS = tuple(name for name in os.getenv("AGENT_PREFETCH_TOOLS", "rag_query_tool").split(",") if name)
+# Доля общих слов (Жаккар), при которой запрос модели считается тем же, что и предзапущенный
+PREFETCH_MIN_OVERLAP = float(os.getenv("AGENT_PREFETCH_MIN_OVERLAP", 0.8))
+
+_tool_pool = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="agent-tool")
+_current_prefetch = contextvars.ContextVar("agent_prefetch", default=None)
+_step_futures = contextvars.ContextVar("agent_step_futures", default=None)
+
+
+def query_terms(tool_input):
+    """Слова запроса; Action Input может быть строкой JSON {"query": "..."}, словарём или просто строкой"""
+    if isinstance(tool_input, str):
+        try:
+            tool_input = json.loads(tool_input)
+        except ValueError:
+            pass
+    if isinstance(tool_input, dict):
+        tool_input = tool_input.get("query", "")
+    return set(re.findall(r"\w+", str(tool_input).casefold().replace("ё", "е")))
+
+
+def overlap(first, second):
+    return len(first & second) / len(first | second) if first | second else 0.0
+
+
+class PrefetchStats:
+    """Сколько предзапусков пригодилось, сколько пропало, и сколько секунд ожидания инструмента сэкономлено"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.used = 0
+        self.wasted = 0
+        self.saved_seconds = 0.0
+
+    def record(self, started=0, used=0, wasted=0, saved_seconds=0.0):
+        with self._lock:
+            self.started += started
+            self.used += used
+            self.wasted += wasted
+            self.saved_seconds += saved_seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                "started": self.started,
+                "used": self.used,
+                "wasted": self.wasted,
+                "use_rate": round(self.used / self.started, 4) if self.started else 0.0,
+                "saved_ms": round(self.saved_seconds * 1000, 1),
+            }
+
+
+prefetch_stats = PrefetchStats()
+
+
+class ToolPrefetch:
+    """Инструменты, запущенные на исходном вопросе до первого обращения к модели"""
+
+    def __init__(self, question, tools):
+        self.terms = query_terms(question)
+        self.running = {}
+        for tool in tools:
+            entry = {"started": time.perf_counter(), "finished": None}
+            entry["future"] = _tool_pool.submit(self._run, tool, question, entry)
+            self.running[tool.name] = entry
+        prefetch_stats.record(started=len(self.running))
+
+    @staticmethod
+    def _run(tool, question, entry):
+        try:
+            return tool.invoke({"query": question})
+        finally:
+            entry["finished"] = time.perf_counter()
+
+    def take(self, tool_name, tool_input):
+        """Future предзапущенного вызова, если модель просит тот же инструмент с тем же запросом, иначе None"""
+        entry = self.running.get(tool_name)
+        if entry is None or overlap(query_terms(tool_input), self.terms) < PREFETCH_MIN_OVERLAP:
+            return None
+        del self.running[tool_name]
+        asked = time.perf_counter()
+        # Сэкономлено время, которое вызов уже отработал к моменту, когда модель его запросила
+        prefetch_stats.record(used=1, saved_seconds=min(asked, entry["finished"] or asked) - entry["started"])
+        return entry["future"]
+
+    def close(self):
+        """Невостребованные вызовы отменяются (уже начатые дорабатывают в фоне)"""
+        for entry in self.running.values():
+            entry["future"].cancel()
+        prefetch_stats.record(wasted=len(self.running))
+        self.running.clear()
+
+
+@contextmanager
+def prefetching(question, tools):
+    """На время выполнения агента делает предзапуск tools на вопросе доступным ConcurrentAgentExecutor"""
+    prefetch = ToolPrefetch(question, tools) if tools else None
+    _current_prefetch.set(prefetch)
+    try:
+        yield prefetch
+    finally:
+        _current_prefetch.set(None)
+        if prefetch is not None:
+            prefetch.close()
+
+
+class ConcurrentAgentExecutor(AgentExecutor):
+    """
+    AgentExecutor, в котором все действия шага запускаются в пуле потоков одновременно, а не по очереди,
+    и действие, совпавшее с предзапуском (см. prefetching), получает уже идущий или готовый результат.
+    Бюджет запроса (см. budgeted) останавливает цикл до max_iterations и ограничивает ожидание инструментов.
+    """
+
+    def _should_continue(self, iterations, time_elapsed):
+        if not super()._should_continue(iterations, time_elapsed):
+            return False
+        budget = current_budget()
+        if budget is not None and budget.stopped is None:
+            budget.stopped = budget.exhausted()
+        return budget is None or budget.stopped is None
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        futures = {}
+        _step_futures.set(futures)
+        try:
+            for item in super()._iter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager):
+                # Родитель сначала отдаёт все действия шага и только потом выполняет их по одному
+                if isinstance(item, AgentAction):
+                    future = self._start_action(name_to_tool_map, color_mapping, item, run_manager)
+                    if future is not None:
+                        futures[id(item)] = future
+                yield item
+        finally:
+            _step_futures.set(None)
+
+    def _start_action(self, name_to_tool_map, color_mapping, agent_action, run_manager):
+        prefetch = _current_prefetch.get()
+        future = prefetch.take(agent_action.tool, agent_action.tool_input) if prefetch is not None else None
+        if future is not None or agent_action.tool not in name_to_tool_map:
+            return future
+        tool = name_to_tool_map[agent_action.tool]
+        tool_run_kwargs = self._action_agent.tool_run_logging_kwargs()
+        if tool.return_direct:
+            tool_run_kwargs["llm_prefix"] = ""
+        return _tool_pool.submit(
+            tool.run,
+            agent_action.tool_input,
+            verbose=self.verbose,
+            color=color_mapping[agent_action.tool],
+            callbacks=run_manager.get_child() if run_manager else None,
+            **tool_run_kwargs,
+        )
+
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        future = (_step_futures.get() or {}).pop(id(agent_action), None)
+        if future is None:
+            return super()._perform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+        if run_manager:
+            run_manager.on_agent_action(agent_action, color="green")
+        budget = current_budget()
+        try:
+            observation = future.result(timeout=budget.remaining_seconds() if budget is not None else None)
+        except FutureTimeoutError:
+            future.cancel()
+            observation = "Инструмент не ответил до истечения времени запроса"
+        return AgentStep(action=agent_action, observation=observation)
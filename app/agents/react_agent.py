@@ -1,15 +1,21 @@
 import os
 from langchain_classic.agents import create_react_agent, AgentExecutor, ZeroShotAgent
+from langchain_core.tools import render_text_description
 from tools import search_web_tool, append_to_file_tool, rag_query_tool
 # from langchain_gigachat import GigaChat
 from langchain_community.llms.gigachat import GigaChat
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
 from langchain_core.messages import SystemMessage
 from dotenv import get_key
+from .budget import ForcedAnswerAgent, budgeted
+from .prefetch import ConcurrentAgentExecutor, PREFETCH_TOOLS, prefetching
 # from langchain_classic.tools import Tool # make tool throught @tool
 
 class ReActAgent:
-    def __init__(self):
+    # Ключ модели в кэше ответов: ответы агента не смешиваются с ответами простого чата
+    CACHE_MODEL = "react-agent:Gigachat-2-Pro"
+
+    def __init__(self, answer_cache=None, llm=None, tools=None, prefetch_tools=PREFETCH_TOOLS):
         """
         Инициализация ReAct-агента
             ## Агент должен:
@@ -17,11 +23,15 @@ class ReActAgent:
             `работать через create_react_agent`,
             `иметь system prompt с инструкциями`,
             `поддерживать инструменты search_web_tool и append_to_file_tool.`
+
+        answer_cache: необязательный utils.answer_cache.AnswerCache для повторяющихся вопросов
+        llm, tools: подменяют GigaChat и набор инструментов (бенчмарки)
+        prefetch_tools: имена инструментов, которые запускаются на вопросе одновременно с первым обращением к модели
         """
         # print(get_key(dotenv_path='.env', key_to_get='GIGACHAT_CREDENTIALS'))
         
         # Инициализация LLM
-        self.llm = GigaChat(
+        self.llm = llm or GigaChat(
             credentials= os.getenv('GIGACHAT_CREDENTIALS'),
             scope="GIGACHAT_API_B2B",
             model="Gigachat-2-Pro",
@@ -30,11 +40,14 @@ class ReActAgent:
         )
         
         # Инициализация инструментов
-        self.tools = self._initialize_tools()
+        self.tools = tools or self._initialize_tools()
+        self.prefetch_tools = [tool for tool in self.tools if tool.name in prefetch_tools]
         
         # Создание агента
         self.agent_executor = self._create_agent()
 
+        self.answer_cache = answer_cache
+
     def _initialize_tools(self):
         """Инициализация инструментов"""
         return [search_web_tool, append_to_file_tool, rag_query_tool]
@@ -106,27 +119,89 @@ class ReActAgent:
             prompt=prompt
         )
         
-        return AgentExecutor(
-            agent=agent,
+        # При остановке по лимиту модель по тому же промпту сразу пишет окончательный ответ
+        final_answer = prompt.partial(
+            tools=render_text_description(list(self.tools)),
+            tool_names=", ".join(tool.name for tool in self.tools),
+        ) | self.llm.bind(stop=["\nObservation"])
+
+        # Действия одного шага выполняются параллельно, предзапущенные инструменты не вызываются второй раз
+        return ConcurrentAgentExecutor(
+            agent=ForcedAnswerAgent(runnable=agent, final_answer=final_answer),
             tools=self.tools,
             # verbose=True,
             max_iterations=7,
-            early_stopping_method="force",
+            early_stopping_method="generate",
             handle_parsing_errors=True,  # handle parsing error
             return_intermediate_steps=True  # debug
         )
 
-    def ask(self, query: str) -> str:
-        """Выполнение запроса"""
+    def ask(self, query: str, budget=None) -> str:
+        """Выполнение запроса; budget - необязательный agents.budget.RequestBudget (срок и токены)"""
+        cached = self._cached_answer(query)
+        if cached is not None:
+            return cached
         try:
             # print(f"Starting agent for query: {query}")
-            result = self.agent_executor.invoke({"input": query})
+            # Поиск по базе знаний стартует сразу, пока модель думает над первым шагом
+            with prefetching(query, self.prefetch_tools), budgeted(budget):
+                result = self.agent_executor.invoke({"input": query}, config=self._run_config(budget))
             # print(f"Agent result: {result}")
-            return result.get("output", "Ответ не получен")
+            output = result.get("output", "Ответ не получен")
+            self._cache_answer(query, output, budget)
+            return output
         except Exception as e:
             # print(f"Agent error: {e}")
             return f"Ошибка выполнения: {str(e)}"
 
+    def ask_stream(self, query: str, budget=None):
+        """
+        Пошаговое выполнение запроса: события отдаются по мере появления
+            `action` - Thought/Action/Action Input очередного шага,
+            `observation` - результат инструмента,
+            `final` - окончательный ответ.
+        Закрытие генератора прерывает работу агента.
+        budget - как в ask().
+        """
+        cached = self._cached_answer(query)
+        if cached is not None:
+            yield {"type": "final", "text": cached}
+            return
+
+        stream = self.agent_executor.stream({"input": query}, config=self._run_config(budget))
+        # Поиск по базе знаний стартует сразу, пока модель думает над первым шагом
+        with prefetching(query, self.prefetch_tools), budgeted(budget):
+            try:
+                for chunk in stream:
+                    for action in chunk.get("actions", []):
+                        yield {"type": "action", "tool": action.tool, "tool_input": action.tool_input, "text": action.log}
+                    for step in chunk.get("steps", []):
+                        yield {"type": "observation", "tool": step.action.tool, "text": str(step.observation)}
+                    if "output" in chunk:
+                        self._cache_answer(query, chunk["output"], budget)
+                        yield {"type": "final", "text": chunk["output"] or "Ответ не получен"}
+            except Exception as e:
+                yield {"type": "final", "text": f"Ошибка выполнения: {str(e)}"}
+            finally:
+                stream.close()
+
+    def _cached_answer(self, query):
+        if self.answer_cache is None:
+            return None
+        return self.answer_cache.get(query, self.CACHE_MODEL)
+
+    @staticmethod
+    def _run_config(budget):
+        return {"callbacks": [budget]} if budget is not None else None
+
+    def _cache_answer(self, query, output, budget=None):
+        """В кэш попадают только настоящие ответы, а не остановка по лимиту итераций/времени или бюджету запроса"""
+        if self.answer_cache is None or not output or output.startswith("Agent stopped"):
+            return
+        if budget is not None and budget.stopped:
+            return
+        self.answer_cache.set(query, self.CACHE_MODEL, output)
+
     
     # system_prompt = """
     #     Answer the following questions as best you can. You have access to the following tools:
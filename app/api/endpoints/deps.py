@@ -0,0 +1,12 @@
+from flask import g, session
+from db.base import db
+from models.user import User
+
+
+def get_current_user():
+    """The logged-in user, loaded at most once per request and kept in flask.g; None when logged out or being deleted"""
+    if "current_user" not in g:
+        user_id = session.get("user_id")
+        user = db.session.get(User, user_id) if user_id is not None else None
+        g.current_user = user if user is not None and not user.deleting else None
+    return g.current_user
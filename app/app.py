@@ -1,36 +1,72 @@
 # pip install -U Flask-SQLAlchemy
 
-from flask import Flask, render_template, flash, redirect, url_for, jsonify, request, session
+from flask import Flask, render_template, flash, redirect, url_for, jsonify, request, session, Response, stream_with_context
 # from flask_sqlalchemy import SQLAlchemy
 import sqlalchemy as sa
+import click
 from sqlalchemy import select
 from db.base import db
+from core.config import Config
 import re
-from models.user import User
+from models.user import User, archive_book_ids_cache
 from models.book import Book
 from models.userbook import UserBook
+from models.appmeta import AppMeta
+from models.bookneighbor import BookNeighbor
+from models.bookcoread import BookCoRead, BookCoReadTop, CO_READS_K
 import json
 import os
+import time
 from flask_migrate import Migrate
-from utils.read_json import book_data_list
+from db.instrumentation import SQLInstrumentation
+from db.purge import archive_size, pending_purges, purge_user, purge_user_in_background, resume_on_first_request, BACKGROUND_PURGE_THRESHOLD
+from db.session import init_engines
+from db.versioning import init_versioning, get_versions
+from db.co_reads import apply_pending as apply_pending_co_reads
+from api.endpoints.deps import get_current_user
+from db.seed import seed_catalog, seed_demo_users, CATALOG_PATH
+from utils.catalog_import import import_catalog, CatalogFormatError, FORMATS
+from utils.pagination import keyset_page, get_page_size
+from utils.sse import sse_event
+from utils.assets import Assets, build_assets
+from markupsafe import Markup
+from utils.http_cache import conditional_get, cached_fragment, conditional_get_stats, fragment_cache
 # import secrets
 
-from agents.react_agent import ReActAgent
 from tools import rag_query_tool, search_web_tool
+from tools.rag_query import get_rag_embeddings, reembed_collection, EMBEDDING_BACKEND, RAG_SOURCE_COLLECTION
+from tools.book_index import refresh_book_neighbors, BOOK_NEIGHBORS_K
+from tools.retrieval_cache import retrieval_stats, query_embedding_cache, retrieval_result_cache
+from tools.registry import lazy_resource, warm_up_in_background
+from utils.answer_cache import create_answer_cache
 
 # Создание агента
 # react_agent = ReActAgent()
 
-from openai import OpenAI
+# Clients are created on first use, so importing the app (and serving /books) does not pay for them
+@lazy_resource("chat_client")
+def get_chat_client():
+    from openai import OpenAI
+    return OpenAI(
+        base_url="https://router.huggingface.co/v1",
+        api_key=os.environ["CHAT_GPT_TOKEN"],
+    )
+
+CHAT_MODEL = "openai/gpt-oss-120b:groq"
 
-client = OpenAI(
-    base_url="https://router.huggingface.co/v1",
-    api_key=os.environ["CHAT_GPT_TOKEN"],
+# Repeated questions are answered from the cache instead of a new LLM round-trip; reworded ones too when
+# ANSWER_CACHE_MAX_DISTANCE > 0, and then only for the plain chat model (agent answers are matched exactly)
+answer_cache = create_answer_cache(
+    embed=lambda text: get_rag_embeddings().embed_query(text), semantic_models=(CHAT_MODEL,), embedding_space=EMBEDDING_BACKEND
 )
 
 def chat_llm(ques):
-    completion = client.chat.completions.create(
-        model="openai/gpt-oss-120b:groq",
+    cached = answer_cache.get(ques, CHAT_MODEL)
+    if cached is not None:
+        return cached
+
+    completion = get_chat_client().chat.completions.create(
+        model=CHAT_MODEL,
         messages=[
             {
                 "role": "user",
@@ -38,21 +74,96 @@ def chat_llm(ques):
             }
         ],
     )
-    return completion.choices[0].message.content
+    answer = completion.choices[0].message.content
+    answer_cache.set(ques, CHAT_MODEL, answer)
+    return answer
+
+def chat_llm_stream(ques):
+    """Yield the answer piece by piece as the provider generates it"""
+    cached = answer_cache.get(ques, CHAT_MODEL)
+    if cached is not None:
+        yield cached
+        return
+
+    stream = get_chat_client().chat.completions.create(
+        model=CHAT_MODEL,
+        messages=[
+            {
+                "role": "user",
+                "content": f"{ques}"
+            }
+        ],
+        stream=True,
+    )
+    parts = []
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                yield parts[-1]
+        # Only complete answers are cached, not the ones cut by a disconnect
+        answer_cache.set(ques, CHAT_MODEL, "".join(parts))
+    finally:
+        # Closing the HTTP response cancels generation upstream (client went away or the answer is done)
+        stream.close()
+
+# Agents are expensive to build, so the pool (AGENT_POOL_SIZE ready agents shared by all requests)
+# is created on the first request that asks for it, or at startup with WARM_UP_TOOLS=agent_pool
+@lazy_resource("agent_pool")
+def get_agent_pool():
+    from agents.pool import AgentPool
+    from agents.react_agent import ReActAgent
+    return AgentPool(lambda: ReActAgent(answer_cache=answer_cache))
+
+def agent_pool_stats():
+    """Pool saturation, checkout waits and request budgets; empty until the pool is built (keeps langchain out of startup)"""
+    return get_agent_pool().stats() if get_agent_pool.initialized() else {}
+
+def agent_prefetch_stats():
+    """Speculative tool prefetch of the agent; empty until the pool is built"""
+    if not get_agent_pool.initialized():
+        return {}
+    from agents.prefetch import prefetch_stats
+    return prefetch_stats.stats()
 
 # create the app
 app = Flask(__name__)
 # app.secret_key = secrets.token_hex(32)
-app.secret_key = os.environ.get('SECRET_KEY', 'dev-fallback-key')
 
-# configure the SQLite database, relative to the app instance folder
-app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///booklibrary.db"
+# SECRET_KEY, DATABASE_URL (SQLite file in the instance folder by default, or PostgreSQL),
+# engine pool options and SQLite pragmas, see core/config.py
+app.config.from_object(Config)
 
 # initialize the app with the extension
 db.init_app(app)
+init_engines(app)
+# app_meta version counters follow every change of books, users and archives
+init_versioning()
 
 migrate = Migrate(app=app, db=db)
 
+# Fingerprinted, precompressed static files (flask build-assets) and gzip for HTML/JSON responses
+assets = Assets(app)
+
+# SQL count/time per request, N+1 warnings; X-SQL-* headers and /debug/metrics in debug mode
+sql_instrumentation = SQLInstrumentation(app)
+sql_instrumentation.register_metrics_source("answer_cache", answer_cache.stats)
+sql_instrumentation.register_metrics_source("archive_book_ids_cache", archive_book_ids_cache.stats)
+sql_instrumentation.register_metrics_source("fragment_cache", fragment_cache.stats)
+sql_instrumentation.register_metrics_source("conditional_get", conditional_get_stats.stats)
+sql_instrumentation.register_metrics_source("rag_retrieval", retrieval_stats.stats)
+sql_instrumentation.register_metrics_source("rag_query_embedding_cache", query_embedding_cache.stats)
+sql_instrumentation.register_metrics_source("rag_result_cache", retrieval_result_cache.stats)
+sql_instrumentation.register_metrics_source("agent_pool", agent_pool_stats)
+sql_instrumentation.register_metrics_source("agent_prefetch", agent_prefetch_stats)
+
+# Purges cut off by the previous shutdown are finished in the background (see also flask purge-pending-users)
+resume_on_first_request(app)
+
+# Optional warm-up of the lazy tools/clients, e.g. WARM_UP_TOOLS=all or WARM_UP_TOOLS=rag_chain,exa
+if os.environ.get("WARM_UP_TOOLS"):
+    warm_up_in_background(None if os.environ["WARM_UP_TOOLS"] == "all" else os.environ["WARM_UP_TOOLS"].split(","))
+
 # db = SQLAlchemy(app=app)
     
 # user_book_m2m = db.Table(
@@ -74,11 +185,14 @@ def inject_user():
         print("Error {E} occurred in func inject_user")
 
 @app.route("/")
+# The logged-in user's own archive changes show at once through their ArchiveVersion, bumped in the write transaction
+@conditional_get("users_version", "archives_version", "catalog_version", user_archive=True)
 def load_root():
-    users = db.session.execute(db.select(User).order_by(User.id)).scalars().all()
+    size = get_page_size()
+    users, next_cursor = keyset_page(User.select_with_archive(), [User.id], request.args.get("after"), size)
     active_user_id = session.get("user_id") if ("user_id" in session.keys()) else None
     # active_user_id = session.get("user_id") if session.get("user_id") else None => Error: session not has key "user_id"
-    return render_template("home.html", users = users, active_user_id=active_user_id)
+    return render_template("home.html", users = users, active_user_id=active_user_id, next_cursor=next_cursor, size=size)
 
 @app.route("/ask", methods=["POST"])
 def answer():
@@ -86,21 +200,71 @@ def answer():
         # if "message" in request.json: OR
         if "message" in request.get_json():
             question = request.get_json()["message"]
+            use_agent = bool(request.get_json().get("agent"))
+
+            if request.get_json().get("stream") or request.accept_mimetypes.best == "text/event-stream":
+                return Response(
+                    stream_with_context(stream_answer(question, use_agent)),
+                    mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                )
+
             # Пример использования
             # result = await react_agent.ask(question) // ask is not async function, so cant use await
-            result = chat_llm(ques=question)
+            if not use_agent:
+                return jsonify({"response": chat_llm(ques=question)})
+            from agents.pool import AgentPoolBusy
+            try:
+                result = get_agent_pool().ask(question)
+            except AgentPoolBusy:
+                return jsonify({"response": "Все агенты заняты, попробуйте еще раз через минуту!"}), 503, {"Retry-After": "10"}
             # result = react_agent.ask(question)
             return jsonify({"response": result})
 
+def chat_events(question):
+    tokens = chat_llm_stream(question)
+    try:
+        for text in tokens:
+            yield {"type": "token", "text": text}
+    finally:
+        tokens.close()
+
+def stream_answer(question, use_agent=False):
+    """
+    SSE body for /ask: "metrics" with the first-token latency, then "token" events (plain chat)
+    or "action"/"observation"/"final" events (agent), and "done" at the end.
+    When the client disconnects the WSGI server closes this generator and the upstream call is cancelled.
+    """
+    started = time.perf_counter()
+    first_token_ms = None
+    source = iter(())
+    try:
+        source = get_agent_pool().ask_stream(question) if use_agent else chat_events(question)
+        for item in source:
+            if first_token_ms is None:
+                first_token_ms = round((time.perf_counter() - started) * 1000)
+                app.logger.info("ask stream: first token after %s ms (agent=%s)", first_token_ms, use_agent)
+                yield sse_event({"first_token_ms": first_token_ms}, event="metrics")
+            yield sse_event(item, event=item["type"])
+        yield sse_event({"first_token_ms": first_token_ms, "total_ms": round((time.perf_counter() - started) * 1000)}, event="done")
+    except Exception as E:
+        app.logger.warning("ask stream failed: %s", E)
+        yield sse_event({"text": "Ошибка произошла, попробуйте еще раз!"}, event="error")
+    finally:
+        if hasattr(source, "close"):
+            source.close()
+
 @app.route("/user/<string:name>")
 def load_user(name):
     return render_template("user/user.html", name=name.title())
 
 @app.route("/users", methods=["POST", "GET"])
+@conditional_get("users_version")
 def load_user_list():
-    users = db.session.execute(db.select(User).order_by(User.name)).scalars()
+    size = get_page_size()
+    users, next_cursor = keyset_page(User.select_active(), [User.name, User.id], request.args.get("after"), size)
     active_user_id = session.get("user_id") if ("user_id" in session.keys()) else None
-    return render_template("user/list.html", users=enumerate(users, 1), active_user_id=active_user_id)
+    return render_template("user/list.html", users=users, active_user_id=active_user_id, next_cursor=next_cursor, size=size)
 
 @app.route("/user/<int:id>/create")
 def create_user(id):
@@ -110,7 +274,7 @@ def create_user(id):
 @app.route("/user/<int:id>/detail")
 def user_detail(id):
     # user = db.get_or_404(User, id, description=f"User with Id {id} not found!")
-    user = User.query.get(id)
+    user = db.session.get(User, id)
     if user is None:
         return render_template("user/detail.html", message=f"User with Id {id} was not found!")
     return render_template("user/detail.html", user=user)
@@ -122,7 +286,7 @@ def update_user(id):
             # user = db.get_or_404(User, id)
             if ("user_id" in session.keys()):
                 if session["user_id"] == id: #postman
-                    user = User.query.get(id)
+                    user = get_current_user()
 
                     name = request.form["name"]
                     email = request.form["email"]
@@ -139,7 +303,7 @@ def update_user(id):
     
     elif "user_id" in session.keys():
         if session["user_id"] == id:
-            user = User.query.get(id)
+            user = get_current_user()
             return render_template("user/update.html", user=user)
         else:
             flash("That page does not exist!", "danger")
@@ -162,10 +326,12 @@ def delete_user(id):
             # return redirect("/users")
 
         try:
-            if user.user_books:
-                user.remove_all_from_archive()
-            db.session.delete(user)
-            db.session.commit()
+            if archive_size(user.id) > BACKGROUND_PURGE_THRESHOLD:
+                # Too many co-read pairs to update within the request: deleted in short chunks in the background
+                purge_user_in_background(app, user.id)
+            else:
+                User.delete_by_id(user.id)
+            session.pop("user_id", None)
             return redirect("/users")
         except Exception as E:
             flash("That page does not exist!", "danger")
@@ -178,10 +344,12 @@ def load_user_archive(id):
     try:
         if session['user_id'] == id:
             # user = db.get_or_404(User, id)
-            user = User.query.get(id)
-            if user.user_books:
-                userbooks = user.user_books
-                return render_template("user/archive.html",  userbooks = enumerate(userbooks, 1))
+            userbooks = UserBook.archive_of(id)
+            if userbooks:
+                # Stored lists, minus the books the user already has
+                book_ids = {userbook.book_id for userbook in userbooks}
+                co_reads = BookCoReadTop.lists_for(book_ids, exclude=book_ids)
+                return render_template("user/archive.html",  userbooks = enumerate(userbooks, 1), co_reads=co_reads)
             # return redirect(url_for("load_root"))
             return render_template("user/archive.html",  userbooks=None, message="You dont have any book in your archive!")
         # return render_template("404_error.html")
@@ -199,9 +367,9 @@ def load_user_archive(id):
 @app.route("/user/<int:user_id>/archive/book/<int:book_id>/add")
 def add_user_book(user_id, book_id):
     try:
-        user = User.query.get(user_id)
         if user_id != session["user_id"]:
             raise ValueError
+        user = get_current_user()
         user.add_to_archive(book_id)
         return redirect(f"/books")
     except Exception:
@@ -212,9 +380,9 @@ def remove_user_book(user_id, book_id):
     try:
         # user = db.get_or_404(User, id)
         if "user_id" in session.keys():
-            user = User.query.get(user_id)
             if user_id != session["user_id"]:
                 raise ValueError
+            user = get_current_user()
             user.remove_from_archive(book_id)
             flash("Book was removed successfully!", "success")
             return redirect(f"/user/{user_id}/archive")
@@ -230,7 +398,7 @@ def set_status_user_book(user_id, book_id):
             if user_id != session["user_id"]:
                 raise ValueError
             
-            user = User.query.get(user_id)
+            user = get_current_user()
             user.update_reading_status(book_id)
             return redirect(f"/user/{user_id}/archive")
         
@@ -238,21 +406,97 @@ def set_status_user_book(user_id, book_id):
     except Exception as E:
         return render_template("404_error.html")
     
+MAX_ARCHIVE_BATCH = 1000
+
+@app.route("/user/<int:user_id>/archive/batch", methods=["POST"])
+def batch_user_books(user_id):
+    """JSON {"operations": [...]} -> per-operation results, all applied in one transaction"""
+    if session.get("user_id") != user_id:
+        return jsonify({"error": "Login required"}), 403
+    payload = request.get_json(silent=True)
+    operations = payload.get("operations") if isinstance(payload, dict) else None
+    if not isinstance(operations, list):
+        return jsonify({"error": "Expected a JSON object with an \"operations\" list"}), 400
+    if len(operations) > MAX_ARCHIVE_BATCH:
+        return jsonify({"error": f"At most {MAX_ARCHIVE_BATCH} operations per batch"}), 400
+
+    try:
+        user = get_current_user()
+        if user is None:
+            return jsonify({"error": "User not found"}), 404
+        results = user.apply_archive_operations(operations)
+    except Exception as E:
+        # A JSON client gets a JSON error, not the HTML error page; nothing of the batch was applied
+        app.logger.exception("archive batch of user %s failed", user_id)
+        return jsonify({"error": f"Batch was not applied: {E.__class__.__name__}"}), 500
+    applied = sum(result["ok"] for result in results)
+    return jsonify({"applied": applied, "failed": len(results) - applied, "results": results})
+
+def render_book_rows(after, size):
+    """(book id, rendered cells) of one catalog page and the next cursor; the cells do not depend on the user"""
+    books, next_cursor = keyset_page(db.select(Book), [Book.name, Book.id], after, size)
+    cells = app.jinja_env.get_template("book/cells.html")
+    return [(book.id, Markup(cells.render(book=book))) for book in books], next_cursor
+
 @app.route("/books")
+@conditional_get("catalog_version", "co_reads_version", user_archive=True)
 def load_book_list():
-    books = db.session.execute(db.select(Book).order_by(Book.name)).scalars().all()
+    size = get_page_size()
+    after = request.args.get("after")
+    catalog_version = get_versions("catalog_version")["catalog_version"][0]
+    # Only the archive links are rendered per user, on top of the cached rows
+    books, next_cursor = cached_fragment(("books", catalog_version, after, size), lambda: render_book_rows(after, size))
+    # "Readers also read" changes with every archive, so it is read separately from the stored top lists
+    co_reads = BookCoReadTop.lists_for([book_id for book_id, _ in books])
     try:
         # user = User.query.get(session.get('user_id')) # will raise an error in future because user_id is not finded in session
         # if user:
         if "user_id" in session.keys():
-            user = User.query.get(session.get('user_id'))
-            user_books = [user_book.book_id for user_book in user.user_books]
+            # Cached per user and archive version (already read for the ETag): no archive query on a hit
+            user_books = User.archive_book_ids(session.get('user_id'))
         else:
-            user_books=[]
-        return render_template("book/list.html", books = books, user_books = user_books)
+            user_books = set()
+        return render_template("book/list.html", books = books, user_books = user_books, co_reads=co_reads, next_cursor=next_cursor, size=size)
     except Exception as E:
         print(f"Error: {E} occurred in func load_book_list!")
-        return render_template("book/list.html", books = books)
+        return render_template("book/list.html", books = books, user_books = set(), co_reads=co_reads, next_cursor=next_cursor, size=size)
+
+@app.route("/books/<int:book_id>/similar")
+@conditional_get("catalog_version", "neighbors_version")
+def similar_books(book_id):
+    book = db.get_or_404(Book, book_id)
+    # Precomputed by flask refresh-similar: a primary key range scan, no vector search per request
+    neighbors = BookNeighbor.neighbors_of(book_id)
+
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({
+            "book_id": book.id,
+            "similar": [{
+                "id": neighbor.id,
+                "name": neighbor.name,
+                "author": neighbor.author,
+                "category": neighbor.category,
+                "publication_year": neighbor.publication_year,
+                "score": round(score, 4),
+            } for neighbor, score in neighbors],
+        })
+    return render_template("book/similar.html", book=book, neighbors=neighbors)
+
+@app.route("/books/search")
+def search_books():
+    query = request.args.get("q", "").strip()
+    page = max(1, request.args.get("page", 1, type=int))
+    size = get_page_size()
+    results, has_next = Book.search(query, page=page, size=size) if query else ([], False)
+
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify({
+            "query": query,
+            "page": page,
+            "has_next": has_next,
+            "results": results,
+        })
+    return render_template("book/search.html", query=query, results=results, page=page, size=size, has_next=has_next)
 
 @app.route("/login", methods=["POST", "GET"])
 def login():
@@ -272,7 +516,7 @@ def login():
             #         print("Password is incorrect")
             #         return "Password is incorrect"
 
-            user = User.query.filter((User.username == username_or_email) | (User.email == username_or_email)).first()
+            user = User.query.filter((User.username == username_or_email) | (User.email == username_or_email), User.deleting == db.false()).first()
 
             if user is None:
                 flash("Login informations are incorrect", "danger")
@@ -370,62 +614,111 @@ def page_not_found(error):
 
 #     return render_template("user/create.html")
 
-with app.app_context():
-    user_infors = [{"name": "user1", "email": "email1@gmail.com", "username": "username1", "password": "password1"},
-                {"name": "user2", "email": "email2@gmail.com", "username": "username2", "password": "password2"},
-                {"name": "user3", "email": "email3@gmail.com", "username": "username3", "password": "password3"},
-                {"name": "user4", "email": "email4@gmail.com", "username": "username4", "password": "password4"},
-                {"name": "user5", "email": "email5@gmail.com", "username": "username5", "password": "password5"},
-                ]
-    
-    # book_infors = [{"name": "book1", "author": "author1", "category": "category1", "describe": "describe1", "publication_date": "10.11.2025"},
-    #             {"name": "book2", "author": "author2", "category": "category2", "describe": "describe2", "publication_date": "11.11.2025"},
-    #             {"name": "book3", "author": "author3", "category": "category3", "describe": "describe3", "publication_date": "12.11.2025"},
-    #             {"name": "book4", "author": "author4", "category": "category4", "describe": "describe4", "publication_date": "13.11.2025"},
-    #             {"name": "book5", "author": "author5", "category": "category5", "describe": "describe5", "publication_date": "14.11.2025"},
-    #             ]
-    book_infors = book_data_list
-
-    try:
-        db.drop_all()
-
-        db.create_all()
-
-        for user_inf in user_infors:
-            db.session.add(User(**user_inf))
-            db.session.flush()
-
-        for book_inf in book_infors:
-            db.session.add(Book(**book_inf))
-            db.session.flush()
-        
-        # AttributeError: 'Select' object has no attribute 'name'
-        # user1 = select(User).where(User.id == 1)
-
-        # .filter(expression) # filter by condition
-        # .filter_by(assignment) # filter by condition
-        # .order_by() # arrange by column
-
-        user1 = db.session.execute(db.select(User).filter_by(id = 1)).scalar()
-        user1 = db.session.execute(db.select(User).filter(User.id == 1)).scalar()
-        user2 = db.session.execute(db.select(User).filter(User.id == 2)).scalar()
-        user3 = db.session.execute(db.select(User).filter(User.id == 3)).scalar()
-        books = db.session.execute(db.select(Book).order_by(Book.name)).scalars().all()
-
-        db.session.add(UserBook(user=user1, book=books[1], reading_status = "completed"))
-        db.session.add(UserBook(user=user1, book=books[2]))
-
-        db.session.add(UserBook(user=user2, book=books[1]))
-        db.session.add(UserBook(user=user2, book=books[3], reading_status = "reading"))
+def echo_chunk_report(stats):
+    # rows_per_second is None when the chunk took no measurable time
+    rate = "-" if stats["rows_per_second"] is None else f"{stats['rows_per_second']:.0f}"
+    click.echo(
+        f"chunk {stats['chunk']}: {stats['rows']} rows, {stats['written']} written, "
+        f"{stats['rejected']} rejected, {rate} rows/s"
+    )
 
-        db.session.add(UserBook(user=user3, book=books[1]))
-        db.session.add(UserBook(user=user3, book=books[2]))
-        db.session.add(UserBook(user=user3, book=books[3]))
+def echo_import_totals(totals, path):
+    click.echo(
+        f"{totals['written']} books inserted or changed from {path}, {totals['rejected']} rejected "
+        f"of {totals['rows']} rows in {totals['seconds']:.1f} s"
+    )
 
-        db.session.commit()
+@app.cli.command("seed-catalog")
+@click.option("--path", default=str(CATALOG_PATH), show_default=True, help="Catalog JSON, JSONL or CSV file")
+@click.option("--chunk-size", default=5000, show_default=True, help="Rows validated and committed at once")
+@click.option("--force", is_flag=True, help="Reload even if the file checksum did not change")
+@click.option("--demo-users", is_flag=True, help="Also create the demo accounts and their archives")
+def seed_catalog_command(path, chunk_size, force, demo_users):
+    """Create missing tables and upsert the book catalog (never drops data)."""
+    totals = seed_catalog(path, chunk_size=chunk_size, force=force)
+    if totals is None:
+        click.echo(f"{path} is unchanged since the last load, skipped (use --force to reload)")
+    else:
+        echo_import_totals(totals, path)
+    if demo_users:
+        click.echo(f"{seed_demo_users()} demo users created")
+
+@app.cli.command("build-assets")
+def build_assets_command():
+    """Write hashed copies of static/css and static/imgs with .gz/.br variants to static/dist."""
+    manifest = build_assets(app.static_folder)
+    assets.load_manifest()
+    click.echo(f"{len(manifest)} assets written to {os.path.join(app.static_folder, 'dist')}")
+
+@app.cli.command("purge-user")
+@click.argument("user_id", type=int)
+@click.option("--chunk-size", default=1000, show_default=True, help="Archive rows deleted per transaction")
+@click.option("--pause", default=0.05, show_default=True, help="Seconds between chunks")
+def purge_user_command(user_id, chunk_size, pause):
+    """Delete a user with a very large archive in short transactions."""
+    deleted = purge_user(user_id, chunk_size=chunk_size, pause=pause)
+    click.echo(f"user {user_id} deleted with {deleted} archive rows")
+
+@app.cli.command("purge-pending-users")
+@click.option("--chunk-size", default=1000, show_default=True, help="Archive rows deleted per transaction")
+@click.option("--pause", default=0.05, show_default=True, help="Seconds between chunks")
+def purge_pending_users_command(chunk_size, pause):
+    """Finish the purges that were interrupted (e.g. by a restart) in the foreground."""
+    user_ids = pending_purges()
+    for user_id in user_ids:
+        deleted = purge_user(user_id, chunk_size=chunk_size, pause=pause)
+        click.echo(f"user {user_id} deleted with {deleted} archive rows")
+    click.echo(f"{len(user_ids)} pending purges finished")
+
+@app.cli.command("reembed-rag")
+@click.option("--source", default=RAG_SOURCE_COLLECTION, show_default=True, help="Collection the documents are copied from")
+@click.option("--backend", default=None, help="Embedding backend of the target collection (EMBEDDING_BACKEND by default)")
+@click.option("--full", is_flag=True, help="Re-embed every document, not only the missing ones")
+@click.option("--batch-size", default=256, show_default=True, help="Documents embedded per call")
+def reembed_rag_command(source, backend, full, batch_size):
+    """Fill the RAG collection of an embedding backend (e.g. local-hash) from the documents of another collection."""
+    added, deleted = reembed_collection(source, backend=backend, full=full, batch_size=batch_size)
+    click.echo(f"{added} documents embedded, {deleted} removed")
+
+@app.cli.command("refresh-similar")
+@click.option("--k", "k", default=BOOK_NEIGHBORS_K, show_default=True, help="Similar books stored per book")
+@click.option("--full", is_flag=True, help="Recompute the neighbors of every book, not only the affected ones")
+@click.option("--batch-size", default=1024, show_default=True, help="Books scored per matrix product")
+def refresh_similar_command(k, full, batch_size):
+    """Embed new and changed books into their Chroma collection and update book_neighbors."""
+    stats = refresh_book_neighbors(k=k, full=full, batch_size=batch_size)
+    click.echo(
+        f"{stats['books']} books: {stats['embedded']} embedded, {stats['deleted']} removed in {stats['embed_seconds']:.1f} s; "
+        f"neighbors of {stats['recomputed']} recomputed in {stats['neighbor_seconds']:.1f} s"
+    )
 
-    except sa.exc.IntegrityError as IE:
-        print(f"Error occurred!: {IE}")
+@app.cli.command("rebuild-co-reads")
+@click.option("--k", "k", default=CO_READS_K, show_default=True, help="Books kept in the list of each book")
+def rebuild_co_reads_command(k):
+    """Recompute the "readers also read" counts and lists from all archives (they are kept up to date incrementally)."""
+    pairs, books = BookCoRead.rebuild(k=k)
+    click.echo(f"{pairs} co-read pairs, lists for {books} books")
+
+@app.cli.command("apply-co-reads")
+@click.option("--pause", default=0.0, show_default=True, help="Seconds between transactions")
+def apply_co_reads_command(pause):
+    """Count the queued archive changes into the "readers also read" lists (done in the background after each change)."""
+    users = apply_pending_co_reads(pause=pause)
+    click.echo(f"co-reads of {users} archives updated")
+
+@app.cli.command("import-catalog")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(FORMATS), help="File format, taken from the suffix by default")
+@click.option("--chunk-size", default=5000, show_default=True, help="Rows validated and committed at once")
+@click.option("--rejects", type=click.File("w", encoding="utf-8"), help="Write rejected rows with the reason as JSONL")
+def import_catalog_command(path, fmt, chunk_size, rejects):
+    """Stream a large catalog file into books chunk by chunk, reporting throughput and rejected rows."""
+    db.create_all()
+    try:
+        totals = import_catalog(path, fmt=fmt, chunk_size=chunk_size, report=echo_chunk_report, rejects=rejects)
+    except CatalogFormatError as E:
+        raise click.ClickException(f"{path}: {E}")
+    echo_import_totals(totals, path)
 
 # if __name__ == "__main__":
 #     app.run("0.0.0.0", 5555)
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""
+End-to-end latency of ReActAgent.ask() with and without speculative tool prefetch.
+
+The model is scripted (no API calls): each completion sleeps --llm-latency-ms, the first step asks for
+rag_query_tool on the question (reworded for --rewrite share of the questions, which then misses
+the prefetch), the second one gives the final answer. Tools sleep --tool-latency-ms.
+Without prefetch the tool starts after the first model call; with prefetch it runs alongside it.
+
+    cd app
+    python -m benchmarks.bench_agent_prefetch [--questions 20] [--llm-latency-ms 800] [--tool-latency-ms 600] [--rewrite 0.2]
+"""
+import argparse
+import json
+import random
+import re
+import time
+from typing import Any
+import numpy as np
+from langchain_core.language_models.llms import LLM
+from langchain_core.tools import tool
+from agents.prefetch import prefetch_stats
+from agents.react_agent import ReActAgent
+from benchmarks.bench_embeddings import DEFAULT_QUERIES, percentile
+
+
+class ScriptedLLM(LLM):
+    """Answers in the ReAct format after a fixed delay: one rag_query_tool call, then the final answer"""
+
+    latency_ms: float = 800.0
+    rewrite: float = 0.0
+    rng: Any = None
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency_ms / 1000)
+        question, scratchpad = re.findall(r"Question: (.*?); Thought:(.*)", prompt, re.S)[-1]
+        if "Observation:" in scratchpad:
+            return "Thought: Теперь у меня есть окончательный ответ\nFinal Answer: ответ по найденным статьям"
+        if self.rng.random() < self.rewrite:
+            question = f"научные статьи: {question} обзор методов"
+        return ("Thought: Нужно найти статьи в базе знаний\nAction: rag_query_tool\n"
+                f"Action Input: {json.dumps({'query': question}, ensure_ascii=False)}")
+
+
+def make_tools(latency_ms):
+    @tool
+    def rag_query_tool(query: str) -> str:
+        """Поиск по базе знаний"""
+        time.sleep(latency_ms / 1000)
+        return f"статьи по запросу: {query}"
+
+    @tool
+    def search_web_tool(query: str) -> str:
+        """Поиск в интернете"""
+        time.sleep(latency_ms / 1000)
+        return f"результаты поиска: {query}"
+
+    return [search_web_tool, rag_query_tool]
+
+
+def run(agent, questions):
+    latencies = []
+    for question in questions:
+        started = time.perf_counter()
+        agent.ask(question)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--tool-latency-ms", type=float, default=600.0)
+    parser.add_argument("--rewrite", type=float, default=0.2, help="share of questions the model rewords before searching")
+    args = parser.parse_args()
+
+    questions = [DEFAULT_QUERIES[i % len(DEFAULT_QUERIES)] for i in range(args.questions)]
+    tools = make_tools(args.tool_latency_ms)
+    print(f"{len(questions)} questions, model {args.llm_latency_ms} ms per call, tool {args.tool_latency_ms} ms, "
+          f"{args.rewrite:.0%} reworded by the model")
+    print(f"{'':12} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9}")
+    results = {}
+    for name, prefetch in (("sequential", ()), ("prefetch", ("rag_query_tool",))):
+        llm = ScriptedLLM(latency_ms=args.llm_latency_ms, rewrite=args.rewrite, rng=random.Random(0))
+        agent = ReActAgent(llm=llm, tools=tools, prefetch_tools=prefetch)
+        results[name] = latencies = run(agent, questions)
+        print(f"{name:12} {percentile(latencies, 0.5):9.1f} {percentile(latencies, 0.95):9.1f} {float(np.mean(latencies)):9.1f}")
+    reduction = 1 - np.mean(results["prefetch"]) / np.mean(results["sequential"])
+    print(f"\nmean latency reduced by {reduction:.1%}; prefetch: {prefetch_stats.stats()}")
+
+
+if __name__ == "__main__":
+    main()
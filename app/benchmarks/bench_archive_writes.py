@@ -0,0 +1,116 @@
+"""
+Archive writes per second: the old ORM path (SELECT duplicate + Book.query.get + INSERT, then
+SELECT + change + UPDATE for the status) vs. the single-statement User methods.
+Both run with the app's versioning hooks, so each write also bumps the user's archive version and
+queues the archive for the co-read counts. Counting the queued changes (what the background run
+of db.co_reads does after the requests) is timed separately, in archive rows counted per second.
+
+Runs against a throw-away SQLite database, the app database is not touched:
+
+    cd app
+    python -m benchmarks.bench_archive_writes [--users 50] [--books 200]
+"""
+import argparse
+import os
+import tempfile
+import time
+from flask import Flask, flash
+from db.base import db
+from db.co_reads import apply_pending, pending_co_reads
+from db.versioning import deferred_bumps, init_versioning
+from models.book import Book
+from models.user import User
+from models.userbook import UserBook, READING_STATUS_CYCLE
+
+
+def legacy_add(user, book_id):
+    if UserBook.query.filter((UserBook.user_id == user.id), (UserBook.book_id == book_id)).first() is not None:
+        flash("This book is already in your archive!", "warning")
+        return
+    if Book.query.get(book_id) is None:
+        raise ValueError("Book id is not invalid")
+    db.session.add(UserBook(user_id=user.id, book_id=book_id))
+    db.session.commit()
+
+
+def legacy_status(user, book_id):
+    user_book = UserBook.query.filter_by(user_id=user.id, book_id=book_id).first()
+    user_book.reading_status = READING_STATUS_CYCLE[user_book.reading_status]
+    db.session.commit()
+
+
+def legacy_remove(user, book_id):
+    user_book = UserBook.query.filter((UserBook.user_id == user.id), (UserBook.book_id == book_id)).first()
+    db.session.delete(user_book)
+    db.session.commit()
+
+
+def fixture(users, books):
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    db.session.add_all(
+        Book(name=f"Book {i}", author="Author", category="Category", describe=f"Describe {i}", publication_year=2000)
+        for i in range(books)
+    )
+    db.session.add_all(
+        User(name="user", email=f"user{i}@example.com", username=f"username{i}", password="password1")
+        for i in range(users)
+    )
+    db.session.commit()
+    return db.session.execute(db.select(User)).scalars().all(), db.session.execute(db.select(Book.id)).scalars().all()
+
+
+def measure(users, book_ids, operation):
+    started = time.perf_counter()
+    writes = 0
+    for user in users:
+        for book_id in book_ids:
+            operation(user, book_id)
+            writes += 1
+    return writes / (time.perf_counter() - started)
+
+
+def measure_co_reads(changes):
+    started = time.perf_counter()
+    apply_pending()
+    return changes / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--books", type=int, default=200)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.secret_key = "bench"
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{path}"
+    db.init_app(app)
+    init_versioning()
+    # The co-read counts are applied (and timed) between the phases, not by the background timer
+    pending_co_reads.delay = -1
+
+    scenarios = {
+        "legacy ORM": (legacy_add, legacy_status, legacy_remove),
+        "single statement": (User.add_to_archive, User.update_reading_status, User.remove_from_archive),
+    }
+    # add_to_archive flashes on duplicates, so a request context is needed
+    with app.test_request_context():
+        columns = ("add/s", "re-add/s", "status/s", "remove/s", "co-read add/s", "co-read rm/s")
+        print(f"{'':18} " + " ".join(f"{column:>13}" for column in columns))
+        for name, (add, status, remove) in scenarios.items():
+            users, book_ids = fixture(args.users, args.books)
+            changes = len(users) * len(book_ids)
+            row = [measure(users, book_ids, add), measure(users, book_ids, add)]
+            co_read_add = measure_co_reads(changes)
+            row += [measure(users, book_ids, status), measure(users, book_ids, remove), co_read_add, measure_co_reads(changes)]
+            print(f"{name:18} " + " ".join(f"{value:13.0f}" for value in row))
+            # The deferred counter bumps of this scenario, before fixture() drops the tables
+            deferred_bumps.flush_now()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Concurrent read/write load against SQLite with the default settings vs. the tuned pragmas of core/config.py.
+
+Reader threads page through the catalog and count archives, writer threads add books to archives and
+cycle reading statuses, each operation in its own transaction, for a fixed time per mode.
+A throw-away database is used, the app database is not touched:
+
+    cd app
+    python -m benchmarks.bench_db_concurrency [--readers 8] [--writers 4] [--seconds 10]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from core.config import sqlite_pragmas
+from db.base import db
+from db.session import sqlite_pragma_listener
+import models  # noqa: F401 (registers the tables on db.metadata)
+
+MODES = {
+    # pysqlite defaults: rollback journal, synchronous=FULL, 5 s lock timeout
+    "default": ({"foreign_keys": "ON"}, {"timeout": 5}),
+    "tuned": (sqlite_pragmas(), {"timeout": sqlite_pragmas()["busy_timeout"] / 1000}),
+}
+
+
+def make_engine(path, pragmas, connect_args):
+    engine = sa.create_engine(f"sqlite:///{path}", connect_args=connect_args)
+    event.listen(engine, "connect", sqlite_pragma_listener(pragmas))
+    return engine
+
+
+def fixture(engine, users, books):
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(db.metadata.tables["books"].insert(), [
+            {"name": f"Book {i}", "author": "Author", "category": "Category", "describe": f"Describe {i}", "publication_year": 2000}
+            for i in range(books)
+        ])
+        connection.execute(db.metadata.tables["users"].insert(), [
+            {"name": "user", "email": f"user{i}@example.com", "username": f"username{i}", "password": "password1"}
+            for i in range(users)
+        ])
+
+
+def reader(engine, stop, stats, users):
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            with engine.connect() as connection:
+                connection.exec_driver_sql("SELECT id, name FROM books ORDER BY name, id LIMIT 20 OFFSET ?", (random.randrange(0, 500),)).all()
+                connection.exec_driver_sql("SELECT count(*) FROM user_books WHERE user_id = ?", (random.randint(1, users),)).scalar()
+            stats["read"].append(time.perf_counter() - started)
+        except OperationalError:
+            stats["errors"].append("read")
+
+
+def writer(engine, stop, stats, users, books):
+    while not stop.is_set():
+        user_id, book_id = random.randint(1, users), random.randint(1, books)
+        started = time.perf_counter()
+        try:
+            with engine.begin() as connection:
+                connection.exec_driver_sql(
+                    "INSERT INTO user_books (user_id, book_id, reading_status, rating) VALUES (?, ?, 'unread', 0) "
+                    "ON CONFLICT (user_id, book_id) DO UPDATE SET reading_status = CASE reading_status "
+                    "WHEN 'unread' THEN 'reading' WHEN 'reading' THEN 'completed' ELSE 'unread' END",
+                    (user_id, book_id),
+                )
+            stats["write"].append(time.perf_counter() - started)
+        except OperationalError:
+            stats["errors"].append("write")
+
+
+def run(mode, args):
+    pragmas, connect_args = MODES[mode]
+    path = os.path.join(tempfile.mkdtemp(), f"{mode}.db")
+    engine = make_engine(path, pragmas, connect_args)
+    fixture(engine, args.users, args.books)
+
+    stop = threading.Event()
+    stats = {"read": [], "write": [], "errors": []}
+    threads = [threading.Thread(target=reader, args=(engine, stop, stats, args.users)) for _ in range(args.readers)]
+    threads += [threading.Thread(target=writer, args=(engine, stop, stats, args.users, args.books)) for _ in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    def p95(samples):
+        return statistics.quantiles(samples, n=20)[-1] * 1000 if len(samples) > 1 else float("nan")
+
+    return {
+        "reads/s": len(stats["read"]) / args.seconds,
+        "writes/s": len(stats["write"]) / args.seconds,
+        "read p95 ms": p95(stats["read"]),
+        "write p95 ms": p95(stats["write"]),
+        "locked errors": len(stats["errors"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--books", type=int, default=2000)
+    args = parser.parse_args()
+
+    results = {mode: run(mode, args) for mode in MODES}
+    columns = list(next(iter(results.values())))
+    print(f"{'':8} " + " ".join(f"{column:>14}" for column in columns))
+    for mode, row in results.items():
+        print(f"{mode:8} " + " ".join(f"{row[column]:14.1f}" for column in columns))
+
+
+if __name__ == "__main__":
+    main()
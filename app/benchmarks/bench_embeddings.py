@@ -0,0 +1,98 @@
+"""
+Query latency and retrieval overlap: remote (BAAI/bge-m3 API) vs local-hash embedding backend.
+
+The local collection is built in memory from the documents of the remote collection,
+then every query of a fixed set is run through both, and the top-k ids are compared.
+
+    cd app
+    python -m benchmarks.bench_embeddings [--queries queries.txt] [-k 5]
+"""
+import argparse
+import statistics
+import time
+from langchain_chroma import Chroma
+from tools.embeddings import get_embeddings, EMBEDDING_BACKEND_KEY
+from tools.rag_query import get_client, open_vectorstore
+from tools.retrieval_cache import bump_collection_version
+
+DEFAULT_QUERIES = [
+    "машинное обучение и нейронные сети",
+    "глубокое обучение для обработки изображений",
+    "трансформеры в обработке естественного языка",
+    "обучение с подкреплением",
+    "графовые нейронные сети",
+    "large language models evaluation",
+    "diffusion models for image generation",
+    "federated learning privacy",
+]
+
+
+def copy_collection(source, target, batch_size=256):
+    """Re-embed every document of source into target with the target's embedding backend"""
+    data = source._collection.get(include=["documents", "metadatas"])
+    for start in range(0, len(data["ids"]), batch_size):
+        target.add_texts(
+            texts=data["documents"][start:start + batch_size],
+            metadatas=data["metadatas"][start:start + batch_size],
+            ids=data["ids"][start:start + batch_size],
+        )
+    bump_collection_version(target._collection)
+    return len(data["ids"])
+
+
+def timed_search(store, query, k):
+    started = time.perf_counter()
+    docs = store.similarity_search(query, k=k)
+    return (time.perf_counter() - started) * 1000, [doc.id for doc in docs]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", help="file with one query per line")
+    parser.add_argument("--collection", default="arxiv_papers", help="remote collection to compare against")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per query, the median is reported")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    # No persistent cache on the remote side: the point is to measure the network round-trip
+    remote = open_vectorstore(args.collection, get_embeddings("remote", client=get_client(), cache=None), "remote")
+    local = Chroma(
+        collection_name=f"{args.collection}__bench_local",
+        embedding_function=get_embeddings("local-hash"),
+        collection_metadata={EMBEDDING_BACKEND_KEY: "local-hash"},
+    )
+    started = time.perf_counter()
+    count = copy_collection(remote, local)
+    print(f"local index: {count} documents in {time.perf_counter() - started:.2f} s")
+
+    remote_ms, local_ms, overlaps = [], [], []
+    print(f"{'query':50} {'remote ms':>10} {'local ms':>10} {'overlap@' + str(args.k):>11}")
+    for query in queries:
+        remote_runs = [timed_search(remote, query, args.k) for _ in range(args.repeat)]
+        local_runs = [timed_search(local, query, args.k) for _ in range(args.repeat)]
+        r_ms = statistics.median(ms for ms, _ in remote_runs)
+        l_ms = statistics.median(ms for ms, _ in local_runs)
+        overlap = len(set(remote_runs[0][1]) & set(local_runs[0][1])) / args.k
+        remote_ms.append(r_ms)
+        local_ms.append(l_ms)
+        overlaps.append(overlap)
+        print(f"{query[:50]:50} {r_ms:10.1f} {l_ms:10.1f} {overlap:11.2f}")
+
+    print()
+    print(f"remote: p50 {percentile(remote_ms, 0.5):.1f} ms, p95 {percentile(remote_ms, 0.95):.1f} ms")
+    print(f"local:  p50 {percentile(local_ms, 0.5):.1f} ms, p95 {percentile(local_ms, 0.95):.1f} ms")
+    print(f"mean overlap@{args.k}: {statistics.mean(overlaps):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Hybrid (BM25 fast path + reciprocal rank fusion) vs vector-only retrieval: embedding calls per query,
+share of queries answered lexically, p50/p95 latency and hit@k of the labeled document.
+
+Queries are a mix of exact title lookups (labeled with their document) and topical questions.
+The corpus is copied from the arxiv_papers collection into an in-memory collection embedded with
+--backend (local-hash by default, so no network), or generated with --synthetic N. --embed-latency-ms
+adds the round-trip of a remote embedding API to every embedding call.
+
+    cd app
+    python -m benchmarks.bench_hybrid [--collection arxiv_papers] [--backend local-hash] [-k 5] [--titles 200]
+    python -m benchmarks.bench_hybrid --synthetic 5000 --embed-latency-ms 150
+"""
+import argparse
+import random
+import time
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from benchmarks.bench_embeddings import DEFAULT_QUERIES, percentile
+from tools.bm25 import BM25Index
+from tools.embeddings import get_embeddings
+from tools.hybrid_retriever import HybridRetriever, LEXICAL_FETCH_K, LEXICAL_MARGIN, LEXICAL_MIN_COVERAGE, is_confident, sync_index
+from tools.retrieval_cache import bump_collection_version
+
+
+class CountingEmbeddings(Embeddings):
+    """Counts query embeddings and optionally sleeps like a remote API call"""
+
+    def __init__(self, embeddings, latency_ms=0.0):
+        self.embeddings = embeddings
+        self.latency_ms = latency_ms
+        self.queries = 0
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        self.queries += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self.embeddings.embed_query(text)
+
+
+def synthetic_corpus(size, seed=0):
+    rng = random.Random(seed)
+    syllables = ["ka", "lo", "mi", "ne", "ru", "ta", "vo", "zi", "pe", "sa", "do", "gu"]
+    vocabulary = list({"".join(rng.choices(syllables, k=rng.randint(2, 4))) for _ in range(6000)})
+    topics = [rng.sample(vocabulary, 300) for _ in range(40)]
+    ids, texts, titles = [], [], []
+    for i in range(size):
+        topic = topics[i % len(topics)]
+        title = " ".join(rng.sample(vocabulary, 6))
+        ids.append(f"doc-{i}")
+        titles.append(title)
+        texts.append(f"{title}\n" + " ".join(rng.choices(topic, k=80)))
+    return ids, texts, [{} for _ in ids], titles
+
+
+def collection_corpus(args):
+    import chromadb
+    data = chromadb.PersistentClient(path=args.persist_directory).get_collection(args.collection).get(include=["documents", "metadatas"])
+    if not data["ids"]:
+        raise SystemExit(f"collection '{args.collection}' is empty, use --synthetic N to benchmark without it")
+    metadatas = [metadata or {} for metadata in data["metadatas"]]
+    titles = [metadata.get("title") or " ".join(text.split()[:12]) for text, metadata in zip(data["documents"], metadatas)]
+    return data["ids"], data["documents"], metadatas, titles
+
+
+def run(retriever, queries, k):
+    latencies, hits = [], []
+    for query, relevant in queries:
+        started = time.perf_counter()
+        docs = retriever.invoke(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if relevant is not None:
+            hits.append(relevant in [doc.id for doc in docs[:k]])
+    return latencies, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", default="arxiv_papers")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--backend", default="local-hash", help="embedding backend of the benchmark collection")
+    parser.add_argument("--synthetic", type=int, default=0, help="generate N documents instead of copying the collection")
+    parser.add_argument("--titles", type=int, default=200, help="title lookup queries")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="simulated latency of every embedding call")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    from langchain_chroma import Chroma
+    import chromadb
+    ids, texts, metadatas, titles = synthetic_corpus(args.synthetic) if args.synthetic else collection_corpus(args)
+    embeddings = CountingEmbeddings(get_embeddings(args.backend), args.embed_latency_ms)
+    store = Chroma(client=chromadb.EphemeralClient(), collection_name="bench_hybrid", embedding_function=embeddings)
+    started = time.perf_counter()
+    for start in range(0, len(ids), 1000):
+        store.add_texts(texts[start:start + 1000], metadatas=[m or None for m in metadatas[start:start + 1000]], ids=ids[start:start + 1000])
+    bump_collection_version(store._collection)
+    print(f"{len(ids)} documents embedded in {time.perf_counter() - started:.1f} s")
+
+    rng = random.Random(1)
+    picked = rng.sample(range(len(ids)), min(args.titles, len(ids)))
+    queries = [(titles[i], ids[i]) for i in picked] + [(query, None) for query in DEFAULT_QUERIES]
+    rng.shuffle(queries)
+
+    index = BM25Index()
+    started = time.perf_counter()
+    vector = store.as_retriever(search_type="similarity", search_kwargs={"k": args.k})
+    hybrid = HybridRetriever(vectorstore=store, vector_retriever=vector, index=index, k=args.k)
+    sync_index(index, store._collection, wait=True)  # requests would build it in the background
+    print(f"BM25 index of {len(index)} documents built in {time.perf_counter() - started:.2f} s "
+          f"(confident: coverage >= {LEXICAL_MIN_COVERAGE}, margin >= {LEXICAL_MARGIN})")
+
+    fast = sum(is_confident(index.search(query, k=max(args.k, LEXICAL_FETCH_K))) for query, _ in queries)
+    print(f"\n{len(queries)} queries ({len(picked)} title lookups), k={args.k}, embedding latency {args.embed_latency_ms} ms")
+    print(f"{'':8} {'embed calls':>12} {'p50 ms':>9} {'p95 ms':>9} {'mean ms':>9} {'title hit@k':>12}")
+    for name, retriever in (("vector", vector), ("hybrid", hybrid)):
+        embeddings.queries = 0
+        latencies, hits = run(retriever, queries, args.k)
+        print(f"{name:8} {embeddings.queries:12d} {percentile(latencies, 0.5):9.3f} {percentile(latencies, 0.95):9.3f} "
+              f"{float(np.mean(latencies)):9.3f} {float(np.mean(hits)) if hits else float('nan'):12.3f}")
+    print(f"\nlexical fast path: {fast} of {len(queries)} queries ({fast / len(queries):.1%}), no embedding call for them")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+Retrieval quality and speed of the Chroma index: p50/p95 latency, QPS and recall@k against exact
+brute-force search, for a grid of HNSW parameters and for the retriever settings of tools/rag_query.py.
+
+The corpus is the arxiv_papers collection (its stored vectors are reused, nothing is re-embedded for the
+remote backend) or a synthetic one; queries are embedded once up front, through the embedding cache for the
+remote backend or with the local-hash backend, so the run is offline once the queries are cached.
+
+    cd app
+    python -m benchmarks.bench_retrieval [--collection arxiv_papers] [--backend remote|local-hash]
+        [--queries queries.jsonl] [-k 5] [--ef-construction 100,200] [--m 16,32] [--ef-search 10,50,100]
+    python -m benchmarks.bench_retrieval --synthetic 20000          # no collection, no network
+
+Query file: one query per line, or JSON lines {"query": "...", "relevant": ["doc id", ...]};
+with labels the recall of the labeled documents is reported too.
+"""
+import argparse
+import itertools
+import json
+import time
+import numpy as np
+from benchmarks.bench_embeddings import DEFAULT_QUERIES, percentile
+from langchain_core.embeddings import Embeddings
+from tools.embeddings import get_embeddings, get_embedding_cache
+from tools.rag_query import RETRIEVER_SETTINGS, get_client
+from tools.retrieval_cache import bump_collection_version
+
+
+class PrecomputedEmbeddings(Embeddings):
+    """Embeddings for the retriever runs: returns the vectors computed before timing starts"""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+    def embed_documents(self, texts):
+        return [self.vectors[text] for text in texts]
+
+
+def load_queries(path):
+    if path is None:
+        return [{"query": query, "relevant": []} for query in DEFAULT_QUERIES]
+    queries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line) if line.startswith("{") else {"query": line}
+            queries.append({"query": item["query"], "relevant": item.get("relevant", [])})
+    return queries
+
+
+def load_corpus(args):
+    """(ids, unit vectors, documents, metadatas, queries, unit query vectors)"""
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(64, args.dim))
+        vectors = centers[rng.integers(0, 64, args.synthetic)] + rng.normal(scale=0.6, size=(args.synthetic, args.dim))
+        ids = [f"doc-{i}" for i in range(args.synthetic)]
+        # Queries are noisy copies of documents, labeled with the document they come from
+        picked = rng.choice(args.synthetic, size=args.synthetic_queries, replace=False)
+        query_vectors = vectors[picked] + rng.normal(scale=0.3, size=(len(picked), args.dim))
+        queries = [{"query": f"query-{i}", "relevant": [ids[i]]} for i in picked]
+        documents = list(ids)
+        metadatas = [None] * len(ids)
+    else:
+        import chromadb
+        collection = chromadb.PersistentClient(path=args.persist_directory).get_collection(args.collection)
+        data = collection.get(include=["embeddings", "documents", "metadatas"])
+        if not data["ids"]:
+            raise SystemExit(f"collection '{args.collection}' is empty, use --synthetic N to benchmark without it")
+        ids, documents, metadatas = data["ids"], data["documents"], data["metadatas"]
+        queries = load_queries(args.queries)
+        if args.backend == "remote":
+            embeddings = get_embeddings("remote", client=get_client(), cache=get_embedding_cache())
+            vectors = np.asarray(data["embeddings"], dtype=np.float32)
+        else:
+            embeddings = get_embeddings(args.backend)
+            vectors = np.asarray(embeddings.embed_documents(documents), dtype=np.float32)
+        query_vectors = np.asarray(embeddings.embed_documents([query["query"] for query in queries]), dtype=np.float32)
+
+    def unit(matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+    return ids, unit(vectors), documents, metadatas, queries, unit(query_vectors)
+
+
+def exact_top_k(vectors, query_vectors, k):
+    """Ground truth: indexes of the k nearest documents by cosine similarity, best first"""
+    scores = query_vectors @ vectors.T
+    top = np.argpartition(-scores, kth=min(k, scores.shape[1] - 1), axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def recall(found, expected):
+    expected = set(expected)
+    return len(expected & set(found)) / len(expected) if expected else None
+
+
+def build_index(client, name, ids, vectors, documents, metadatas, ef_construction, m):
+    collection = client.create_collection(
+        name, configuration={"hnsw": {"space": "cosine", "ef_construction": ef_construction, "max_neighbors": m}}
+    )
+    started = time.perf_counter()
+    for start in range(0, len(ids), 5000):
+        collection.add(
+            ids=ids[start:start + 5000],
+            embeddings=vectors[start:start + 5000],
+            documents=documents[start:start + 5000],
+            metadatas=None if metadatas[0] is None else metadatas[start:start + 5000],
+        )
+    bump_collection_version(collection)
+    return collection, time.perf_counter() - started
+
+
+def summarize(latencies, recalls, label_recalls, total_seconds):
+    label_recalls = [value for value in label_recalls if value is not None]
+    return {
+        "p50 ms": percentile(latencies, 0.5),
+        "p95 ms": percentile(latencies, 0.95),
+        "QPS": len(latencies) / total_seconds,
+        "recall@k": float(np.mean(recalls)),
+        "label recall": float(np.mean(label_recalls)) if label_recalls else float("nan"),
+    }
+
+
+def run_index(collection, ids, queries, query_vectors, truth, k, repeat):
+    latencies, recalls, label_recalls = [], [], []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for query, vector, expected in zip(queries, query_vectors, truth):
+            query_started = time.perf_counter()
+            found = collection.query(query_embeddings=[vector], n_results=k, include=[])["ids"][0]
+            latencies.append((time.perf_counter() - query_started) * 1000)
+            recalls.append(recall(found, [ids[i] for i in expected]))
+            label_recalls.append(recall(found, query["relevant"]))
+    return summarize(latencies, recalls, label_recalls, time.perf_counter() - started)
+
+
+def run_retrievers(client, collection_name, ids, queries, query_vectors, truth, settings, repeat):
+    from langchain_chroma import Chroma
+    store = Chroma(
+        client=client,
+        collection_name=collection_name,
+        embedding_function=PrecomputedEmbeddings({query["query"]: vector.tolist() for query, vector in zip(queries, query_vectors)}),
+    )
+    results = {}
+    for search_type, search_kwargs in settings.items():
+        retriever = store.as_retriever(search_type=search_type, search_kwargs=search_kwargs)
+        latencies, recalls, label_recalls, returned = [], [], [], []
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for query, expected in zip(queries, truth):
+                query_started = time.perf_counter()
+                docs = retriever.invoke(query["query"])
+                latencies.append((time.perf_counter() - query_started) * 1000)
+                found = [doc.id for doc in docs]
+                returned.append(len(found))
+                recalls.append(recall(found, [ids[i] for i in expected[:search_kwargs.get("k", 4)]]))
+                label_recalls.append(recall(found, query["relevant"]))
+        results[f"{search_type} {json.dumps(search_kwargs)}"] = {
+            **summarize(latencies, recalls, label_recalls, time.perf_counter() - started),
+            "docs": float(np.mean(returned)),
+        }
+    return results
+
+
+def print_table(title, rows):
+    columns = list(next(iter(rows.values())))
+    width = max(len(name) for name in rows)
+    print(f"\n{title}\n{'':{width}} " + " ".join(f"{column:>13}" for column in columns))
+    for name, row in rows.items():
+        print(f"{name:{width}} " + " ".join(f"{row[column]:13.3f}" for column in columns))
+
+
+def int_list(value):
+    return [int(item) for item in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", default="arxiv_papers")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--backend", default="remote", help="embedding backend of the queries (remote uses the embedding cache)")
+    parser.add_argument("--queries", help="query file, plain lines or JSON lines with labels")
+    parser.add_argument("--synthetic", type=int, default=0, help="benchmark on N random clustered vectors instead of the collection")
+    parser.add_argument("--synthetic-queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=256, help="dimension of the synthetic vectors")
+    parser.add_argument("-k", type=int, default=RETRIEVER_SETTINGS["similarity"]["k"])
+    parser.add_argument("--ef-construction", type=int_list, default=[100], help="HNSW build parameter(s), comma separated")
+    parser.add_argument("--m", type=int_list, default=[16], help="HNSW max_neighbors (M), comma separated")
+    parser.add_argument("--ef-search", type=int_list, default=[10, 50, 100], help="HNSW search parameter(s), comma separated")
+    parser.add_argument("--fetch-k", type=int, default=RETRIEVER_SETTINGS["mmr"]["fetch_k"])
+    parser.add_argument("--lambda-mult", type=float, default=RETRIEVER_SETTINGS["mmr"]["lambda_mult"])
+    parser.add_argument("--score-threshold", type=float, default=RETRIEVER_SETTINGS["similarity_score_threshold"]["score_threshold"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    import chromadb
+    ids, vectors, documents, metadatas, queries, query_vectors = load_corpus(args)
+    started = time.perf_counter()
+    truth = exact_top_k(vectors, query_vectors, max(args.k, RETRIEVER_SETTINGS["similarity_score_threshold"]["k"]))
+    print(f"{len(ids)} documents, {len(queries)} queries, dim {vectors.shape[1]}; "
+          f"brute force: {(time.perf_counter() - started) * 1000 / len(queries):.3f} ms/query")
+
+    client = chromadb.EphemeralClient()
+    rows, builds, last = {}, {}, None
+    for ef_construction, m in itertools.product(args.ef_construction, args.m):
+        name = f"bench_ef{ef_construction}_m{m}"
+        collection, seconds = build_index(client, name, ids, vectors, documents, metadatas, ef_construction, m)
+        builds[f"ef_construction={ef_construction} M={m}"] = {"build s": seconds, "docs/s": len(ids) / seconds}
+        for ef_search in args.ef_search:
+            collection.modify(configuration={"hnsw": {"ef_search": ef_search}})
+            rows[f"efC={ef_construction} M={m} ef={ef_search}"] = run_index(
+                collection, ids, queries, query_vectors, [row[:args.k] for row in truth], args.k, args.repeat
+            )
+        last = name
+    print_table("index build", builds)
+    print_table(f"vector search, k={args.k}", rows)
+
+    settings = {
+        "similarity": {"k": args.k},
+        "mmr": {"k": args.k, "fetch_k": args.fetch_k, "lambda_mult": args.lambda_mult},
+        "similarity_score_threshold": {
+            "score_threshold": args.score_threshold, "k": RETRIEVER_SETTINGS["similarity_score_threshold"]["k"],
+        },
+    }
+    print_table(f"retrievers on the last index ({last})", run_retrievers(client, last, ids, queries, query_vectors, truth, settings, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
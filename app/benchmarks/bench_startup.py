@@ -0,0 +1,65 @@
+"""
+Import time, cold start and memory of the app with lazy tools vs. everything initialized up front.
+
+Each scenario runs in a fresh interpreter:
+    lazy  - import app, then serve the first GET /books (the tools are never touched)
+    eager - import app, then warm_up() every registered tool resource before the first request,
+            which is what used to happen at import time
+
+    cd app
+    python -m benchmarks.bench_startup [--runs 5]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+SCENARIO = r"""
+import json, resource, sys, time
+started = time.perf_counter()
+import app as application
+imported = time.perf_counter()
+warm = {}
+if sys.argv[1] == "eager":
+    from tools.registry import warm_up
+    warm = warm_up()
+warmed = time.perf_counter()
+application.app.test_client().get("/books")
+served = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - started,
+    "warm_up_s": warmed - imported,
+    "cold_start_s": served - started,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "warmed": sorted(warm),
+}))
+"""
+
+
+def run(mode):
+    output = subprocess.run([sys.executable, "-c", SCENARIO, mode], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {mode: [run(mode) for _ in range(args.runs)] for mode in ("lazy", "eager")}
+    summary = {
+        mode: {key: statistics.median(run[key] for run in runs) for key in ("import_s", "warm_up_s", "cold_start_s", "max_rss_mb")}
+        for mode, runs in results.items()
+    }
+
+    print(f"{'':8} {'import s':>10} {'warm-up s':>10} {'cold start s':>13} {'max RSS MB':>11}")
+    for mode, row in summary.items():
+        print(f"{mode:8} {row['import_s']:10.3f} {row['warm_up_s']:10.3f} {row['cold_start_s']:13.3f} {row['max_rss_mb']:11.1f}")
+    print(f"\nresources warmed in eager mode: {', '.join(results['eager'][0]['warmed'])}")
+    print(f"saved by lazy init: {summary['eager']['cold_start_s'] - summary['lazy']['cold_start_s']:.3f} s, "
+          f"{summary['eager']['max_rss_mb'] - summary['lazy']['max_rss_mb']:.1f} MB RSS per worker")
+
+
+if __name__ == "__main__":
+    main()
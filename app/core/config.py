@@ -0,0 +1,56 @@
+import os
+
+
+def database_url():
+    """
+    DATABASE_URL, or the SQLite file booklibrary.db in the instance folder.
+    Heroku-style postgres:// URLs are accepted (SQLAlchemy only knows postgresql://).
+    """
+    url = os.environ.get("DATABASE_URL", "sqlite:///booklibrary.db")
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+def sqlite_pragmas():
+    """
+    Applied on every new SQLite connection (db/session.py):
+        journal_mode=WAL - readers do not block the writer and the writer does not block readers
+        synchronous=NORMAL - with WAL, fsync at checkpoints instead of every commit; still crash-safe
+        busy_timeout - a writer waits for the lock instead of failing with "database is locked"
+        cache_size - negative value is KiB of page cache per connection
+        mmap_size - bytes of the file read through memory mapping
+        foreign_keys - needed for ON DELETE CASCADE
+    """
+    return {
+        "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+        "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+        "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", -64000)),
+        "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+        "foreign_keys": "ON",
+    }
+
+
+def engine_options(url):
+    """Engine options for the URL: pool sizing and pre-ping for server databases, lock timeout for SQLite"""
+    if url.startswith("sqlite"):
+        # pysqlite waits for locks with its own timeout (seconds), keep it in line with busy_timeout
+        return {"connect_args": {"timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000)) / 1000}}
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        # Server side closes idle connections; recycle before that and test each one on checkout
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": True,
+    }
+
+
+class Config:
+    """Flask configuration read from the environment, loaded with app.config.from_object(Config)"""
+
+    SECRET_KEY = os.environ.get("SECRET_KEY", "dev-fallback-key")
+    SQLALCHEMY_DATABASE_URI = database_url()
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLITE_PRAGMAS = sqlite_pragmas()
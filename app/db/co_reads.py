@@ -0,0 +1,65 @@
+import atexit
+import logging
+import os
+import threading
+from db.base import db
+
+logger = logging.getLogger(__name__)
+
+# Archive writes only queue the user (book_co_read_pending); the co-read counts and lists catch up this many
+# seconds after the commit, in one background run per process that handles everything queued meanwhile.
+# A negative value leaves them to flask apply-co-reads.
+CO_READS_DELAY = float(os.getenv("CO_READS_DELAY", 1.0))
+# Co-read pairs one applier transaction may update: c books of an archive of n books touch about 2·c·n
+CO_READS_PAIRS_PER_CHUNK = int(os.getenv("CO_READS_PAIRS_PER_CHUNK", 200000))
+
+
+def apply_pending(pause=0.0):
+    """Count every queued archive change into book_co_reads / book_co_read_top. Returns the number of users caught up"""
+    from models.bookcoread import BookCoRead
+
+    return BookCoRead.apply_pending(max_pairs=CO_READS_PAIRS_PER_CHUNK, pause=pause)
+
+
+class PendingCoReads:
+    """Runs apply_pending() once per delay seconds at most, after the commits that queued archive changes"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._timer = None
+        self._app = None
+
+    def schedule(self, app):
+        if self.delay < 0:
+            return
+        with self._lock:
+            self._app = app
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.run)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def run(self):
+        with self._lock:
+            app, self._timer = self._app, None
+        if app is None:
+            return
+        with app.app_context():
+            try:
+                apply_pending()
+            except Exception:
+                db.session.rollback()
+                app.logger.exception("co-read counts were not updated, the archive changes stay queued")
+
+    def flush_now(self):
+        with self._lock:
+            if self._timer is None:
+                return
+            self._timer.cancel()
+        self.run()
+
+
+pending_co_reads = PendingCoReads(CO_READS_DELAY)
+# Short-lived processes (CLI commands) count what they changed before they exit
+atexit.register(pending_co_reads.flush_now)
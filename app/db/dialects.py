@@ -0,0 +1,9 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from db.base import db
+
+
+def dialect_insert(table):
+    """INSERT that supports ON CONFLICT for the database in use (SQLite or PostgreSQL)"""
+    if db.session.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
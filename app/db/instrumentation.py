@@ -0,0 +1,165 @@
+import heapq
+import logging
+import threading
+import time
+from collections import Counter, defaultdict, deque
+import numpy as np
+from flask import abort, current_app, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from db.base import db
+
+logger = logging.getLogger(__name__)
+
+
+class RequestSQLStats:
+    """Statements executed while handling one request"""
+
+    def __init__(self, slowest=5):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest = []
+        self.statements = Counter()
+        self._parameters = defaultdict(set)
+        self._keep = slowest
+
+    def record(self, statement, parameters, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+        self._parameters[statement].add(repr(parameters))
+        heapq.heappush(self.slowest, (seconds, statement))
+        if len(self.slowest) > self._keep:
+            heapq.heappop(self.slowest)
+
+    def repeated(self, threshold):
+        """
+        Reads run at least threshold times with different parameters - the shape of an N+1.
+        Writes are left out: the version bumps of separate commits (e.g. three app_meta upserts
+        of a user delete) repeat one statement without being a loop over rows.
+        """
+        return {
+            statement: count for statement, count in self.statements.items()
+            if count >= threshold and len(self._parameters[statement]) > 1 and _is_read(statement)
+        }
+
+
+def _is_read(statement):
+    words = statement.split(None, 1)
+    return bool(words) and words[0].upper() in ("SELECT", "WITH")
+
+
+class SQLInstrumentation:
+    """
+    Per-request SQL accounting on top of the engines of db:
+        - statement count, total DB time and the slowest statements of every request,
+        - N+1 detection (the same statement repeated with different parameters),
+        - X-SQL-* response headers in debug mode,
+        - per-route p50/p95 of request time, DB time and statement count at /debug/metrics (debug mode only).
+    Other parts of the app can add their counters to /debug/metrics with register_metrics_source().
+    """
+
+    def __init__(self, app=None, window=1000, slowest=5, n_plus_one_threshold=3):
+        self.window = window
+        self.slowest = slowest
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.sources = {}
+        self._routes = defaultdict(lambda: deque(maxlen=self.window))
+        self._n_plus_one = Counter()
+        self._slowest = defaultdict(list)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+                event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule("/debug/metrics", "debug_metrics", self.metrics_view)
+        app.extensions["sql_instrumentation"] = self
+
+    def register_metrics_source(self, name, source):
+        """source() returns a JSON-serializable dict shown under its name at /debug/metrics"""
+        self.sources[name] = source
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context._instrumentation_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not has_request_context() or "sql_stats" not in g:
+            return
+        g.sql_stats.record(statement, parameters, time.perf_counter() - context._instrumentation_started)
+
+    def _before_request(self):
+        g.sql_stats = RequestSQLStats(slowest=self.slowest)
+        g.request_started = time.perf_counter()
+
+    def _after_request(self, response):
+        stats = g.pop("sql_stats", None)
+        if stats is None:
+            return response
+        elapsed = time.perf_counter() - g.pop("request_started")
+        route = f"{request.method} {request.url_rule.rule if request.url_rule else '<unmatched>'}"
+        repeated = stats.repeated(self.n_plus_one_threshold)
+
+        with self._lock:
+            self._routes[route].append((elapsed, stats.seconds, stats.count))
+            if repeated:
+                self._n_plus_one[route] += 1
+            slowest = self._slowest[route]
+            for item in stats.slowest:
+                if item not in slowest:
+                    heapq.heappush(slowest, item)
+                    if len(slowest) > self.slowest:
+                        heapq.heappop(slowest)
+        if repeated:
+            logger.warning(
+                "possible N+1 on %s: %s",
+                route, "; ".join(f"{count}x {statement.splitlines()[0][:120]}" for statement, count in repeated.items()),
+            )
+
+        if current_app.debug:
+            response.headers["X-SQL-Count"] = str(stats.count)
+            response.headers["X-SQL-Time-ms"] = f"{stats.seconds * 1000:.2f}"
+            if stats.slowest:
+                response.headers["X-SQL-Slowest-ms"] = f"{max(stats.slowest)[0] * 1000:.2f}"
+            if repeated:
+                response.headers["X-SQL-N-Plus-One"] = str(sum(repeated.values()))
+        return response
+
+    def route_metrics(self):
+        with self._lock:
+            routes = {route: np.array(samples) for route, samples in self._routes.items()}
+            n_plus_one = dict(self._n_plus_one)
+            slowest = {route: sorted(items, reverse=True) for route, items in self._slowest.items()}
+
+        metrics = {}
+        for route, samples in sorted(routes.items()):
+            request_ms, sql_ms = samples[:, 0] * 1000, samples[:, 1] * 1000
+            metrics[route] = {
+                "requests": len(samples),
+                "request_ms_p50": round(float(np.percentile(request_ms, 50)), 2),
+                "request_ms_p95": round(float(np.percentile(request_ms, 95)), 2),
+                "sql_ms_p50": round(float(np.percentile(sql_ms, 50)), 2),
+                "sql_ms_p95": round(float(np.percentile(sql_ms, 95)), 2),
+                "sql_count_p50": float(np.percentile(samples[:, 2], 50)),
+                "sql_count_p95": float(np.percentile(samples[:, 2], 95)),
+                "n_plus_one_requests": n_plus_one.get(route, 0),
+                "slowest_statements": [
+                    {"ms": round(seconds * 1000, 2), "statement": statement} for seconds, statement in slowest.get(route, [])
+                ],
+            }
+        return metrics
+
+    def metrics_view(self):
+        if not current_app.debug:
+            abort(404)
+        sources = {}
+        for name, source in self.sources.items():
+            try:
+                sources[name] = source()
+            except Exception as E:
+                sources[name] = {"error": str(E)}
+        return jsonify(routes=self.route_metrics(), **sources)
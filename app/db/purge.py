@@ -0,0 +1,127 @@
+import logging
+import threading
+import time
+from db.base import db
+from db.versioning import mark_archive_changed
+from models.user import User
+from models.userbook import UserBook
+
+logger = logging.getLogger(__name__)
+
+# Archives bigger than this are purged in the background instead of in the request
+BACKGROUND_PURGE_THRESHOLD = 5000
+
+
+def archive_size(user_id):
+    return db.session.execute(
+        db.select(db.func.count()).select_from(UserBook).where(UserBook.user_id == user_id)
+    ).scalar_one()
+
+
+def mark_for_deletion(user_id):
+    """
+    Commit users.deleting before the first chunk: the user disappears from the lists and cannot log in
+    while the archive is half deleted, and resume_pending_purges() finds the purge if the process dies.
+    """
+    result = db.session.execute(
+        db.update(User).where(User.id == user_id, User.deleting == db.false()).values(deleting=True)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def pending_purges():
+    """Ids of users whose purge was started but not finished"""
+    return db.session.execute(db.select(User.id).where(User.deleting == db.true()).order_by(User.id)).scalars().all()
+
+
+def purge_user(user_id, chunk_size=1000, pause=0.05):
+    """
+    Delete the user's archive at most chunk_size rows per transaction, then the user; the co-read counts
+    catch up afterwards (db.co_reads). Each chunk holds the SQLite write lock only briefly and the pause lets other writers in between,
+    unlike one cascading DELETE over a huge archive. Safe to run again on a purge that was interrupted.
+    Returns the number of archive rows deleted.
+    """
+    mark_for_deletion(user_id)
+    deleted = 0
+    while True:
+        # A write first: it takes the write lock (the row lock on PostgreSQL), so two processes resuming
+        # the same purge run its chunks one at a time and never count the same rows twice
+        claimed = db.session.execute(
+            db.update(User).where(User.id == user_id, User.deleting == db.true()).values(deleting=True)
+        ).rowcount
+        if not claimed:
+            # Another process has finished it
+            db.session.rollback()
+            return deleted
+        book_ids = db.session.execute(
+            db.select(UserBook.book_id).where(UserBook.user_id == user_id).limit(chunk_size)
+        ).scalars().all()
+        rowcount = db.session.execute(
+            db.delete(UserBook).where(UserBook.user_id == user_id, UserBook.book_id.in_(book_ids))
+        ).rowcount
+        mark_archive_changed(user_id)
+        db.session.commit()
+        deleted += rowcount
+        if rowcount < chunk_size:
+            break
+        if pause:
+            time.sleep(pause)
+    # The archive is empty by now, the cascade has nothing left to miss
+    db.session.execute(db.delete(User).where(User.id == user_id))
+    db.session.commit()
+    return deleted
+
+
+def _purge_logged(user_id, **options):
+    try:
+        deleted = purge_user(user_id, **options)
+        logger.info("user %s purged with %s archive rows", user_id, deleted)
+    except Exception:
+        logger.exception("purge of user %s failed, it is resumed on the next start", user_id)
+        db.session.rollback()
+
+
+def purge_user_in_background(app, user_id, **options):
+    """
+    purge_user() in a daemon thread with its own app context (and so its own session).
+    The user is marked first, so a purge cut off by the process exit is finished by resume_pending_purges().
+    """
+    mark_for_deletion(user_id)
+
+    def run():
+        with app.app_context():
+            _purge_logged(user_id, **options)
+
+    thread = threading.Thread(target=run, name=f"purge-user-{user_id}", daemon=True)
+    thread.start()
+    return thread
+
+
+def resume_pending_purges(app, **options):
+    """Finish, one after another in a background thread, every purge an earlier process did not complete"""
+    def run():
+        with app.app_context():
+            for user_id in pending_purges():
+                _purge_logged(user_id, **options)
+
+    thread = threading.Thread(target=run, name="purge-resume", daemon=True)
+    thread.start()
+    return thread
+
+
+def resume_on_first_request(app, **options):
+    """Start resume_pending_purges() once per serving process, when it gets its first request (CLI commands never do)"""
+    lock = threading.Lock()
+    started = []
+
+    def resume():
+        if started:
+            return
+        with lock:
+            if started:
+                return
+            started.append(True)
+        resume_pending_purges(app, **options)
+
+    app.before_request(resume)
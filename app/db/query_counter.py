@@ -0,0 +1,54 @@
+import threading
+from contextlib import contextmanager
+from sqlalchemy import event
+from db.base import db
+
+
+class QueryCounter:
+    """SQL statements executed on an engine by the thread that started the counter, while it is active"""
+
+    def __init__(self):
+        self.statements = []
+        # Background threads (warm-up, purges) are not part of the request being measured
+        self.thread_id = threading.get_ident()
+
+    def __len__(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == self.thread_id:
+            self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """
+    Count the statements sent to the database inside the block:
+
+        with count_queries() as queries:
+            client.get("/books")
+        print(len(queries), queries.statements)
+    """
+    engine = engine or db.engine
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter._before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", counter._before_cursor_execute)
+
+
+@contextmanager
+def assert_max_queries(max_queries, engine=None):
+    """
+    Fail with AssertionError when the block issues more than max_queries statements,
+    e.g. when a template starts lazy loading a relationship per row again:
+
+        with app.app_context(), assert_max_queries(4):
+            client.get(f"/user/{user_id}/archive")
+    """
+    with count_queries(engine) as counter:
+        yield counter
+    if len(counter) > max_queries:
+        executed = "\n".join(f"  {number}. {statement}" for number, statement in enumerate(counter.statements, 1))
+        raise AssertionError(f"{len(counter)} SQL statements executed, at most {max_queries} expected:\n{executed}")
@@ -0,0 +1,75 @@
+import hashlib
+from pathlib import Path
+from db.base import db
+from db.co_reads import apply_pending as apply_pending_co_reads
+from models.appmeta import AppMeta
+from models.book import Book
+from models.user import User
+from models.userbook import UserBook
+from utils.catalog_import import import_catalog
+
+CATALOG_PATH = Path("static") / "books" / "literature.json"
+
+DEMO_USERS = [
+    {"name": "user1", "email": "email1@gmail.com", "username": "username1", "password": "password1"},
+    {"name": "user2", "email": "email2@gmail.com", "username": "username2", "password": "password2"},
+    {"name": "user3", "email": "email3@gmail.com", "username": "username3", "password": "password3"},
+    {"name": "user4", "email": "email4@gmail.com", "username": "username4", "password": "password4"},
+    {"name": "user5", "email": "email5@gmail.com", "username": "username5", "password": "password5"},
+]
+
+# (username, index of the book in name order, reading status)
+DEMO_USER_BOOKS = [
+    ("username1", 1, "completed"), ("username1", 2, "unread"),
+    ("username2", 1, "unread"), ("username2", 3, "reading"),
+    ("username3", 1, "unread"), ("username3", 2, "unread"), ("username3", 3, "unread"),
+]
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def seed_catalog(path=CATALOG_PATH, chunk_size=5000, force=False, report=None, rejects=None):
+    """
+    Load the book catalog file (JSON, JSONL or CSV) into the database unless it was already loaded unchanged.
+    Returns the import totals, or None when the file checksum matched and nothing was done.
+    """
+    path = Path(path)
+    db.create_all()
+
+    checksum_key = f"catalog_checksum:{path.name}"
+    checksum = file_checksum(path)
+    if not force and AppMeta.get_value(checksum_key) == checksum:
+        return None
+
+    totals = import_catalog(path, chunk_size=chunk_size, report=report, rejects=rejects)
+    AppMeta.set_value(checksum_key, checksum)
+    db.session.commit()
+    return totals
+
+
+def seed_demo_users():
+    """Create the demo accounts and their archives, skipping accounts that already exist"""
+    existing = set(db.session.execute(
+        db.select(User.username).where(User.username.in_([user["username"] for user in DEMO_USERS]))
+    ).scalars())
+    created = {}
+    for user_infor in DEMO_USERS:
+        if user_infor["username"] not in existing:
+            created[user_infor["username"]] = User(**user_infor)
+            db.session.add(created[user_infor["username"]])
+    db.session.flush()
+
+    books = db.session.execute(db.select(Book.id).order_by(Book.name).limit(4)).scalars().all()
+    for username, index, status in DEMO_USER_BOOKS:
+        if username in created and index < len(books):
+            db.session.add(UserBook(user_id=created[username].id, book_id=books[index], reading_status=status))
+    db.session.commit()
+    # The archives were queued by the commit; count them now so the lists are complete when seeding returns
+    apply_pending_co_reads()
+    return len(created)
@@ -0,0 +1,24 @@
+from sqlalchemy import event
+from db.base import db
+
+
+def sqlite_pragma_listener(pragmas):
+    """
+    "connect" event handler that sets the pragmas on every new SQLite connection.
+    foreign_keys must be on for ON DELETE CASCADE: SQLite ignores FOREIGN KEY clauses otherwise.
+    """
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+    return on_connect
+
+
+def init_engines(app):
+    """Register connection setup on the engines of db (call right after db.init_app)"""
+    pragmas = app.config.get("SQLITE_PRAGMAS", {"foreign_keys": "ON"})
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == "sqlite":
+                event.listen(engine, "connect", sqlite_pragma_listener(pragmas))
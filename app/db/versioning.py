@@ -0,0 +1,199 @@
+import atexit
+import os
+import threading
+from sqlalchemy import event
+from db.base import db
+
+# Table -> counter in app_meta that changes whenever rows of the table change.
+# Pages built from these tables use the counters for ETags and fragment cache keys.
+VERSION_KEYS = {
+    "books": "catalog_version",
+    "users": "users_version",
+    "user_books": "archives_version",
+    "book_neighbors": "neighbors_version",
+    "book_co_reads": "co_reads_version",
+    "book_co_read_top": "co_reads_version",
+}
+
+# Tables whose rows a DELETE removes in the database through ON DELETE CASCADE
+CASCADES = {
+    "users": ("user_books",),
+    "books": ("user_books", "book_neighbors", "book_co_reads", "book_co_read_top"),
+}
+
+# Global counters that every archive click changes. They are bumped after the commit, at most once per
+# VERSION_BUMP_DELAY seconds per process, so archive writers do not all queue on the same app_meta row;
+# pages keyed on them may show other users' changes that much later. The writer's own change is seen at once:
+# the per-user ArchiveVersion is bumped in the transaction (conditional_get(..., user_archive=True)).
+# 0 bumps them in the transaction too.
+DEFERRED_KEYS = frozenset({"archives_version", "co_reads_version"})
+VERSION_BUMP_DELAY = float(os.getenv("VERSION_BUMP_DELAY", 1.0))
+
+PENDING_KEY = "pending_version_bumps"
+PENDING_ARCHIVES_KEY = "pending_archive_bumps"
+DEFERRED_KEY = "deferred_version_bumps"
+CO_READS_KEY = "co_reads_queued"
+
+
+def _pending(session):
+    return session.info.setdefault(PENDING_KEY, set())
+
+
+def _pending_archives(session):
+    return session.info.setdefault(PENDING_ARCHIVES_KEY, set())
+
+
+def mark_archive_changed(user_id):
+    """
+    Bump the user's ArchiveVersion and queue the archive for the co-read counts when the current transaction
+    commits. Needed after set-based statements on user_books; rows added or deleted through the session are
+    picked up by themselves.
+    """
+    _pending_archives(db.session).add(user_id)
+
+
+class DeferredBumps:
+    """Counters committed by this process and not yet bumped; one timer bumps all of them in one transaction"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._keys = set()
+        self._timer = None
+        self._app = None
+
+    def add(self, app, keys):
+        with self._lock:
+            self._keys.update(keys)
+            self._app = app
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                try:
+                    self._timer.start()
+                except RuntimeError:
+                    # A commit made by an atexit callback (db.co_reads): no new threads at shutdown,
+                    # the flush_now() registered below runs after it and bumps the keys
+                    pass
+
+    def flush(self):
+        with self._lock:
+            keys, app = self._keys, self._app
+            self._keys, self._timer = set(), None
+        if not keys:
+            return
+        from models.appmeta import AppMeta
+
+        with app.app_context():
+            try:
+                for key in sorted(keys):
+                    AppMeta.bump(key)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                app.logger.exception("version counters %s were not bumped", sorted(keys))
+
+    def flush_now(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+        self.flush()
+
+
+deferred_bumps = DeferredBumps(VERSION_BUMP_DELAY)
+# Short-lived processes (CLI commands) bump what they changed before they exit
+atexit.register(deferred_bumps.flush_now)
+
+
+def _after_flush(session, flush_context):
+    # Unit-of-work changes (session.add / delete / attribute changes)
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(instance, "__tablename__", None)
+        key = VERSION_KEYS.get(table)
+        if key is not None and (instance not in session.dirty or session.is_modified(instance)):
+            _pending(session).add(key)
+            if table == "user_books":
+                _pending_archives(session).add(instance.user_id)
+
+
+def _do_orm_execute(state):
+    # Set-based statements (bulk upserts, archive batch, cascade deletes) bypass the flush
+    if state.is_insert or state.is_update or state.is_delete:
+        table = getattr(state.statement.table, "name", None)
+        if table in VERSION_KEYS:
+            _pending(state.session).add(VERSION_KEYS[table])
+            if state.is_delete:
+                _pending(state.session).update(VERSION_KEYS[child] for child in CASCADES.get(table, ()))
+
+
+def _before_commit(session):
+    from models.appmeta import AppMeta
+    from models.archiveversion import ArchiveVersion
+    from models.bookcoread import BookCoReadPending
+
+    session.flush()
+    keys = session.info.pop(PENDING_KEY, set())
+    if VERSION_BUMP_DELAY > 0:
+        session.info[DEFERRED_KEY] = keys & DEFERRED_KEYS
+        keys = keys - DEFERRED_KEYS
+    for key in sorted(keys):
+        AppMeta.bump(key)
+    user_ids = sorted(session.info.pop(PENDING_ARCHIVES_KEY, ()))
+    if user_ids:
+        ArchiveVersion.bump(user_ids)
+        BookCoReadPending.mark(user_ids)
+        session.info[CO_READS_KEY] = True
+
+
+def _after_commit(session):
+    from flask import current_app
+    from db.co_reads import pending_co_reads
+
+    keys = session.info.pop(DEFERRED_KEY, None)
+    if keys:
+        deferred_bumps.add(current_app._get_current_object(), keys)
+    if session.info.pop(CO_READS_KEY, False):
+        pending_co_reads.schedule(current_app._get_current_object())
+
+
+def _after_rollback(session):
+    session.info.pop(PENDING_KEY, None)
+    session.info.pop(PENDING_ARCHIVES_KEY, None)
+    session.info.pop(DEFERRED_KEY, None)
+    session.info.pop(CO_READS_KEY, None)
+
+
+def init_versioning():
+    """Bump the app_meta counters (and the per-user archive counters) with the change they describe"""
+    event.listen(db.session, "after_flush", _after_flush)
+    event.listen(db.session, "do_orm_execute", _do_orm_execute)
+    event.listen(db.session, "before_commit", _before_commit)
+    event.listen(db.session, "after_commit", _after_commit)
+    event.listen(db.session, "after_rollback", _after_rollback)
+
+
+def get_versions(*keys):
+    """Current counters, read once per request"""
+    from flask import g, has_request_context
+    from models.appmeta import AppMeta
+
+    if not has_request_context():
+        return AppMeta.get_versions(keys)
+    cached = g.setdefault("versions", {})
+    missing = [key for key in keys if key not in cached]
+    if missing:
+        cached.update(AppMeta.get_versions(missing))
+    return {key: cached[key] for key in keys}
+
+
+def get_archive_version(user_id):
+    """(counter, updated_at) of the user's archive, read once per request"""
+    from flask import g, has_request_context
+    from models.archiveversion import ArchiveVersion
+
+    if not has_request_context():
+        return ArchiveVersion.get(user_id)
+    cached = g.setdefault("archive_versions", {})
+    if user_id not in cached:
+        cached[user_id] = ArchiveVersion.get(user_id)
+    return cached[user_id]
@@ -0,0 +1,26 @@
+"""Index users.name for keyset pagination
+
+Revision ID: 5b1e0c7d2a91
+Revises: 42355a96f17f
+Create Date: 2026-10-18 13:40:12.311250
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1e0c7d2a91'
+down_revision = '42355a96f17f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_users_name'), ['name'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_name'))
@@ -0,0 +1,57 @@
+"""Full-text index over books (SQLite FTS5)
+
+Revision ID: 9c4d7e2f1b3a
+Revises: 5b1e0c7d2a91
+Create Date: 2026-10-18 14:05:47.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4d7e2f1b3a'
+down_revision = '5b1e0c7d2a91'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ("name", "author", "category", "describe")
+
+
+def fold(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def upgrade():
+    if op.get_bind().dialect.name != "sqlite":
+        return
+
+    new_values = ", ".join(fold(f"new.{column}") for column in COLUMNS)
+    op.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        name, author, category, describe,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )""")
+    op.execute(f"""CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts (rowid, name, author, category, describe) VALUES (new.id, {new_values});
+    END""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+        DELETE FROM books_fts WHERE rowid = old.id;
+    END""")
+    op.execute(f"""CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF name, author, category, describe ON books BEGIN
+        DELETE FROM books_fts WHERE rowid = old.id;
+        INSERT INTO books_fts (rowid, name, author, category, describe) VALUES (new.id, {new_values});
+    END""")
+    op.execute("DELETE FROM books_fts")
+    op.execute(f"""INSERT INTO books_fts (rowid, name, author, category, describe)
+        SELECT id, {", ".join(fold(column) for column in COLUMNS)} FROM books""")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "sqlite":
+        return
+
+    op.execute("DROP TRIGGER IF EXISTS books_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS books_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS books_fts_ai")
+    op.execute("DROP TABLE IF EXISTS books_fts")
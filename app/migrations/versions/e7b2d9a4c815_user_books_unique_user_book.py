@@ -0,0 +1,33 @@
+"""Unique (user_id, book_id) on user_books and index on book_id
+
+Revision ID: e7b2d9a4c815
+Revises: c3a8f5e1d6b2
+Create Date: 2026-10-18 16:20:44.902315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b2d9a4c815'
+down_revision = 'c3a8f5e1d6b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Duplicates inserted before the constraint existed: keep the oldest row of every couple
+    op.execute(
+        "DELETE FROM user_books WHERE id NOT IN "
+        "(SELECT MIN(id) FROM user_books GROUP BY user_id, book_id)"
+    )
+    with op.batch_alter_table('user_books', schema=None) as batch_op:
+        batch_op.create_index('ix_user_books_user_id_book_id', ['user_id', 'book_id'], unique=True)
+        batch_op.create_index(batch_op.f('ix_user_books_book_id'), ['book_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user_books', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_books_book_id'))
+        batch_op.drop_index('ix_user_books_user_id_book_id')
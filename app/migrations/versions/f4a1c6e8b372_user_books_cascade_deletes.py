@@ -0,0 +1,34 @@
+"""ON DELETE CASCADE on user_books foreign keys
+
+Revision ID: f4a1c6e8b372
+Revises: e7b2d9a4c815
+Create Date: 2026-10-18 17:05:12.518903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4a1c6e8b372'
+down_revision = 'e7b2d9a4c815'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows left behind by deletes made while foreign keys were not enforced
+    op.execute("DELETE FROM user_books WHERE user_id NOT IN (SELECT id FROM users) OR book_id NOT IN (SELECT id FROM books)")
+    with op.batch_alter_table('user_books', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_user_books_user_id_users', type_='foreignkey')
+        batch_op.drop_constraint('fk_user_books_book_id_books', type_='foreignkey')
+        batch_op.create_foreign_key(batch_op.f('fk_user_books_user_id_users'), 'users', ['user_id'], ['id'], ondelete='CASCADE')
+        batch_op.create_foreign_key(batch_op.f('fk_user_books_book_id_books'), 'books', ['book_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    with op.batch_alter_table('user_books', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_user_books_book_id_books', type_='foreignkey')
+        batch_op.drop_constraint('fk_user_books_user_id_users', type_='foreignkey')
+        batch_op.create_foreign_key(batch_op.f('fk_user_books_book_id_books'), 'books', ['book_id'], ['id'])
+        batch_op.create_foreign_key(batch_op.f('fk_user_books_user_id_users'), 'users', ['user_id'], ['id'])
@@ -1,3 +1,7 @@
 from .book import Book
 from .user import User
-from .userbook import UserBook
\ No newline at end of file
+from .userbook import UserBook
+from .appmeta import AppMeta
+from .bookneighbor import BookNeighbor
+from .bookcoread import BookCoRead, BookCoReadArchive, BookCoReadPending, BookCoReadTop
+from .archiveversion import ArchiveVersion
\ No newline at end of file
@@ -0,0 +1,48 @@
+from sqlalchemy.orm import Mapped, mapped_column
+from datetime import datetime, timezone
+import sqlalchemy as sa
+from db.base import db
+from db.dialects import dialect_insert
+
+
+class AppMeta(db.Model):
+    """Key/value table for application state that must be shared by every worker (checksums, versions)"""
+    __tablename__ = "app_meta"
+
+    key: Mapped[str] = mapped_column(db.String(100), primary_key=True)
+    value: Mapped[str] = mapped_column(db.Text, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    @classmethod
+    def get_value(cls, key, default=None):
+        meta = db.session.get(cls, key)
+        return meta.value if meta is not None else default
+
+    @classmethod
+    def set_value(cls, key, value):
+        meta = db.session.get(cls, key)
+        if meta is None:
+            meta = cls(key=key, value=value)
+            db.session.add(meta)
+        else:
+            meta.value = value
+            meta.updated_at = datetime.now(timezone.utc)
+        return meta
+
+    @classmethod
+    def bump(cls, key):
+        """Increment the integer counter stored under key (created at 1) in one statement"""
+        now = datetime.now(timezone.utc)
+        stmt = dialect_insert(cls.__table__).values(key=key, value="1", updated_at=now)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.__table__.c.key],
+            set_={"value": sa.cast(sa.cast(cls.__table__.c.value, sa.Integer) + 1, sa.Text), "updated_at": now},
+        )
+        db.session.execute(stmt)
+
+    @classmethod
+    def get_versions(cls, keys):
+        """{key: (counter, updated_at)} for the counters, (0, None) for the ones never bumped"""
+        rows = db.session.execute(db.select(cls.key, cls.value, cls.updated_at).where(cls.key.in_(keys))).all()
+        found = {key: (int(value), updated_at) for key, value, updated_at in rows}
+        return {key: found.get(key, (0, None)) for key in keys}
@@ -0,0 +1,45 @@
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import ForeignKey
+from datetime import datetime, timezone
+from db.base import db
+from db.dialects import dialect_insert
+
+
+class ArchiveVersion(db.Model):
+    """
+    Per-user counter of archive changes, bumped in the transaction of the change (see db.versioning).
+    Pages that show the logged-in user's archive use it for their ETag, and the cached archive book ids are keyed on it;
+    one row per user, so archive writes of different users never wait on the same row.
+    """
+    __tablename__ = "archive_versions"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    version: Mapped[int] = mapped_column(db.Integer, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(db.DateTime, nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    @classmethod
+    def bump(cls, user_ids):
+        """Increment the counters of user_ids (created at 1) in one statement"""
+        if not user_ids:
+            return
+        table = cls.__table__
+        now = datetime.now(timezone.utc)
+        stmt = dialect_insert(table).values([{"user_id": user_id, "version": 1, "updated_at": now} for user_id in user_ids])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id], set_={"version": table.c.version + 1, "updated_at": now},
+        )
+        db.session.execute(stmt)
+
+    @classmethod
+    def bump_readers_of(cls, book_id):
+        """Bump every user that has book_id in the archive; call before the book is deleted"""
+        from .userbook import UserBook
+
+        readers = db.session.execute(db.select(UserBook.user_id).where(UserBook.book_id == book_id)).scalars().all()
+        cls.bump(readers)
+
+    @classmethod
+    def get(cls, user_id):
+        """(counter, updated_at) of the user's archive, (0, None) if it never changed"""
+        row = db.session.execute(db.select(cls.version, cls.updated_at).where(cls.user_id == user_id)).first()
+        return (row.version, row.updated_at) if row is not None else (0, None)
@@ -1,5 +1,6 @@
 from sqlalchemy.orm import Mapped, mapped_column, validates, relationship
-from sqlalchemy import Integer, String, DateTime, ForeignKey
+from sqlalchemy import Integer, String, DateTime, ForeignKey, DDL, event, text
+from markupsafe import Markup, escape
 from typing import TYPE_CHECKING, List
 from db.base import db
 from datetime import datetime
@@ -10,6 +11,12 @@ if TYPE_CHECKING:
     # from .bookarchive import BookArchive
     from .userbook import UserBook
 
+# Validation rules, shared with the column checks of the bulk importer (utils/catalog_import.py)
+NAME_MAX_LENGTH = 500
+AUTHOR_MAX_LENGTH = 500
+CATEGORY_MAX_LENGTH = 500
+PUBLICATION_YEAR_PATTERN = r"\d{4}"
+
 class Book(db.Model):
     """Create a model class"""
     __tablename__ = "books"
@@ -27,7 +34,9 @@ class Book(db.Model):
     publication_year: Mapped[int] = mapped_column(db.Integer, unique=False, nullable=False)
 
     # Each Book has more UserBooks (many owners)
-    user_books: Mapped[List["UserBook"]] = relationship("UserBook", back_populates="book")
+    user_books: Mapped[List["UserBook"]] = relationship(
+        "UserBook", back_populates="book", cascade="all, delete-orphan", passive_deletes=True
+    )
 
     # названием,
     # автором,
@@ -38,13 +47,13 @@ class Book(db.Model):
 
     @validates("name")
     def validate_name(self, key, name):
-        if len(name) > 500 or not isinstance(name, str):
+        if len(name) > NAME_MAX_LENGTH or not isinstance(name, str):
             raise ValueError("Invalid book name")
         return name
     
     @validates("author")
     def validate_author(self, key, author):
-        if len(author) > 500 or not isinstance(author, str):
+        if len(author) > AUTHOR_MAX_LENGTH or not isinstance(author, str):
             raise ValueError("Invalid book author")
         return author
     
@@ -68,13 +77,13 @@ class Book(db.Model):
     
     @validates("publication_year")
     def validate_publication_year(self, key, publication_year):
-        if not re.match(r"\d{4}", str(publication_year)):
+        if not re.match(PUBLICATION_YEAR_PATTERN, str(publication_year)):
             raise ValueError("Invalid book publication year")
         return publication_year
     
     @validates("category")
     def validate_category(self, key, category):
-        if len(category) > 500 or not isinstance(category, str):
+        if len(category) > CATEGORY_MAX_LENGTH or not isinstance(category, str):
             raise ValueError("Invalid book category")
         return category
     
@@ -82,4 +91,130 @@ class Book(db.Model):
     def validate_describe(self, key, describe):
         if not isinstance(describe, str):
             raise ValueError("Invalid book describe")
-        return describe
\ No newline at end of file
+        return describe
+
+    @classmethod
+    def delete_by_id(cls, book_id):
+        """One DELETE; archive entries of the book are removed by ON DELETE CASCADE"""
+        from .archiveversion import ArchiveVersion
+        from .bookcoread import BookCoReadTop
+
+        # The cascade changes the archives of all readers of the book (and so their cached book ids)
+        ArchiveVersion.bump_readers_of(book_id)
+        # ... and leaves a hole in every "readers also read" list that showed the book; those are refilled
+        listing = db.session.execute(db.select(BookCoReadTop.book_id).where(BookCoReadTop.other_id == book_id)).scalars().all()
+        result = db.session.execute(db.delete(cls).where(cls.id == book_id))
+        BookCoReadTop.refresh(listing)
+        db.session.commit()
+        return result.rowcount
+
+    @classmethod
+    def search(cls, query, page=1, size=20):
+        """
+        Ranked full-text search over name, author, category and describe.
+        Returns (results, has_next), each result is a dict with the book columns
+        and html-safe highlighted name/author/snippet.
+        """
+        match = fts_match_query(query)
+        if not match:
+            return [], False
+
+        if db.session.get_bind().dialect.name != "sqlite":
+            return cls._search_like(query, page, size)
+
+        rows = db.session.execute(text(f"""
+            SELECT books.id, books.name, books.author, books.category, books.publication_year,
+                   highlight(books_fts, 0, char(2), char(3)) AS name_hl,
+                   highlight(books_fts, 1, char(2), char(3)) AS author_hl,
+                   snippet(books_fts, 3, char(2), char(3), '…', 24) AS snippet,
+                   bm25(books_fts, {BOOKS_FTS_WEIGHTS}) AS score
+            FROM books_fts JOIN books ON books.id = books_fts.rowid
+            WHERE books_fts MATCH :match
+            ORDER BY score
+            LIMIT :limit OFFSET :offset
+        """), {"match": match, "limit": size + 1, "offset": (page - 1) * size}).mappings().all()
+
+        results = [{
+            "id": row["id"],
+            "name": row["name"],
+            "author": row["author"],
+            "category": row["category"],
+            "publication_year": row["publication_year"],
+            "name_hl": _mark(row["name_hl"]),
+            "author_hl": _mark(row["author_hl"]),
+            "snippet": _mark(row["snippet"]),
+            "score": row["score"],
+        } for row in rows[:size]]
+        return results, len(rows) > size
+
+    @classmethod
+    def _search_like(cls, query, page, size):
+        """Fallback for databases without FTS5: unranked substring match on name and author"""
+        pattern = f"%{query.strip()}%"
+        books = db.session.execute(
+            db.select(cls)
+            .where(cls.name.ilike(pattern) | cls.author.ilike(pattern))
+            .order_by(cls.name, cls.id)
+            .limit(size + 1).offset((page - 1) * size)
+        ).scalars().all()
+        results = [{
+            "id": book.id,
+            "name": book.name,
+            "author": book.author,
+            "category": book.category,
+            "publication_year": book.publication_year,
+            "name_hl": escape(book.name),
+            "author_hl": escape(book.author),
+            "snippet": escape(book.describe[:200]),
+            "score": None,
+        } for book in books[:size]]
+        return results, len(books) > size
+
+
+# Full-text index (SQLite FTS5). The index keeps its own copy of the text with "ё" folded to "е",
+# because the unicode61 tokenizer folds case and accents but treats "ё" as a separate letter.
+# Triggers keep it in sync with every write to books, ORM or bulk SQL.
+# Not part of the metadata: migrations/env.py keeps autogenerate away from the books_fts* tables.
+BOOKS_FTS_WEIGHTS = "10.0, 5.0, 2.0, 1.0"  # name, author, category, describe
+
+def _fold_sql(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+_fts_values = ", ".join(_fold_sql(f"new.{column}") for column in ("name", "author", "category", "describe"))
+
+BOOKS_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+        name, author, category, describe,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN
+        INSERT INTO books_fts (rowid, name, author, category, describe) VALUES (new.id, {_fts_values});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN
+        DELETE FROM books_fts WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF name, author, category, describe ON books BEGIN
+        DELETE FROM books_fts WHERE rowid = old.id;
+        INSERT INTO books_fts (rowid, name, author, category, describe) VALUES (new.id, {_fts_values});
+    END""",
+]
+
+for _statement in BOOKS_FTS_DDL:
+    event.listen(Book.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+event.listen(Book.__table__, "before_drop", DDL("DROP TABLE IF EXISTS books_fts").execute_if(dialect="sqlite"))
+
+
+def fts_match_query(query):
+    """
+    Turn free user input into a safe FTS5 MATCH expression: every word is quoted
+    (so FTS syntax characters can not break the query) and matched as a prefix,
+    which also catches Russian inflected forms ("преступлени" -> "преступление", "преступления").
+    """
+    words = re.findall(r"\w+", (query or "").lower().replace("ё", "е"))
+    return " ".join(f'"{word}"*' for word in words[:16])
+
+
+def _mark(value):
+    """Escape indexed text and turn the \\x02/\\x03 highlight markers into <mark> tags"""
+    return Markup(str(escape(value or "")).replace("\x02", "<mark>").replace("\x03", "</mark>"))
@@ -0,0 +1,280 @@
+from sqlalchemy.orm import Mapped, mapped_column, aliased
+from sqlalchemy import ForeignKey
+import sqlalchemy as sa
+import time
+import numpy as np
+from db.base import db
+from db.dialects import dialect_insert
+
+try:
+    from scipy import sparse
+except ImportError:  # scipy is optional, the full rebuild counts pairs with numpy alone
+    sparse = None
+
+# Length of the stored "readers of this also read" list of each book
+CO_READS_K = 10
+
+
+class BookCoReadArchive(db.Model):
+    """
+    The archives as BookCoRead counts them. Archive writes only queue the user (BookCoReadPending);
+    BookCoRead.apply_pending() later counts the difference between user_books and these rows and copies it here.
+    No foreign key to users: the rows of a deleted user are needed to take their pairs out of the counts.
+    """
+    __tablename__ = "book_co_read_archives"
+
+    user_id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
+    book_id: Mapped[int] = mapped_column(ForeignKey("books.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+
+class BookCoReadPending(db.Model):
+    """Users whose archive changed since its co-reads were last counted"""
+    __tablename__ = "book_co_read_pending"
+
+    user_id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
+
+    @classmethod
+    def mark(cls, user_ids):
+        """Queue user_ids in one statement; called by db.versioning in the transaction of the archive change"""
+        if not user_ids:
+            return
+        stmt = dialect_insert(cls.__table__).values([{"user_id": user_id} for user_id in user_ids])
+        db.session.execute(stmt.on_conflict_do_nothing(index_elements=["user_id"]))
+
+
+class BookCoRead(db.Model):
+    """
+    Sparse book x book co-occurrence matrix of the archives: readers = number of users that have both books.
+    Stored in both directions, so the row of a book is one index range. Kept up to date off the request path
+    by apply_pending() (see db.co_reads); rebuild() recomputes it from scratch.
+    """
+    __tablename__ = "book_co_reads"
+
+    book_id: Mapped[int] = mapped_column(ForeignKey("books.id", ondelete="CASCADE"), primary_key=True)
+    other_id: Mapped[int] = mapped_column(ForeignKey("books.id", ondelete="CASCADE"), primary_key=True, index=True)
+    readers: Mapped[int] = mapped_column(db.Integer, nullable=False)
+
+    @classmethod
+    def _counted_pairs(cls, user_id, book_ids):
+        """(book, other book) pairs of the user's counted archive that involve book_ids"""
+        mine, other = aliased(BookCoReadArchive), aliased(BookCoReadArchive)
+        return (
+            db.select(mine.book_id.label("book_id"), other.book_id.label("other_id"))
+            .join(other, sa.and_(other.user_id == mine.user_id, other.book_id != mine.book_id))
+            .where(mine.user_id == user_id, sa.or_(mine.book_id.in_(book_ids), other.book_id.in_(book_ids)))
+        )
+
+    @classmethod
+    def _count_added(cls, user_id, book_ids):
+        table, counted = cls.__table__, BookCoReadArchive.__table__
+        db.session.execute(sa.insert(counted), [{"user_id": user_id, "book_id": book_id} for book_id in book_ids])
+        pairs = cls._counted_pairs(user_id, book_ids)
+        stmt = dialect_insert(table).from_select(
+            ["book_id", "other_id", "readers"], pairs.add_columns(sa.literal(1))
+        ).on_conflict_do_update(index_elements=[table.c.book_id, table.c.other_id], set_={"readers": table.c.readers + 1})
+        db.session.execute(stmt)
+        BookCoReadTop.refresh(BookCoReadTop.reached_by(pairs))
+
+    @classmethod
+    def _count_removed(cls, user_id, book_ids):
+        table, counted = cls.__table__, BookCoReadArchive.__table__
+        pairs = cls._counted_pairs(user_id, book_ids)
+        # A decrement can only change the lists that already show the pair
+        listed = BookCoReadTop.listing(pairs)
+        in_pairs = sa.tuple_(table.c.book_id, table.c.other_id).in_(pairs)
+        db.session.execute(sa.update(table).where(in_pairs).values(readers=table.c.readers - 1))
+        db.session.execute(sa.delete(table).where(in_pairs, table.c.readers <= 0))
+        db.session.execute(sa.delete(counted).where(counted.c.user_id == user_id, counted.c.book_id.in_(book_ids)))
+        BookCoReadTop.refresh(listed)
+
+    @classmethod
+    def apply_user(cls, user_id, max_pairs=200000):
+        """
+        One transaction of catching up with the user's archive: removed books first, then added ones, as many
+        as keep the pair updates under max_pairs (a book of an archive of n books is in about 2·n pairs).
+        Returns True while more is left. Starts with a write on the queue row, so concurrent appliers of the
+        same user run one transaction at a time and each sees what the previous one counted.
+        """
+        from .userbook import UserBook
+
+        pending = BookCoReadPending.__table__
+        claimed = db.session.execute(
+            sa.update(pending).where(pending.c.user_id == user_id).values(user_id=pending.c.user_id)
+        ).rowcount
+        if not claimed:
+            db.session.rollback()
+            return False
+        counted = set(db.session.execute(db.select(BookCoReadArchive.book_id).where(BookCoReadArchive.user_id == user_id)).scalars())
+        current = set(db.session.execute(db.select(UserBook.book_id).where(UserBook.user_id == user_id)).scalars())
+        removed, added = sorted(counted - current), sorted(current - counted)
+        if removed:
+            step = max(1, max_pairs // (2 * len(counted)))
+            cls._count_removed(user_id, removed[:step])
+        elif added:
+            step = max(1, max_pairs // (2 * len(current)))
+            cls._count_added(user_id, added[:step])
+        else:
+            db.session.execute(sa.delete(pending).where(pending.c.user_id == user_id))
+        db.session.commit()
+        return bool(removed or added)
+
+    @classmethod
+    def apply_pending(cls, max_pairs=200000, pause=0.0):
+        """Count every queued archive change. Returns the number of users caught up"""
+        user_ids = db.session.execute(db.select(BookCoReadPending.user_id).order_by(BookCoReadPending.user_id)).scalars().all()
+        for user_id in user_ids:
+            while cls.apply_user(user_id, max_pairs):
+                if pause:
+                    time.sleep(pause)
+        return len(user_ids)
+
+    @classmethod
+    def rebuild(cls, k=CO_READS_K, chunk_size=10000):
+        """Recompute both tables from user_books in one vectorized pass, nothing left queued. Returns (pairs, books with a list)"""
+        from .userbook import UserBook
+
+        archive = np.asarray(db.session.execute(db.select(UserBook.user_id, UserBook.book_id)).all(), dtype=np.int64).reshape(-1, 2)
+        books, others, readers = co_occurrence(archive[:, 0], archive[:, 1])
+        ranks = top_k_ranks(books, others, readers, k)
+        top = ranks > 0
+
+        db.session.execute(sa.delete(BookCoReadTop.__table__))
+        db.session.execute(sa.delete(cls.__table__))
+        db.session.execute(sa.delete(BookCoReadArchive.__table__))
+        db.session.execute(sa.delete(BookCoReadPending.__table__))
+        db.session.execute(sa.insert(BookCoReadArchive.__table__).from_select(
+            ["user_id", "book_id"], db.select(UserBook.user_id, UserBook.book_id)
+        ))
+        columns = {"book_id": books, "other_id": others, "readers": readers}
+        _insert_columns(cls.__table__, columns, chunk_size)
+        _insert_columns(BookCoReadTop.__table__, {**{name: values[top] for name, values in columns.items()}, "rank": ranks[top]}, chunk_size)
+        db.session.commit()
+        return len(books), len(np.unique(books))
+
+
+class BookCoReadTop(db.Model):
+    """The first CO_READS_K books of each row of BookCoRead, most shared readers first; pages read these lists as they are"""
+    __tablename__ = "book_co_read_top"
+
+    book_id: Mapped[int] = mapped_column(ForeignKey("books.id", ondelete="CASCADE"), primary_key=True)
+    rank: Mapped[int] = mapped_column(db.SmallInteger, primary_key=True)
+    other_id: Mapped[int] = mapped_column(ForeignKey("books.id", ondelete="CASCADE"), index=True)
+    readers: Mapped[int] = mapped_column(db.Integer, nullable=False)
+
+    @classmethod
+    def listing(cls, pairs):
+        """Ids of the books whose list shows one of the (book_id, other_id) pairs of the select pairs"""
+        pairs = pairs.subquery()
+        return db.session.execute(
+            db.select(cls.book_id).distinct()
+            .join(pairs, sa.and_(pairs.c.book_id == cls.book_id, pairs.c.other_id == cls.other_id))
+        ).scalars().all()
+
+    @classmethod
+    def reached_by(cls, pairs, k=CO_READS_K):
+        """
+        Ids of the books whose list a just incremented pair is in or now gets into: the other book is listed already,
+        the list is shorter than k, or the pair now sorts before the k-th entry (more readers, or as many and a smaller id,
+        the order of refresh()). A tie that stays behind the k-th entry changes nothing and is skipped.
+        """
+        pairs = pairs.subquery()
+        counts, kth = BookCoRead, aliased(cls)
+        listed = sa.exists().where(cls.book_id == pairs.c.book_id, cls.other_id == pairs.c.other_id)
+        return db.session.execute(
+            db.select(pairs.c.book_id).distinct()
+            .join(counts, sa.and_(counts.book_id == pairs.c.book_id, counts.other_id == pairs.c.other_id))
+            .outerjoin(kth, sa.and_(kth.book_id == pairs.c.book_id, kth.rank == k))
+            .where(sa.or_(
+                listed,
+                kth.book_id.is_(None),
+                counts.readers > kth.readers,
+                sa.and_(counts.readers == kth.readers, counts.other_id < kth.other_id),
+            ))
+        ).scalars().all()
+
+    @classmethod
+    def refresh(cls, book_ids, k=CO_READS_K, chunk_size=1000):
+        """Rebuild the lists of book_ids from BookCoRead with ROW_NUMBER, two statements per chunk_size books"""
+        book_ids = list(book_ids)
+        for start in range(0, len(book_ids), chunk_size):
+            cls._refresh(book_ids[start:start + chunk_size], k)
+
+    @classmethod
+    def _refresh(cls, book_ids, k):
+        counts = BookCoRead
+        ranked = db.select(
+            counts.book_id,
+            sa.func.row_number().over(partition_by=counts.book_id, order_by=(counts.readers.desc(), counts.other_id)).label("rank"),
+            counts.other_id,
+            counts.readers,
+        ).where(counts.book_id.in_(book_ids)).subquery()
+        db.session.execute(sa.delete(cls.__table__).where(cls.__table__.c.book_id.in_(book_ids)))
+        db.session.execute(sa.insert(cls.__table__).from_select(
+            ["book_id", "rank", "other_id", "readers"],
+            db.select(ranked.c.book_id, ranked.c.rank, ranked.c.other_id, ranked.c.readers).where(ranked.c.rank <= k),
+        ))
+
+    @classmethod
+    def lists_for(cls, book_ids, limit=3, exclude=frozenset()):
+        """{book_id: [(id, name, readers)]} for the books of a page in one query, skipping the books in exclude"""
+        from .book import Book
+
+        if not book_ids:
+            return {}
+        rows = db.session.execute(
+            db.select(cls.book_id, Book.id, Book.name, cls.readers)
+            .join(Book, Book.id == cls.other_id)
+            .where(cls.book_id.in_(book_ids), cls.rank <= (CO_READS_K if exclude else limit))
+            .order_by(cls.book_id, cls.rank)
+        ).all()
+        lists = {}
+        for book_id, other_id, name, readers in rows:
+            items = lists.setdefault(book_id, [])
+            if other_id not in exclude and len(items) < limit:
+                items.append((other_id, name, readers))
+        return lists
+
+
+def co_occurrence(user_ids, book_ids):
+    """
+    (book, other book, readers) for every pair of different books that share at least one reader:
+    the non-zero off-diagonal entries of A.T @ A, A being the sparse user x book archive matrix.
+    """
+    if len(book_ids) == 0:
+        return (np.zeros(0, dtype=np.int64),) * 3
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    books, book_index = np.unique(book_ids, return_inverse=True)
+    if sparse is not None:
+        matrix = sparse.csr_matrix((np.ones(len(book_index), dtype=np.int64), (user_index, book_index)), shape=(len(users), len(books)))
+        product = (matrix.T @ matrix).tocoo()
+        rows, cols, counts = product.row, product.col, product.data
+    else:
+        # Every ordered pair of books of each archive, encoded as one integer and counted
+        order = np.argsort(user_index, kind="stable")
+        archives = np.split(book_index[order], np.flatnonzero(np.diff(user_index[order])) + 1)
+        keys = np.concatenate([(archive[:, None] * len(books) + archive[None, :]).ravel() for archive in archives])
+        keys, counts = np.unique(keys, return_counts=True)
+        rows, cols = np.divmod(keys, len(books))
+    keep = rows != cols
+    return books[rows[keep]], books[cols[keep]], np.asarray(counts[keep], dtype=np.int64)
+
+
+def top_k_ranks(books, others, readers, k):
+    """1-based rank of each pair within its book (most readers first, then by id); 0 beyond k"""
+    order = np.lexsort((others, -readers, books))
+    sorted_books = books[order]
+    starts = np.flatnonzero(np.r_[True, sorted_books[1:] != sorted_books[:-1]])
+    group_start = np.repeat(starts, np.diff(np.r_[starts, len(sorted_books)]))
+    ranks = np.empty(len(books), dtype=np.int64)
+    ranks[order] = np.arange(len(sorted_books)) - group_start + 1
+    return np.where(ranks <= k, ranks, 0)
+
+
+def _insert_columns(table, columns, chunk_size):
+    names = list(columns)
+    for start in range(0, len(columns[names[0]]), chunk_size):
+        values = [
+            dict(zip(names, row))
+            for row in zip(*(columns[name][start:start + chunk_size].tolist() for name in names))
+        ]
+        db.session.execute(sa.insert(table), values)
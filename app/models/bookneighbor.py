@@ -0,0 +1,36 @@
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import ForeignKey
+from typing import TYPE_CHECKING
+from db.base import db
+
+if TYPE_CHECKING:
+    from .book import Book
+
+class BookNeighbor(db.Model):
+    """
+    Precomputed "similar books": the top-k nearest books of each book by embedding cosine similarity,
+    one row per (book, rank). Filled by tools/book_index.py (flask refresh-similar).
+    """
+    __tablename__ = "book_neighbors"
+
+    # (book_id, rank) is the primary key, so the neighbors of a book are one short index range scan
+    book_id: Mapped[int] = mapped_column(ForeignKey("books.id", ondelete="CASCADE"), primary_key=True)
+    rank: Mapped[int] = mapped_column(db.SmallInteger, primary_key=True)
+    # Books whose neighbor was deleted lose that row and are recomputed by the next refresh
+    neighbor_id: Mapped[int] = mapped_column(ForeignKey("books.id", ondelete="CASCADE"), index=True)
+    score: Mapped[float] = mapped_column(db.Float, nullable=False)
+
+    neighbor: Mapped["Book"] = relationship("Book", foreign_keys=[neighbor_id])
+
+    @classmethod
+    def neighbors_of(cls, book_id):
+        """[(book, score)] most similar first, in one query"""
+        from .book import Book
+
+        stmt = (
+            db.select(Book, cls.score)
+            .join(cls, cls.neighbor_id == Book.id)
+            .where(cls.book_id == book_id)
+            .order_by(cls.rank)
+        )
+        return db.session.execute(stmt).tuples().all()
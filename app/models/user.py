@@ -1,8 +1,12 @@
-from sqlalchemy.orm import Mapped, mapped_column, validates, relationship
+from sqlalchemy.orm import Mapped, mapped_column, validates, relationship, selectinload
 from flask import flash
 from typing import Optional, TYPE_CHECKING, List
+import sqlalchemy as sa
 from sqlalchemy import Integer, String, ForeignKey
 from db.base import db
+from db.dialects import dialect_insert
+from db.versioning import get_archive_version, mark_archive_changed
+from utils.lru_cache import LRUCache
 import re
 
 # Prevent circular import
@@ -11,19 +15,29 @@ if TYPE_CHECKING:
     # from .book import Book
     from .userbook import UserBook
 
+# (user_id, ArchiveVersion counter) -> frozenset of the book ids in the archive. Every archive change
+# bumps the counter in the database, so no worker can serve a set older than the version it has just read;
+# entries of old versions are never read again and age out of the LRU.
+archive_book_ids_cache = LRUCache(max_entries=10000)
+
 class User(db.Model):
     """Create a model class"""
     __tablename__ = "users"
 
     id: Mapped[int] = mapped_column(db.Integer, primary_key=True, autoincrement=True)
-    name: Mapped[str] = mapped_column(db.String(30), unique=False, nullable=False)
+    name: Mapped[str] = mapped_column(db.String(30), unique=False, nullable=False, index=True)
     email: Mapped[str] = mapped_column(db.String(50), unique=True, nullable=True)
     username: Mapped[str] = mapped_column(db.String(50), unique=True, nullable=False)
     password: Mapped[str] = mapped_column(db.String(50), unique=False, nullable=False)
+    # Set before a chunked purge starts; such a user is hidden and can no longer log in (see db.purge)
+    deleting: Mapped[bool] = mapped_column(db.Boolean, nullable=False, default=False, server_default=sa.false())
     # is_active: Mapped[bool] = mapped_column(db.Bool, unique=False, nullable=False, default=False)
     
     # Relationship to UserBook (each user has more user_books)
-    user_books: Mapped[List["UserBook"]] = relationship("UserBook", back_populates="user")
+    # passive_deletes: the database cascade removes the archive, the ORM does not load it to delete row by row
+    user_books: Mapped[List["UserBook"]] = relationship(
+        "UserBook", back_populates="user", cascade="all, delete-orphan", passive_deletes=True
+    )
 
     @validates('name')
     def validate_name(self, key, name):
@@ -48,6 +62,38 @@ class User(db.Model):
         if len(password) < 8:
             raise ValueError("Invalid password (Password length must more than or equal 8 letters and does not contain special symbol)")
         return password
+    @classmethod
+    def archive_book_ids(cls, user_id):
+        """
+        Ids of all books in the user's archive. Costs the read of the user's ArchiveVersion (shared with the
+        page ETag within a request) and no archive query while the set of that version is cached.
+        """
+        from .userbook import UserBook
+
+        key = (user_id, get_archive_version(user_id)[0])
+        book_ids = archive_book_ids_cache.get(key)
+        if book_ids is None:
+            # Read after the version, so the set is never older than its key; a change committed in between
+            # only puts a newer set under the older key, and later requests read the newer version anyway
+            book_ids = frozenset(db.session.execute(db.select(UserBook.book_id).where(UserBook.user_id == user_id)).scalars())
+            archive_book_ids_cache.set(key, book_ids)
+        return book_ids
+
+    @classmethod
+    def archive_loader(cls):
+        """Loader option: user_books and their books in two extra queries for any number of users"""
+        from .userbook import UserBook
+        return selectinload(cls.user_books).joinedload(UserBook.book)
+
+    @classmethod
+    def select_active(cls):
+        """Users that are not being deleted"""
+        return db.select(cls).where(cls.deleting == sa.false())
+
+    @classmethod
+    def select_with_archive(cls):
+        return cls.select_active().options(cls.archive_loader())
+
     # добавлять книги в каталог,
     # редактировать сведения,
     # удалять записи,
@@ -63,42 +109,154 @@ class User(db.Model):
         from .book import Book
         from .userbook import UserBook
 
-        if UserBook.query.filter((UserBook.user_id == self.id), (UserBook.book_id == book_id)).first() is not None:
+        # One statement: the SELECT yields no row for an unknown book, the unique index skips duplicates
+        stmt = dialect_insert(UserBook.__table__).from_select(
+            ["user_id", "book_id"],
+            db.select(sa.literal(self.id), Book.id).where(Book.id == book_id),
+        ).on_conflict_do_nothing(index_elements=["user_id", "book_id"])
+        if db.session.execute(stmt).rowcount:
+            mark_archive_changed(self.id)
+            db.session.commit()
+        else:
+            # ON CONFLICT DO NOTHING wrote nothing: no rollback, the caller's pending changes stay in the session
+            if db.session.get(Book, book_id) is None:
+                raise ValueError("Book id is not invalid")
             flash("This book is already in your archive!", "warning")
-            return
-
-        if Book.query.get(book_id) is None:
-            raise ValueError("Book id is not invalid")
-        
-        new_user_book = UserBook(user_id = self.id, book_id = book_id)
-        db.session.add(new_user_book)
-        db.session.commit()
 
     def remove_from_archive(self, book_id):
         from .userbook import UserBook
-        # userbook = db.session.execute(db.select(UserBook).filter(UserBook.id == userbook_id)).scalar()
-        userbook = UserBook.query.filter((UserBook.user_id == self.id), (UserBook.book_id == book_id)).first()
-        if userbook:
-            db.session.delete(userbook)
-            db.session.commit()
-        else:
+
+        entry = db.select(UserBook.id).where(UserBook.user_id == self.id, UserBook.book_id == book_id)
+        # Checked first: nothing is written (and nothing of the caller's is rolled back) for a book not in the archive
+        if db.session.execute(entry).first() is None:
             raise ValueError("Book was not finded!")
+        db.session.execute(db.delete(UserBook).where(UserBook.user_id == self.id, UserBook.book_id == book_id))
+        mark_archive_changed(self.id)
+        db.session.commit()
 
     def remove_all_from_archive(self):
-        for userbook in self.user_books:
-            db.session.delete(userbook)
-            # db.session.flush()
+        from .userbook import UserBook
+
+        db.session.execute(db.delete(UserBook).where(UserBook.user_id == self.id))
+        mark_archive_changed(self.id)
         db.session.commit()
 
-    def update_reading_status(self, book_id):
-        from .userbook import UserBook
+    @classmethod
+    def delete_by_id(cls, user_id):
+        """
+        Delete the user with db.purge.purge_user: the archive goes in chunks, then the user.
+        Returns the number of archive rows deleted.
+        """
+        from db.purge import purge_user
 
-        statuses = {"unread": "reading", "reading": "completed", "completed": "unread"}
-        user_book = UserBook.query.filter_by(user_id = self.id, book_id = book_id).first()
+        return purge_user(user_id, pause=0)
 
-        user_book.reading_status = statuses[user_book.reading_status]
+    def update_reading_status(self, book_id):
+        from .userbook import UserBook, READING_STATUS_CYCLE
+
+        result = db.session.execute(
+            db.update(UserBook)
+            .where(UserBook.user_id == self.id, UserBook.book_id == book_id)
+            .values(reading_status=sa.case(READING_STATUS_CYCLE, value=UserBook.reading_status, else_=UserBook.reading_status))
+        )
+        if result.rowcount == 0:
+            raise ValueError("Book was not finded!")
+        mark_archive_changed(self.id)
         db.session.commit()
 
-        
+    def apply_archive_operations(self, operations):
+        """
+        Apply a batch of archive operations in one transaction with one statement per kind:
+            {"op": "add", "book_id": 1}
+            {"op": "remove", "book_id": 1}
+            {"op": "set_status", "book_id": 1, "status": "reading"}
+            {"op": "set_rating", "book_id": 1, "rating": 5}
+        Kinds are applied in the order add, set_status, set_rating, remove, so one batch can add a book
+        and rate it. An operation that would have to run before an earlier operation on the same book
+        (e.g. add after remove) is rejected, so the outcome is always that of the request order.
+        Returns one {"index", "op", "book_id", "ok", "error"} result per operation.
+        """
+        from .book import Book
+        from .userbook import UserBook, READING_STATUSES, RATING_MIN, RATING_MAX
 
+        table = UserBook.__table__
+        results = [{"index": index, "op": None, "book_id": None, "ok": False, "error": None} for index in range(len(operations))]
+        # kind -> {book_id: [indexes]}, values -> {book_id: new value}
+        pending = {"add": {}, "set_status": {}, "set_rating": {}, "remove": {}}
+        values = {"set_status": {}, "set_rating": {}}
+        # Position of each kind in the execution order; book_id -> highest position requested so far
+        stage = {"add": 0, "set_status": 1, "set_rating": 1, "remove": 2}
+        latest_stage = {}
 
+        for index, operation in enumerate(operations):
+            result = results[index]
+            if not isinstance(operation, dict):
+                result["error"] = "Operation must be an object"
+                continue
+            kind, book_id = operation.get("op"), operation.get("book_id")
+            result.update(op=kind, book_id=book_id)
+            if kind not in pending:
+                result["error"] = f"Unknown op, expected one of {', '.join(pending)}"
+            elif not isinstance(book_id, int) or isinstance(book_id, bool):
+                result["error"] = "book_id must be an integer"
+            elif kind == "set_status" and operation.get("status") not in READING_STATUSES:
+                result["error"] = f"status must be one of {', '.join(READING_STATUSES)}"
+            elif kind == "set_rating" and (
+                not isinstance(operation.get("rating"), int) or isinstance(operation.get("rating"), bool)
+                or not RATING_MIN <= operation["rating"] <= RATING_MAX
+            ):
+                result["error"] = f"rating must be an integer from {RATING_MIN} to {RATING_MAX}"
+            elif stage[kind] < latest_stage.get(book_id, 0):
+                result["error"] = "Conflicts with an earlier operation on the same book, send it in a separate batch"
+            else:
+                latest_stage[book_id] = stage[kind]
+                pending[kind].setdefault(book_id, []).append(index)
+                if kind in values:
+                    # The last operation on the same book wins
+                    values[kind][book_id] = operation["status" if kind == "set_status" else "rating"]
+
+        def settle(kind, done, error):
+            for book_id, indexes in pending[kind].items():
+                for index in indexes:
+                    results[index]["ok"] = book_id in done
+                    results[index]["error"] = None if book_id in done else error
+
+        def mine(book_ids):
+            return sa.and_(table.c.user_id == self.id, table.c.book_id.in_(book_ids))
+
+        try:
+            if pending["add"]:
+                book_ids = list(pending["add"])
+                stmt = dialect_insert(table).from_select(
+                    ["user_id", "book_id", "reading_status", "rating"],
+                    db.select(sa.literal(self.id), Book.id, sa.literal("unread"), sa.literal(0)).where(Book.id.in_(book_ids)),
+                ).on_conflict_do_nothing(index_elements=["user_id", "book_id"]).returning(table.c.book_id)
+                added = set(db.session.execute(stmt).scalars())
+                existing = set(db.session.execute(db.select(Book.id).where(Book.id.in_(set(book_ids) - added))).scalars())
+                settle("add", added, "Book not found")
+                for book_id in existing:
+                    for index in pending["add"][book_id]:
+                        results[index]["error"] = "Book is already in the archive"
+
+            for kind, column in (("set_status", table.c.reading_status), ("set_rating", table.c.rating)):
+                if pending[kind]:
+                    stmt = (
+                        sa.update(table)
+                        .where(mine(list(values[kind])))
+                        .values({column: sa.case(values[kind], value=table.c.book_id)})
+                        .returning(table.c.book_id)
+                    )
+                    settle(kind, set(db.session.execute(stmt).scalars()), "Book is not in the archive")
+
+            if pending["remove"]:
+                stmt = sa.delete(table).where(mine(list(pending["remove"]))).returning(table.c.book_id)
+                settle("remove", set(db.session.execute(stmt).scalars()), "Book is not in the archive")
+
+            # A batch where every operation failed wrote nothing: no version bump, nothing to recount
+            if any(result["ok"] for result in results):
+                mark_archive_changed(self.id)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return results
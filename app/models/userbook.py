@@ -1,4 +1,4 @@
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy.orm import Mapped, mapped_column, relationship, joinedload, validates
 from sqlalchemy import ForeignKey
 from typing import Optional, TYPE_CHECKING
 from db.base import db
@@ -7,12 +7,18 @@ if TYPE_CHECKING:
     from .user import User
     from .book import Book
 
+# Next reading status when the user clicks the status link
+READING_STATUS_CYCLE = {"unread": "reading", "reading": "completed", "completed": "unread"}
+READING_STATUSES = tuple(READING_STATUS_CYCLE)
+RATING_MIN, RATING_MAX = 0, 5
+
 class UserBook(db.Model):
     __tablename__ = "user_books"
     
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
-    book_id: Mapped[int] = mapped_column(ForeignKey("books.id"))
+    # Rows go away with their user or book in the same DELETE (PRAGMA foreign_keys=ON on SQLite, see db/session.py)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    book_id: Mapped[int] = mapped_column(ForeignKey("books.id", ondelete="CASCADE"), index=True)
     
     # user personal information with these columns
     reading_status: Mapped[str] = mapped_column(db.String(20), default="unread", nullable=False)
@@ -22,7 +28,25 @@ class UserBook(db.Model):
     user: Mapped["User"] = relationship("User", back_populates="user_books")
     book: Mapped["Book"] = relationship("Book", back_populates="user_books")
     
-    # each couple (user_id, book_id) is unique
-    # __table_args__ = (
-    #     db.UniqueConstraint('user_id', 'book_id', name='uq_user_book'),
-    # )
\ No newline at end of file
+    # each couple (user_id, book_id) is unique; the index also serves every lookup by user_id
+    __table_args__ = (
+        db.Index("ix_user_books_user_id_book_id", "user_id", "book_id", unique=True),
+    )
+
+    @validates("reading_status")
+    def validate_reading_status(self, key, reading_status):
+        if reading_status not in READING_STATUSES:
+            raise ValueError("Invalid reading status")
+        return reading_status
+
+    @validates("rating")
+    def validate_rating(self, key, rating):
+        if not isinstance(rating, int) or isinstance(rating, bool) or not RATING_MIN <= rating <= RATING_MAX:
+            raise ValueError(f"Rating must be an integer from {RATING_MIN} to {RATING_MAX}")
+        return rating
+
+    @classmethod
+    def archive_of(cls, user_id):
+        """The user's archive with the books joined in the same query"""
+        stmt = db.select(cls).options(joinedload(cls.book)).where(cls.user_id == user_id).order_by(cls.id)
+        return db.session.execute(stmt).scalars().all()
@@ -0,0 +1,144 @@
+"""
+POST /user/<id>/archive/batch and User.apply_archive_operations: per-operation results,
+conflicting operations on the same book, the batch size limit and malformed bodies. Run from app/:
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "archive_batch.db")
+
+import app as application  # noqa: E402
+from db.base import db  # noqa: E402
+from db.seed import seed_catalog  # noqa: E402
+from models.archiveversion import ArchiveVersion  # noqa: E402
+from models.book import Book  # noqa: E402
+from models.user import User  # noqa: E402
+from models.userbook import UserBook  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def book_ids():
+    with application.app.app_context():
+        seed_catalog()
+        return db.session.execute(db.select(Book.id).order_by(Book.id).limit(3)).scalars().all()
+
+
+@pytest.fixture
+def user_id(book_ids):
+    with application.app.app_context():
+        user = User(name="batcher", email="batcher@example.com", username="batcher", password="password1")
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+    yield user_id
+    with application.app.app_context():
+        User.delete_by_id(user_id)
+
+
+@pytest.fixture
+def client(user_id):
+    client = application.app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = user_id
+    return client
+
+
+def archive(user_id):
+    with application.app.app_context():
+        rows = db.session.execute(
+            db.select(UserBook.book_id, UserBook.reading_status, UserBook.rating).where(UserBook.user_id == user_id)
+        ).all()
+    return {book_id: (status, rating) for book_id, status, rating in rows}
+
+
+def post_batch(client, user_id, operations):
+    return client.post(f"/user/{user_id}/archive/batch", json={"operations": operations})
+
+
+def test_results_per_operation(client, user_id, book_ids):
+    first, second, _ = book_ids
+    response = post_batch(client, user_id, [
+        {"op": "add", "book_id": first},
+        {"op": "set_status", "book_id": first, "status": "reading"},
+        {"op": "set_rating", "book_id": first, "rating": 4},
+        {"op": "add", "book_id": 10 ** 9},
+        {"op": "remove", "book_id": second},
+        {"op": "set_rating", "book_id": first, "rating": 9},
+        {"op": "lend", "book_id": first},
+        "add",
+    ])
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [result["ok"] for result in body["results"]] == [True, True, True, False, False, False, False, False]
+    assert (body["applied"], body["failed"]) == (3, 5)
+    errors = [result["error"] for result in body["results"]]
+    assert errors[3] == "Book not found"
+    assert errors[4] == "Book is not in the archive"
+    assert errors[5].startswith("rating must be")
+    assert errors[6].startswith("Unknown op")
+    assert errors[7] == "Operation must be an object"
+    assert archive(user_id) == {first: ("reading", 4)}
+
+    # Adding it again is reported per item and changes nothing
+    body = post_batch(client, user_id, [{"op": "add", "book_id": first}]).get_json()
+    assert body["results"][0] == {"index": 0, "op": "add", "book_id": first, "ok": False, "error": "Book is already in the archive"}
+
+
+def test_conflicting_operations_on_one_book(client, user_id, book_ids):
+    first, second, _ = book_ids
+    body = post_batch(client, user_id, [
+        {"op": "add", "book_id": first},
+        {"op": "remove", "book_id": first},
+        # Would have to run before the remove above
+        {"op": "add", "book_id": first},
+        {"op": "set_status", "book_id": first, "status": "completed"},
+        {"op": "add", "book_id": second},
+        {"op": "set_status", "book_id": second, "status": "reading"},
+        {"op": "set_status", "book_id": second, "status": "completed"},
+    ]).get_json()
+    assert [result["ok"] for result in body["results"]] == [True, True, False, False, True, True, True]
+    assert body["results"][2]["error"].startswith("Conflicts with an earlier operation")
+    assert body["results"][3]["error"].startswith("Conflicts with an earlier operation")
+    # The last status of the same book wins, the removed book is gone
+    assert archive(user_id) == {second: ("completed", 0)}
+
+
+def test_failed_batch_does_not_bump_the_archive_version(client, user_id, book_ids):
+    with application.app.app_context():
+        before = ArchiveVersion.get(user_id)
+    body = post_batch(client, user_id, [{"op": "remove", "book_id": book_ids[0]}, {"op": "add", "book_id": 10 ** 9}]).get_json()
+    assert body["applied"] == 0
+    with application.app.app_context():
+        assert ArchiveVersion.get(user_id) == before
+
+
+def test_batch_size_limit(client, user_id, book_ids):
+    operations = [{"op": "set_rating", "book_id": book_ids[0], "rating": 1}] * (application.MAX_ARCHIVE_BATCH + 1)
+    response = post_batch(client, user_id, operations)
+    assert response.status_code == 400
+    assert "At most" in response.get_json()["error"]
+    assert post_batch(client, user_id, operations[:application.MAX_ARCHIVE_BATCH]).status_code == 200
+
+
+@pytest.mark.parametrize("data, content_type", [
+    ("add 1", "text/plain"),
+    ("{not json", "application/json"),
+    ('[{"op": "add", "book_id": 1}]', "application/json"),
+    ('{"operations": {"op": "add"}}', "application/json"),
+])
+def test_malformed_bodies(client, user_id, data, content_type):
+    response = client.post(f"/user/{user_id}/archive/batch", data=data, content_type=content_type)
+    assert response.status_code == 400
+    assert "operations" in response.get_json()["error"]
+    assert archive(user_id) == {}
+
+
+def test_other_users_archive_is_refused(client, user_id, book_ids):
+    response = post_batch(client, user_id + 1, [{"op": "add", "book_id": book_ids[0]}])
+    assert response.status_code == 403
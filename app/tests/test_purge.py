@@ -0,0 +1,101 @@
+"""
+db.purge: chunked user deletes, the rows that go with the user, and resuming a purge that was cut off. Run from app/:
+
+    python -m pytest -q tests
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "purge.db")
+
+import app as application  # noqa: E402
+from db.base import db  # noqa: E402
+from db.co_reads import apply_pending  # noqa: E402
+from db.purge import mark_for_deletion, pending_purges, purge_user, resume_pending_purges  # noqa: E402
+from models.archiveversion import ArchiveVersion  # noqa: E402
+from models.book import Book  # noqa: E402
+from models.bookcoread import BookCoRead, BookCoReadArchive, BookCoReadPending, BookCoReadTop  # noqa: E402
+from models.user import User  # noqa: E402
+from models.userbook import UserBook  # noqa: E402
+
+
+@pytest.fixture
+def books():
+    with application.app.app_context():
+        db.create_all()
+        books = [
+            Book(name=f"Purged shelf {number}", author="Author", category="Category",
+                 describe=f"Purged shelf describe {number}", publication_year=2000)
+            for number in range(3)
+        ]
+        db.session.add_all(books)
+        db.session.commit()
+        book_ids = [book.id for book in books]
+    yield book_ids
+    with application.app.app_context():
+        for book_id in book_ids:
+            Book.delete_by_id(book_id)
+
+
+def make_user(username, book_ids):
+    user = User(name=username, email=f"{username}@example.com", username=username, password="password1")
+    db.session.add(user)
+    db.session.commit()
+    for book_id in book_ids:
+        user.add_to_archive(book_id)
+    return user.id
+
+
+def co_reads(book_ids):
+    return dict(((book_id, other_id), readers) for book_id, other_id, readers in db.session.execute(
+        db.select(BookCoRead.book_id, BookCoRead.other_id, BookCoRead.readers).where(BookCoRead.book_id.in_(book_ids))
+    ))
+
+
+def count(model, *where):
+    return db.session.execute(db.select(db.func.count()).select_from(model).where(*where)).scalar_one()
+
+
+def test_purge_removes_archive_and_co_reads(books):
+    first, second, third = books
+    with application.app.test_request_context():
+        purged = make_user("purged", books)
+        kept = make_user("kept", [first, second])
+        apply_pending()
+        assert co_reads(books)[first, second] == 2
+        assert co_reads(books)[first, third] == 1
+
+        # One archive row per transaction
+        assert purge_user(purged, chunk_size=1, pause=0) == 3
+        assert db.session.get(User, purged) is None
+        assert count(UserBook, UserBook.user_id == purged) == 0
+        assert count(ArchiveVersion, ArchiveVersion.user_id == purged) == 0
+
+        apply_pending()
+        assert count(BookCoReadArchive, BookCoReadArchive.user_id == purged) == 0
+        assert count(BookCoReadPending) == 0
+        # Only the pair the other reader still has is left
+        assert co_reads(books) == {(first, second): 1, (second, first): 1}
+        assert count(BookCoReadTop, BookCoReadTop.other_id == third) == 0
+        User.delete_by_id(kept)
+
+
+def test_interrupted_purge_is_resumed(books):
+    with application.app.test_request_context():
+        user_id = make_user("interrupted", books)
+        # The process died after marking the user: hidden from the list and from login, archive intact
+        mark_for_deletion(user_id)
+        assert user_id in pending_purges()
+        assert user_id not in db.session.execute(User.select_active().with_only_columns(User.id)).scalars().all()
+
+    resume_pending_purges(application.app, pause=0).join()
+    with application.app.app_context():
+        assert pending_purges() == []
+        assert db.session.get(User, user_id) is None
+        assert count(UserBook, UserBook.user_id == user_id) == 0
+        apply_pending()
+        assert co_reads(books) == {}
@@ -0,0 +1,101 @@
+"""
+SQL statements per page stay constant as the number of users and archive rows grows
+(no lazy loading per row in the templates). Run from app/:
+
+    python -m pytest -q tests
+"""
+import html
+import os
+import re
+import sys
+import tempfile
+from pathlib import Path
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "query_counts.db")
+
+import app as application  # noqa: E402
+from db.base import db  # noqa: E402
+from db.query_counter import assert_max_queries  # noqa: E402
+from db.seed import seed_catalog, seed_demo_users  # noqa: E402
+from models.book import Book  # noqa: E402
+from models.user import User  # noqa: E402
+
+USERS = 12
+
+
+@pytest.fixture(scope="module")
+def client():
+    flask_app = application.app
+    with flask_app.app_context():
+        seed_catalog()
+        seed_demo_users()
+        book_ids = db.session.execute(db.select(Book.id)).scalars().all()
+        for number in range(USERS):
+            user = User(name=f"reader{number}", email=f"reader{number}@example.com",
+                        username=f"reader{number}", password=f"password{number}")
+            db.session.add(user)
+            db.session.commit()
+            for book_id in book_ids:
+                user.add_to_archive(book_id)
+        yield flask_app.test_client()
+
+
+@pytest.fixture
+def reader_id(client):
+    with application.app.app_context():
+        return db.session.execute(db.select(User.id).where(User.username == "reader0")).scalar_one()
+
+
+def test_user_list_queries(client):
+    with application.app.app_context(), assert_max_queries(2):
+        response = client.get("/users")
+    assert response.status_code == 200
+    assert b"reader11" in response.data
+
+
+def test_home_queries(client):
+    with application.app.app_context(), assert_max_queries(3):
+        response = client.get("/")
+    assert response.status_code == 200
+
+
+def test_archive_queries(client, reader_id):
+    with client.session_transaction() as session:
+        session["user_id"] = reader_id
+    with application.app.app_context(), assert_max_queries(2):
+        response = client.get(f"/user/{reader_id}/archive")
+    assert response.status_code == 200
+    assert "Мастер и Маргарита".encode() in response.data
+
+
+def test_book_list_queries(client, reader_id):
+    with client.session_transaction() as session:
+        session["user_id"] = reader_id
+    # Versions, the page rows (a fragment cache miss), the co-read lists, the archive version and book ids
+    with application.app.app_context(), assert_max_queries(5):
+        response = client.get("/books?size=4")
+    assert response.status_code == 200
+    next_page = re.search(r'href="([^"]*after=[^"]*)"', response.data.decode())
+    assert next_page is not None
+    with application.app.app_context(), assert_max_queries(5):
+        response = client.get(html.unescape(next_page.group(1)))
+    assert response.status_code == 200
+
+
+def test_book_search_queries(client):
+    # One FTS5 statement per page, with highlight() and snippet() in it
+    for page in (1, 2):
+        with application.app.app_context(), assert_max_queries(1):
+            response = client.get(f"/books/search?q=роман&size=2&page={page}")
+        assert response.status_code == 200
+        # Both pages have highlighted matches
+        assert b"<mark" in response.data
+
+
+def test_user_detail_queries(client, reader_id):
+    with application.app.app_context(), assert_max_queries(1):
+        response = client.get(f"/user/{reader_id}/detail")
+    assert response.status_code == 200
+    assert b"reader0@example.com" in response.data
@@ -0,0 +1,133 @@
+import math
+import re
+import threading
+from collections import Counter
+import numpy as np
+
+# Доля удалённых строк, после которой индекс перенумеровывает строки (иначе ids и массивы оценок растут без предела)
+COMPACT_SHARE = 0.25
+
+
+def tokenize(text):
+    """Слова в нижнем регистре, "ё" сводится к "е" (как в полнотекстовом индексе книг)"""
+    return re.findall(r"\w+", (text or "").lower().replace("ё", "е"))
+
+
+class BM25Index:
+    """
+    Инвертированный индекс BM25 в памяти процесса: термин -> {строка: частота}.
+    Документы добавляются, заменяются и удаляются по одному без перестройки индекса (удалённые строки
+    остаются пустыми, пока их не больше COMPACT_SHARE, потом строки перенумеровываются); для поиска постинги термина превращаются в массивы NumPy (и кэшируются до следующего изменения),
+    оценки всех документов накапливаются векторно.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = []           # строка -> id документа (None для удалённых)
+        self.rows = {}          # id документа -> строка
+        self.lengths = []       # строка -> число слов
+        self.doc_terms = []     # строка -> {термин: частота}
+        self.postings = {}      # термин -> {строка: частота}
+        self.total_length = 0
+        self.version = None     # версия коллекции, с которой индекс синхронизирован
+        self._arrays = {}
+        self._lengths = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add(self, ids, texts):
+        """Добавляет документы; документ с уже известным id заменяется"""
+        with self._lock:
+            self.remove([doc_id for doc_id in ids if doc_id in self.rows])
+            for doc_id, text in zip(ids, texts):
+                tokens = tokenize(text)
+                counts = Counter(tokens)
+                row = len(self.ids)
+                self.ids.append(doc_id)
+                self.rows[doc_id] = row
+                self.lengths.append(len(tokens))
+                self.doc_terms.append(counts)
+                self.total_length += len(tokens)
+                for term, tf in counts.items():
+                    self.postings.setdefault(term, {})[row] = tf
+            self._arrays.clear()
+            self._lengths = None
+
+    def remove(self, ids):
+        with self._lock:
+            for doc_id in ids:
+                row = self.rows.pop(doc_id, None)
+                if row is None:
+                    continue
+                for term in self.doc_terms[row]:
+                    postings = self.postings[term]
+                    del postings[row]
+                    if not postings:
+                        del self.postings[term]
+                self.total_length -= self.lengths[row]
+                self.ids[row], self.lengths[row], self.doc_terms[row] = None, 0, Counter()
+            if len(self.ids) - len(self.rows) > COMPACT_SHARE * len(self.ids):
+                self._compact()
+            self._arrays.clear()
+            self._lengths = None
+
+    def _compact(self):
+        """Убирает строки удалённых документов: живые строки получают номера подряд"""
+        live = [row for row, doc_id in enumerate(self.ids) if doc_id is not None]
+        renumber = {row: new for new, row in enumerate(live)}
+        self.ids = [self.ids[row] for row in live]
+        self.lengths = [self.lengths[row] for row in live]
+        self.doc_terms = [self.doc_terms[row] for row in live]
+        self.rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+        self.postings = {
+            term: {renumber[row]: tf for row, tf in postings.items()} for term, postings in self.postings.items()
+        }
+
+    def replace(self, other):
+        """Подменяет содержимое индекса индексом other, построенным отдельно (без блокировки поиска на время сборки)"""
+        with self._lock:
+            self.ids, self.rows, self.lengths = other.ids, other.rows, other.lengths
+            self.doc_terms, self.postings, self.total_length = other.doc_terms, other.postings, other.total_length
+            self.version = other.version
+            self._arrays = {}
+            self._lengths = None
+
+    def _term_arrays(self, term):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = self.postings.get(term, {})
+            arrays = (np.fromiter(postings.keys(), dtype=np.int64, count=len(postings)),
+                      np.fromiter(postings.values(), dtype=np.float64, count=len(postings)))
+            self._arrays[term] = arrays
+        return arrays
+
+    def search(self, query, k=5):
+        """
+        [(id, оценка, доля слов запроса в документе)] лучших k документов, лучшие первыми;
+        документы без общих слов с запросом не возвращаются.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            if not terms or not self.rows:
+                return []
+            if self._lengths is None:
+                self._lengths = np.asarray(self.lengths, dtype=np.float64)
+            lengths = self._lengths
+            count, average = len(self.rows), self.total_length / len(self.rows) or 1.0
+            scores = np.zeros(len(self.ids))
+            matched = np.zeros(len(self.ids), dtype=np.int64)
+            for term in terms:
+                rows, tf = self._term_arrays(term)
+                if not len(rows):
+                    continue
+                idf = math.log(1 + (count - len(rows) + 0.5) / (len(rows) + 0.5))
+                scores[rows] += idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * lengths[rows] / average))
+                matched[rows] += 1
+            found = np.flatnonzero(scores)
+            if len(found) > k:
+                found = found[np.argpartition(-scores[found], k - 1)[:k]]
+            found = found[np.argsort(-scores[found], kind="stable")]
+            return [(self.ids[row], float(scores[row]), matched[row] / len(terms)) for row in found]
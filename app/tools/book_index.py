@@ -0,0 +1,186 @@
+import hashlib
+import os
+import time
+import numpy as np
+from db.base import db
+from models.book import Book
+from models.bookneighbor import BookNeighbor
+from .rag_query import EMBEDDING_BACKEND, get_rag_embeddings, open_vectorstore
+from .registry import lazy_resource
+from .retrieval_cache import bump_collection_version
+
+# Каталог книг в своей коллекции Chroma (id = books.id), рядом с коллекцией статей ArXiv
+BOOKS_COLLECTION = os.getenv("BOOKS_COLLECTION", "books" if EMBEDDING_BACKEND == "remote" else f"books__{EMBEDDING_BACKEND}")
+# Сколько похожих книг хранится для каждой книги
+BOOK_NEIGHBORS_K = int(os.getenv("BOOK_NEIGHBORS_K", 10))
+# Ключ метаданных документа с хэшем текста книги, по нему находятся изменённые книги
+CONTENT_HASH_KEY = "content_hash"
+# Память (МБ) под один блок матрицы сходств вместе с индексами argpartition к нему
+SIMILARITY_BLOCK_MB = int(os.getenv("SIMILARITY_BLOCK_MB", 256))
+# float32 сходство + int64 индекс argpartition на каждую ячейку блока
+SIMILARITY_CELL_BYTES = 12
+
+@lazy_resource("books_vectorstore")
+def get_books_vectorstore():
+    return open_vectorstore(BOOKS_COLLECTION, get_rag_embeddings(), EMBEDDING_BACKEND)
+
+def book_text(name, author, category, describe):
+    """Текст книги, по которому считается эмбеддинг"""
+    return f"{name}. {author}. {category}. {describe}"
+
+def content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+def sync_book_vectors(collection, embeddings, batch_size=256):
+    """
+    Приводит коллекцию к таблице books: эмбеддинги считаются только для новых книг и книг с изменённым
+    текстом, документы удалённых книг убираются. Возвращает (id изменённых книг, id удалённых книг).
+    """
+    stored = collection.get(include=["metadatas"])
+    stored_hashes = {int(book_id): (metadata or {}).get(CONTENT_HASH_KEY) for book_id, metadata in zip(stored["ids"], stored["metadatas"])}
+
+    changed, present = [], set()
+    for book_id, *fields in db.session.execute(db.select(Book.id, Book.name, Book.author, Book.category, Book.describe)):
+        present.add(book_id)
+        text = book_text(*fields)
+        digest = content_hash(text)
+        if stored_hashes.get(book_id) != digest:
+            changed.append((book_id, text, digest))
+
+    for start in range(0, len(changed), batch_size):
+        batch = changed[start:start + batch_size]
+        collection.upsert(
+            ids=[str(book_id) for book_id, _, _ in batch],
+            embeddings=embeddings.embed_documents([text for _, text, _ in batch]),
+            documents=[text for _, text, _ in batch],
+            metadatas=[{CONTENT_HASH_KEY: digest} for _, _, digest in batch],
+        )
+
+    deleted = [book_id for book_id in stored_hashes if book_id not in present]
+    for start in range(0, len(deleted), 5000):
+        collection.delete(ids=[str(book_id) for book_id in deleted[start:start + 5000]])
+    if changed or deleted:
+        bump_collection_version(collection)
+    return [book_id for book_id, _, _ in changed], deleted
+
+def load_vectors(collection):
+    """(id книг, матрица нормированных векторов) всей коллекции"""
+    data = collection.get(include=["embeddings"])
+    ids = np.asarray([int(book_id) for book_id in data["ids"]], dtype=np.int64)
+    vectors = np.asarray(data["embeddings"], dtype=np.float32).reshape(len(ids), -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return ids, vectors / np.where(norms == 0, 1.0, norms)
+
+def block_rows(columns, batch_size):
+    """
+    Строк в блоке матрицы сходств с columns столбцами: не больше batch_size и столько, чтобы блок
+    поместился в SIMILARITY_BLOCK_MB (для каталога в 1М книг это десятки строк, а не 1024 x 1М = 4 ГБ).
+    """
+    return max(1, min(batch_size, SIMILARITY_BLOCK_MB * 2**20 // (max(columns, 1) * SIMILARITY_CELL_BYTES)))
+
+def top_k(vectors, rows, k, batch_size=1024):
+    """
+    k ближайших по косинусу к строкам rows (сама книга исключается), лучшие первыми.
+    Сходства считаются блоками строк (см. block_rows) одним умножением матриц, отбор - argpartition.
+    Возвращает (индексы строк соседей, оценки), обе матрицы len(rows) x k.
+    """
+    k = min(k, len(vectors) - 1)
+    neighbors = np.empty((len(rows), max(k, 0)), dtype=np.int64)
+    scores = np.empty((len(rows), max(k, 0)), dtype=np.float32)
+    if k <= 0:
+        return neighbors, scores
+    batch_size = block_rows(len(vectors), batch_size)
+    for start in range(0, len(rows), batch_size):
+        block = rows[start:start + batch_size]
+        similarity = vectors[block] @ vectors.T
+        similarity[np.arange(len(block)), block] = -np.inf
+        # k лучших - последние k после разбиения по (N-k)-му элементу; без копии -similarity
+        top = np.argpartition(similarity, kth=len(vectors) - k, axis=1)[:, -k:]
+        top_scores = np.take_along_axis(similarity, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        neighbors[start:start + len(block)] = np.take_along_axis(top, order, axis=1)
+        scores[start:start + len(block)] = np.take_along_axis(top_scores, order, axis=1)
+    return neighbors, scores
+
+def affected_rows(ids, vectors, changed, deleted, k, batch_size=1024):
+    """
+    Строки, чей список соседей мог измениться:
+        `сами изменённые и новые книги`,
+        `книги, у которых в соседях изменённая или удалённая книга (удалённые соседи уже убраны каскадом)`,
+        `книги с неполным списком (новые в таблице или потерявшие соседа)`,
+        `книги, к которым изменённая книга ближе их k-го соседа`.
+    Остальные списки остаются верными, их пересчёт не нужен.
+    """
+    row_of = {book_id: row for row, book_id in enumerate(ids.tolist())}
+    expected = min(k, len(ids) - 1)
+    affected = np.zeros(len(ids), dtype=bool)
+    changed_rows = np.asarray([row_of[book_id] for book_id in changed if book_id in row_of], dtype=np.int64)
+    affected[changed_rows] = True
+
+    stale = list(changed) + list(deleted)
+    for start in range(0, len(stale), 1000):
+        for (book_id,) in db.session.execute(
+            db.select(BookNeighbor.book_id).where(BookNeighbor.neighbor_id.in_(stale[start:start + 1000])).distinct()
+        ):
+            if book_id in row_of:
+                affected[row_of[book_id]] = True
+
+    counts = np.zeros(len(ids), dtype=np.int64)
+    kth_scores = np.full(len(ids), -np.inf, dtype=np.float32)
+    for book_id, count, kth_score in db.session.execute(
+        db.select(BookNeighbor.book_id, db.func.count(), db.func.min(BookNeighbor.score)).group_by(BookNeighbor.book_id)
+    ):
+        if book_id in row_of:
+            counts[row_of[book_id]] = count
+            kth_scores[row_of[book_id]] = kth_score
+    affected |= counts < expected
+
+    if len(changed_rows):
+        changed_vectors = vectors[changed_rows]
+        batch_size = block_rows(len(changed_rows), batch_size)
+        for start in range(0, len(ids), batch_size):
+            best = (vectors[start:start + batch_size] @ changed_vectors.T).max(axis=1)
+            affected[start:start + batch_size] |= best > kth_scores[start:start + batch_size]
+    return np.flatnonzero(affected)
+
+def write_neighbors(ids, rows, neighbors, scores, chunk_size=1000):
+    """Заменяет списки соседей книг rows, по chunk_size книг в транзакции"""
+    for start in range(0, len(rows), chunk_size):
+        book_ids = ids[rows[start:start + chunk_size]].tolist()
+        db.session.execute(db.delete(BookNeighbor).where(BookNeighbor.book_id.in_(book_ids)))
+        values = [
+            {"book_id": book_id, "rank": rank, "neighbor_id": int(ids[neighbor]), "score": float(score)}
+            for book_id, row_neighbors, row_scores in zip(book_ids, neighbors[start:start + chunk_size], scores[start:start + chunk_size])
+            for rank, (neighbor, score) in enumerate(zip(row_neighbors, row_scores), 1)
+        ]
+        if values:
+            db.session.execute(db.insert(BookNeighbor), values)
+        db.session.commit()
+
+def refresh_book_neighbors(k=BOOK_NEIGHBORS_K, full=False, batch_size=1024):
+    """
+    Обновляет коллекцию книг и таблицу book_neighbors. По умолчанию инкрементально: эмбеддинги только
+    для новых/изменённых книг, соседи только для затронутых ими книг (см. affected_rows); full=True
+    пересчитывает соседей всех книг. Возвращает статистику прогона.
+    """
+    started = time.perf_counter()
+    collection = get_books_vectorstore()._collection
+    changed, deleted = sync_book_vectors(collection, get_rag_embeddings())
+    embedded = time.perf_counter()
+
+    ids, vectors = load_vectors(collection)
+    if full or db.session.execute(db.select(BookNeighbor.book_id).limit(1)).first() is None:
+        rows = np.arange(len(ids))
+    else:
+        rows = affected_rows(ids, vectors, changed, deleted, k, batch_size)
+    neighbors, scores = top_k(vectors, rows, k, batch_size)
+    write_neighbors(ids, rows, neighbors, scores)
+
+    return {
+        "books": len(ids),
+        "embedded": len(changed),
+        "deleted": len(deleted),
+        "recomputed": len(rows),
+        "embed_seconds": embedded - started,
+        "neighbor_seconds": time.perf_counter() - embedded,
+    }
@@ -0,0 +1,69 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+
+
+class EmbeddingCache:
+    """
+    Постоянный кэш эмбеддингов в отдельном файле SQLite.
+    Ключ - sha256 от (модель, текст), значение - вектор float32, поэтому неизменённый
+    текст при повторной загрузке или повторном запросе не отправляется в API.
+    """
+
+    def __init__(self, path="instance/embedding_cache.db"):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL)"
+        )
+
+    def _connect(self):
+        # Соединение sqlite3 нельзя передавать между потоками, у каждого потока своё
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def key(model, text):
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model, texts):
+        """Возвращает {текст: вектор} для текстов, которые уже есть в кэше"""
+        keys = {self.key(model, text): text for text in texts}
+        found = {}
+        key_list = list(keys)
+        # Не больше 500 параметров в одном запросе
+        for start in range(0, len(key_list), 500):
+            chunk = key_list[start:start + 500]
+            rows = self._connect().execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for key, vector in rows:
+                values = array("f")
+                values.frombytes(vector)
+                found[keys[key]] = values.tolist()
+        return found
+
+    def put_many(self, model, vectors):
+        """Сохраняет {текст: вектор}"""
+        rows = [(self.key(model, text), model, array("f", vector).tobytes()) for text, vector in vectors.items()]
+        connection = self._connect()
+        connection.execute("BEGIN")
+        try:
+            connection.executemany("INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)", rows)
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def get(self, model, text):
+        return self.get_many(model, [text]).get(text)
+
+    def __len__(self):
+        return self._connect().execute("SELECT count(*) FROM embeddings").fetchone()[0]
@@ -0,0 +1,153 @@
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing_extensions import List
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from tenacity import Retrying, stop_after_attempt, wait_exponential_jitter, retry_if_exception_type
+from .embedding_cache import EmbeddingCache
+from .registry import lazy_resource
+
+# Ключ метаданных коллекции Chroma, в котором хранится имя бэкенда эмбеддингов
+EMBEDDING_BACKEND_KEY = "embedding_backend"
+
+# Реестр бэкендов эмбеддингов: имя -> фабрика
+EMBEDDING_BACKENDS = {}
+
+def register_backend(name):
+    """Декоратор для регистрации фабрики бэкенда эмбеддингов"""
+    def decorator(factory):
+        EMBEDDING_BACKENDS[name] = factory
+        return factory
+    return decorator
+
+def get_embeddings(name, **options):
+    """Создаёт эмбеддинги выбранного бэкенда"""
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{name}', available: {', '.join(sorted(EMBEDDING_BACKENDS))}")
+    return EMBEDDING_BACKENDS[name](**options)
+
+def transient_errors():
+    """Ошибки API, после которых имеет смысл повторить запрос (openai импортируется только при первом запросе)"""
+    from openai import APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
+    return (APIConnectionError, APITimeoutError, RateLimitError, InternalServerError)
+
+# Общий кэш эмбеддингов для CustomEmbeddings и get_embedding
+@lazy_resource("embedding_cache")
+def get_embedding_cache():
+    return EmbeddingCache(os.getenv("EMBEDDING_CACHE_PATH", "instance/embedding_cache.db"))
+
+# Создание экземпляра эмбеддингов
+class CustomEmbeddings(Embeddings):
+    """
+    Кастомный класс эмбеддингов для работы с API
+        `тексты отправляются пачками по batch_size`,
+        `пачки выполняются параллельно, не больше max_workers одновременно`,
+        `временные ошибки API повторяются с экспоненциальной задержкой (до max_retries попыток)`,
+        `готовые векторы сохраняются в постоянный кэш по хэшу (модель, текст)`.
+    """
+
+    def __init__(self, client, model="BAAI/bge-m3", batch_size=32, max_workers=4, max_retries=5, cache=None):
+        self.client = client
+        self.model = model
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Получение эмбеддингов для списка документов"""
+        found = self.cache.get_many(self.model, texts) if self.cache is not None else {}
+        # Одинаковые тексты отправляются один раз
+        missing = list(dict.fromkeys(text for text in texts if text not in found))
+
+        if missing:
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as pool:
+                for batch, vectors in zip(batches, pool.map(self._embed_batch, batches)):
+                    fresh = dict(zip(batch, vectors))
+                    if self.cache is not None:
+                        self.cache.put_many(self.model, fresh)
+                    found.update(fresh)
+
+        return [found[text] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Получение эмбеддинга для запроса"""
+        return self.embed_documents([text])[0]
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        """Один запрос к API на пачку текстов, с повторами при временных ошибках"""
+        for attempt in Retrying(
+            stop=stop_after_attempt(self.max_retries),
+            wait=wait_exponential_jitter(initial=0.5, max=20),
+            retry=retry_if_exception_type(transient_errors()),
+            reraise=True,
+        ):
+            with attempt:
+                response = self.client.embeddings.create(
+                    input=batch,
+                    model=self.model
+                )
+        # API возвращает векторы с индексами, порядок восстанавливается по ним
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Локальные эмбеддинги без сети и без модели: хэшированные n-граммы символов (feature hashing).
+    Каждая n-грамма и каждое слово попадают в одну из dim ячеек (crc32) со знаком +-1,
+    счётчики сглаживаются log1p и нормируются. Весь батч считается одним bincount в NumPy.
+    """
+
+    def __init__(self, dim=1024, ngram_range=(3, 5)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def _features(self, text):
+        text = " ".join(text.lower().replace("ё", "е").split())
+        padded = f" {text} "
+        low, high = self.ngram_range
+        grams = [padded[i:i + n] for n in range(low, high + 1) for i in range(len(padded) - n + 1)]
+        grams.extend(text.split())
+        return np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64, count=len(grams))
+
+    def _embed(self, texts):
+        features = [self._features(text) for text in texts]
+        hashes = np.concatenate(features) if features else np.zeros(0, dtype=np.uint64)
+        rows = np.repeat(np.arange(len(texts), dtype=np.uint64), [len(f) for f in features])
+        # Старший бит хэша задаёт знак, остальные - номер ячейки
+        signs = np.where(hashes >> np.uint64(31) & np.uint64(1), -1.0, 1.0)
+        cells = rows * np.uint64(self.dim) + hashes % np.uint64(self.dim)
+        matrix = np.bincount(cells.astype(np.int64), weights=signs, minlength=len(texts) * self.dim)
+        matrix = matrix.reshape(len(texts), self.dim)
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1.0, norms)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Получение эмбеддингов для списка документов"""
+        return self._embed(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """Получение эмбеддинга для запроса"""
+        return self._embed([text])[0].tolist()
+
+
+@register_backend("remote")
+def _remote_backend(client=None, **options):
+    """BAAI/bge-m3 через API (cloud.ru), с пачками, параллельными запросами и постоянным кэшем"""
+    if client is None:
+        from .rag_query import get_client
+        client = get_client()
+    return CustomEmbeddings(
+        client,
+        batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", 32)),
+        max_workers=int(os.getenv("EMBEDDING_MAX_WORKERS", 4)),
+        cache=options["cache"] if "cache" in options else get_embedding_cache(),
+    )
+
+@register_backend("local-hash")
+def _local_hash_backend(**options):
+    """Локальный CPU-бэкенд, работает без сети"""
+    return HashingEmbeddings(dim=int(os.getenv("LOCAL_EMBEDDING_DIM", 1024)))
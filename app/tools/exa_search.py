@@ -1,10 +1,13 @@
 import os
 from dotenv import get_key
-from exa_py import Exa
-from langchain.tools import tool
+from langchain_core.tools import tool
+from .registry import lazy_resource
 
 # exa = Exa(get_key('.env', 'EXA_API_KEY'))
-exa = Exa(os.getenv("EXA_API_KEY"))
+@lazy_resource("exa")
+def get_exa():
+    from exa_py import Exa
+    return Exa(os.getenv("EXA_API_KEY"))
 
 @tool(
     "search_web_tool",
@@ -12,7 +15,7 @@ exa = Exa(os.getenv("EXA_API_KEY"))
     # description="Поиск информации в интернете через Exa Search API. Возвращает список кратких результатов."
 )
 def search_web_tool(query: str, max_results: int = 5) -> str:
-    response = exa.search(query, num_results=max_results)
+    response = get_exa().search(query, num_results=max_results)
 
     items = []
     for r in response.results:
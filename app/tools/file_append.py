@@ -1,7 +1,7 @@
 from pathlib import Path
 from datetime import datetime
 from pydantic import BaseModel, Field
-from langchain.tools import tool
+from langchain_core.tools import tool
 import re
 
 DATA_DIR = Path("agent_data")
@@ -0,0 +1,121 @@
+import logging
+import os
+import threading
+import time
+from typing import Any
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from .bm25 import BM25Index
+from .registry import lazy_resource
+from .retrieval_cache import CachedRetriever, collection_version, retrieval_stats
+
+# Лексический ответ уверенный, если лучший документ содержит не меньше LEXICAL_MIN_COVERAGE слов запроса
+# и его оценка BM25 хотя бы в LEXICAL_MARGIN раз выше следующей (поиск по названию, автору, термину)
+LEXICAL_MIN_COVERAGE = float(os.getenv("RAG_LEXICAL_MIN_COVERAGE", 1.0))
+LEXICAL_MARGIN = float(os.getenv("RAG_LEXICAL_MARGIN", 1.5))
+# Константа reciprocal rank fusion: 1 / (RRF_K + место)
+RRF_K = int(os.getenv("RAG_RRF_K", 60))
+# Сколько лексических кандидатов участвует в слиянии
+LEXICAL_FETCH_K = int(os.getenv("RAG_LEXICAL_FETCH_K", 20))
+
+logger = logging.getLogger(__name__)
+
+_sync_lock = threading.Lock()
+_building = set()       # id индексов, для которых сейчас строится замена
+
+@lazy_resource("bm25_index")
+def get_bm25_index():
+    return BM25Index()
+
+def build_index(collection, version, batch_size=5000):
+    """Новый индекс по всем документам коллекции, читаемым страницами по batch_size"""
+    index = BM25Index()
+    for offset in range(0, collection.count() + batch_size, batch_size):
+        found = collection.get(include=["documents"], limit=batch_size, offset=offset)
+        if not found["ids"]:
+            break
+        index.add(found["ids"], found["documents"])
+    index.version = version
+    return index
+
+def sync_index(index, collection, wait=False):
+    """
+    Когда версия коллекции (см. collection_version) изменилась, строит новый индекс в фоновом потоке и подменяет им старый:
+    запрос не ждёт чтения и токенизации всего корпуса, а до подмены ищет по прежнему индексу
+    (самый первый - по пустому, тогда ответ даёт векторный поиск). Новый индекс вместо удаления и добавления
+    всех документов не оставляет пустых строк. wait=True строит в текущем потоке.
+    """
+    version = collection_version(collection)
+    if index.version == version:
+        return index
+    with _sync_lock:
+        if index.version == version or id(index) in _building:
+            return index
+        _building.add(id(index))
+
+    def build():
+        try:
+            started = time.perf_counter()
+            index.replace(build_index(collection, version))
+            logger.info("bm25 index of %s rebuilt: %s documents in %.3f s", collection.name, len(index), time.perf_counter() - started)
+        except Exception:
+            logger.exception("bm25 index of %s was not rebuilt", collection.name)
+        finally:
+            with _sync_lock:
+                _building.discard(id(index))
+
+    if wait:
+        build()
+    else:
+        threading.Thread(target=build, name="bm25-sync", daemon=True).start()
+    return index
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Списки id (лучшие первыми) -> один список по сумме 1 / (k + место) во всех списках"""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
+
+def is_confident(lexical, min_coverage=LEXICAL_MIN_COVERAGE, margin=LEXICAL_MARGIN):
+    if not lexical or lexical[0][2] < min_coverage:
+        return False
+    return len(lexical) == 1 or lexical[0][1] >= margin * lexical[1][1]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Гибридный ретривер: сначала BM25 в памяти процесса. Уверенный лексический ответ возвращается сразу,
+    без эмбеддинга запроса и без поиска в Chroma; иначе ранжирования BM25 и векторного ретривера
+    сливаются через reciprocal rank fusion.
+    """
+
+    vectorstore: Any
+    vector_retriever: Any
+    index: Any
+    k: int = 5
+    fetch_k: int = LEXICAL_FETCH_K
+    rrf_k: int = RRF_K
+    min_coverage: float = LEXICAL_MIN_COVERAGE
+    margin: float = LEXICAL_MARGIN
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        collection = self.vectorstore._collection
+        sync_index(self.index, collection)
+        started = time.perf_counter()
+        lexical = self.index.search(query, k=max(self.k, self.fetch_k))
+
+        if is_confident(lexical, self.min_coverage, self.margin):
+            docs = CachedRetriever._fetch(collection, [doc_id for doc_id, _, _ in lexical[:self.k]])
+            retrieval_stats.record("lexical_fast_path", True, time.perf_counter() - started)
+            return docs
+
+        vector_docs = self.vector_retriever.invoke(query)
+        fused = reciprocal_rank_fusion([[doc_id for doc_id, _, _ in lexical], [doc.id for doc in vector_docs]], self.rrf_k)[:self.k]
+        by_id = {doc.id: doc for doc in vector_docs}
+        missing = [doc_id for doc_id in fused if doc_id not in by_id]
+        by_id.update((doc.id, doc) for doc in CachedRetriever._fetch(collection, missing))
+        retrieval_stats.record("lexical_fast_path", False, time.perf_counter() - started)
+        return [by_id[doc_id] for doc_id in fused if doc_id in by_id]
@@ -1,13 +1,17 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.embeddings import Embeddings
-from langchain_chroma import Chroma
-from langchain_community.llms.gigachat import GigaChat
 from langchain_core.tools import tool
 from typing_extensions import List
 from dotenv import get_key
 import os
-from openai import OpenAI
+from .embeddings import CustomEmbeddings, get_embeddings, get_embedding_cache, EMBEDDING_BACKEND_KEY
+from .registry import lazy_resource
+from .retrieval_cache import CachedRetriever, bump_collection_version
+
+# Клиенты, vectorstore, ретриверы и цепочка создаются при первом использовании (см. tools/registry.py),
+# поэтому импорт модуля ничего не инициализирует и не ходит в сеть.
+# Старые имена модуля (llm, client, embeddings, vectorstore, retriever, ...) доступны через __getattr__ ниже.
 
 # Шаг 4.2: Создайте промпт-шаблон:
 prompt_template = """Ты -- научный ассистент, специализирующийся на анализе научных статей.
@@ -28,55 +32,145 @@ prompt_template = """Ты -- научный ассистент, специали
 
 prompt = ChatPromptTemplate.from_template(prompt_template)
 
-llm = GigaChat(
-    credentials="OThhZGViNTgtN2E0Mi00YmExLTgzMTctM2YwNjFmNGI0NzNkOmM2YzYzMGJlLTczMGQtNDk3MC04MjRlLWQwZjBkZWRkM2U5Mg==",
-    scope="GIGACHAT_API_B2B",
-    model="Gigachat-2-Pro",
-    verify_ssl_certs=False,
-    timeout=30
-)
+@lazy_resource("rag_llm")
+def get_llm():
+    from langchain_community.llms.gigachat import GigaChat
+    return GigaChat(
+        credentials="OThhZGViNTgtN2E0Mi00YmExLTgzMTctM2YwNjFmNGI0NzNkOmM2YzYzMGJlLTczMGQtNDk3MC04MjRlLWQwZjBkZWRkM2U5Mg==",
+        scope="GIGACHAT_API_B2B",
+        model="Gigachat-2-Pro",
+        verify_ssl_certs=False,
+        timeout=30
+    )
 # api_key=get_key('.env', "OPEN_AI_KEY"),
 
-client = OpenAI(
-    api_key=os.getenv("OPEN_AI_KEY"),
-    base_url="https://foundation-models.api.cloud.ru/v1"
-)
+@lazy_resource("embedding_client")
+def get_client():
+    from openai import OpenAI
+    return OpenAI(
+        api_key=os.getenv("OPEN_AI_KEY"),
+        base_url="https://foundation-models.api.cloud.ru/v1"
+    )
 
-# Создание экземпляра эмбеддингов
-class CustomEmbeddings(Embeddings):
-    """Кастомный класс эмбеддингов для работы с API"""
-
-    def __init__(self, client, model="BAAI/bge-m3"):
-        self.client = client
-        self.model = model
-
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
-        """Получение эмбеддингов для списка документов"""
-        embeddings = []
-        for text in texts:
-            response = self.client.embeddings.create(
-                input=[text],
-                model=self.model
-            )
-            embeddings.append(response.data[0].embedding)
-        return embeddings
-
-    def embed_query(self, text: str) -> List[float]:
-        """Получение эмбеддинга для запроса"""
-        response = self.client.embeddings.create(
-            input=[text],
-            model=self.model
-        )
-        return response.data[0].embedding
-    
-embeddings = CustomEmbeddings(client)
+# Бэкенд эмбеддингов выбирается конфигурацией: remote (BAAI/bge-m3 по API) или local-hash (без сети)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "remote")
+
+@lazy_resource("embeddings")
+def get_rag_embeddings():
+    return get_embeddings(EMBEDDING_BACKEND, client=get_client() if EMBEDDING_BACKEND == "remote" else None)
 
 # Использование vectorstore после создания векторного хранилища (chroma_db уже сушествует) чтобы не занимать еще время создания хранилища
-vectorstore = Chroma(
-    persist_directory="./chroma_db",
-    embedding_function=embeddings,
-    collection_name="arxiv_papers"
-)
+# Векторы разных бэкендов несовместимы, поэтому у каждого бэкенда своя коллекция
+RAG_COLLECTION = os.getenv("RAG_COLLECTION", "arxiv_papers" if EMBEDDING_BACKEND == "remote" else f"arxiv_papers__{EMBEDDING_BACKEND}")
+
+# Настройки ретриверов; переопределяются переменными окружения, подбираются benchmarks/bench_retrieval.py
+RETRIEVER_SETTINGS = {
+    "similarity": {
+        "k": int(os.getenv("RAG_K", 5)), # Возвращать топ-5 документов
+    },
+    "mmr": {
+        "k": int(os.getenv("RAG_K", 5)),
+        "fetch_k": int(os.getenv("RAG_MMR_FETCH_K", 20)), # Количество документов для первичной выборки
+        "lambda_mult": float(os.getenv("RAG_MMR_LAMBDA", 0.5)), # Баланс между релевантностью (1.0) и разнообразием (0.0)
+    },
+    "similarity_score_threshold": {
+        "score_threshold": float(os.getenv("RAG_SCORE_THRESHOLD", 0.2)), # Минимальная оценка схожести
+        "k": int(os.getenv("RAG_THRESHOLD_K", 10)),
+    },
+}
+
+# Параметры индекса HNSW: ef_construction и max_neighbors (M) применяются при создании коллекции,
+# ef_search можно менять и у существующей. Не заданные параметры остаются по умолчанию Chroma.
+HNSW_SETTINGS = {
+    name: int(os.environ[variable])
+    for name, variable in (
+        ("ef_construction", "RAG_HNSW_EF_CONSTRUCTION"),
+        ("max_neighbors", "RAG_HNSW_M"),
+        ("ef_search", "RAG_HNSW_EF_SEARCH"),
+    )
+    if os.getenv(variable)
+}
+
+def open_vectorstore(collection_name, embeddings, backend, persist_directory="./chroma_db", hnsw=None):
+    """
+    Открывает коллекцию Chroma и проверяет, что она построена тем же бэкендом эмбеддингов.
+    Имя бэкенда хранится в метаданных коллекции; коллекции без него созданы до появления
+    реестра бэкендов и считаются построенными remote-бэкендом.
+    hnsw - параметры индекса (по умолчанию HNSW_SETTINGS).
+    """
+    from langchain_chroma import Chroma
+    hnsw = HNSW_SETTINGS if hnsw is None else hnsw
+    store = Chroma(
+        persist_directory=persist_directory,
+        embedding_function=embeddings,
+        collection_name=collection_name,
+        collection_metadata={EMBEDDING_BACKEND_KEY: backend},
+        collection_configuration={"hnsw": hnsw} if hnsw else None,
+    )
+    if "ef_search" in hnsw:
+        # У уже существующей коллекции меняется только параметр поиска
+        store._collection.modify(configuration={"hnsw": {"ef_search": hnsw["ef_search"]}})
+    stored = (store._collection.metadata or {}).get(EMBEDDING_BACKEND_KEY, "remote")
+    if stored != backend:
+        raise ValueError(
+            f"Collection '{collection_name}' was built with the '{stored}' embedding backend, "
+            f"refusing to query it with '{backend}' vectors"
+        )
+    return store
+
+# Коллекция, из которой reembed_collection() берёт документы для коллекций других бэкендов
+RAG_SOURCE_COLLECTION = os.getenv("RAG_SOURCE_COLLECTION", "arxiv_papers")
+
+@lazy_resource("vectorstore")
+def get_vectorstore():
+    store = open_vectorstore(RAG_COLLECTION, get_rag_embeddings(), EMBEDDING_BACKEND)
+    # Пустая коллекция означала бы молча пустой контекст в каждом ответе
+    if store._collection.count() == 0:
+        raise ValueError(
+            f"Collection '{RAG_COLLECTION}' ({EMBEDDING_BACKEND} backend) is empty, "
+            f"fill it with `flask --app app reembed-rag` from '{RAG_SOURCE_COLLECTION}'"
+        )
+    return store
+
+def reembed_collection(source_name=RAG_SOURCE_COLLECTION, target_name=None, backend=None,
+                       persist_directory="./chroma_db", full=False, batch_size=256):
+    """
+    Переносит документы коллекции source_name в коллекцию бэкенда backend (по умолчанию RAG_COLLECTION
+    и EMBEDDING_BACKEND), считая эмбеддинги этим бэкендом. Без full считаются только документы,
+    которых ещё нет в целевой коллекции; исчезнувшие из источника удаляются. Возвращает (добавлено, удалено).
+    """
+    backend = backend or EMBEDDING_BACKEND
+    target_name = target_name or (RAG_COLLECTION if backend == EMBEDDING_BACKEND else f"{source_name}__{backend}")
+    if target_name == source_name:
+        raise ValueError(f"Collection '{source_name}' can not be re-embedded into itself")
+    embeddings = get_rag_embeddings() if backend == EMBEDDING_BACKEND else get_embeddings(backend)
+    store = open_vectorstore(target_name, embeddings, backend, persist_directory)
+    target = store._collection
+    # get_collection, а не создание: опечатка в имени источника должна быть ошибкой
+    source = store._client.get_collection(source_name)
+
+    source_ids = source.get(include=[])["ids"]
+    if not source_ids:
+        raise ValueError(f"Source collection '{source_name}' is empty")
+    stored = set(target.get(include=[])["ids"])
+    missing = source_ids if full else [doc_id for doc_id in source_ids if doc_id not in stored]
+    for start in range(0, len(missing), batch_size):
+        found = source.get(ids=missing[start:start + batch_size], include=["documents", "metadatas"])
+        target.upsert(
+            ids=found["ids"],
+            embeddings=embeddings.embed_documents(found["documents"]),
+            documents=found["documents"],
+            metadatas=[metadata or None for metadata in found["metadatas"]],
+        )
+
+    present = set(source_ids)
+    deleted = [doc_id for doc_id in stored if doc_id not in present]
+    for start in range(0, len(deleted), 5000):
+        target.delete(ids=deleted[start:start + 5000])
+    if missing or deleted:
+        # Документы могли замениться на месте, кэш результатов поиска по коллекции больше не действителен
+        bump_collection_version(target)
+    return len(missing), len(deleted)
 
 def format_docs(docs):
     """
@@ -98,31 +192,48 @@ def format_docs(docs):
     return "\n".join(context_parts)
 
 def get_embedding(text: str, client, model="BAAI/bge-m3") -> list:
-    """Получает эмбеддинг текста"""
+    """Получает эмбеддинг текста (через тот же кэш, что и CustomEmbeddings)"""
+    cached = get_embedding_cache().get(model, text)
+    if cached is not None:
+        return cached
     response = client.embeddings.create(
         input=[text],
         model=model
     )
+    get_embedding_cache().put_many(model, {text: response.data[0].embedding})
     return response.data[0].embedding
 
 # Проверка работы хранилища
 def test_saver():
     test_query = "машинное обучение и нейронные сети"
-    results = vectorstore.similarity_search(test_query, k=3)
+    results = get_vectorstore().similarity_search(test_query, k=3)
     print(f"\nРезультаты поиска по запросу '{test_query}':")
     for i, doc in enumerate(results, 1):
         print(f"\n{i}. {doc.page_content[:200]}...")
         print(f"Метаданные: {doc.metadata}")
 
+# Кэши запрос -> вектор и (вектор, параметры, версия коллекции) -> документы, см. tools/retrieval_cache.py
+RAG_CACHE = os.getenv("RAG_CACHE", "1") != "0"
+
+def make_retriever(search_type):
+    """Ретривер с настройками RETRIEVER_SETTINGS[search_type], с кэшами, если RAG_CACHE не выключен"""
+    if RAG_CACHE:
+        return CachedRetriever(
+            vectorstore=get_vectorstore(),
+            backend=EMBEDDING_BACKEND,
+            search_type=search_type,
+            search_kwargs=RETRIEVER_SETTINGS[search_type],
+        )
+    return get_vectorstore().as_retriever(search_type=search_type, search_kwargs=RETRIEVER_SETTINGS[search_type])
+
 # Создание базового ретривера с поиском по схожести
-retriever = vectorstore.as_retriever(
-    search_type="similarity",
-    search_kwargs={"k": 5} # Возвращать топ-5 документов
-)
+@lazy_resource("retriever")
+def get_retriever():
+    return make_retriever("similarity")
 
 # Тестирование ретривера
 def test_retriever(query: str = "глубокое обучение для обработки изображений"):
-    retrieved_docs = retriever.invoke(query)
+    retrieved_docs = get_retriever().invoke(query)
     print(f"Найдено документов: {len(retrieved_docs)}")
     for i, doc in enumerate(retrieved_docs, 1):
         print(f"\nДокумент {i}:")
@@ -131,35 +242,53 @@ def test_retriever(query: str = "глубокое обучение для обр
 
 # Шаг 3.2: Попробуйте ретривер с MMR (Maximum Marginal Relevance):
 # MMR балансирует между релевантностью и разнообразием результатов
-retriever_mmr = vectorstore.as_retriever(
-    search_type="mmr",
-    search_kwargs={
-        "k": 5,
-        "fetch_k": 20, # Количество документов для первичной выборки
-        "lambda_mult": 0.5 # Баланс между релевантностью (1.0) и разнообразием (0.0)
-    }
-)
+@lazy_resource("retriever_mmr")
+def get_retriever_mmr():
+    return make_retriever("mmr")
 
 # Шаг 3.3: Создайте ретривер с порогом схожести:
 # Ретривер с фильтрацией по оценке схожести
-retriever_threshold = vectorstore.as_retriever(
-    search_type="similarity_score_threshold",
-    search_kwargs={
-        "score_threshold": 0.2, # Минимальная оценка схожести
-        "k": 10
-    }
-)
+@lazy_resource("retriever_threshold")
+def get_retriever_threshold():
+    return make_retriever("similarity_score_threshold")
  
+# Гибридный ретривер: уверенные лексические совпадения (BM25) без эмбеддинга запроса, иначе слияние с векторным поиском
+@lazy_resource("retriever_hybrid")
+def get_retriever_hybrid():
+    from .hybrid_retriever import HybridRetriever, get_bm25_index, sync_index
+    vectorstore = get_vectorstore()
+    # Индекс BM25 начинает строиться сразу (в фоне), при прогреве - до первого запроса
+    index = sync_index(get_bm25_index(), vectorstore._collection)
+    return HybridRetriever(
+        vectorstore=vectorstore,
+        vector_retriever=get_retriever(),
+        index=index,
+        k=RETRIEVER_SETTINGS["similarity"]["k"],
+    )
+
+# Ретривер RAG-цепочки: hybrid (по умолчанию), similarity, mmr или similarity_score_threshold
+RAG_RETRIEVER = os.getenv("RAG_RETRIEVER", "hybrid")
+
+def get_chain_retriever():
+    return {
+        "hybrid": get_retriever_hybrid,
+        "similarity": get_retriever,
+        "mmr": get_retriever_mmr,
+        "similarity_score_threshold": get_retriever_threshold,
+    }[RAG_RETRIEVER]()
+
 # Шаг 4.4: Соберите RAG-цепочку:
 # Создание RAG-цепочки
-rag_chain = (
-    {
-        "context": retriever | format_docs, # Извлекаем и форматируем документы
-        "question": RunnablePassthrough()   # Передаем вопрос как есть
-    }
-    | prompt  # Формируем промпт
-    | llm     # Отправляем в языковую модель
-)
+@lazy_resource("rag_chain")
+def get_rag_chain():
+    return (
+        {
+            "context": get_chain_retriever() | format_docs, # Извлекаем и форматируем документы
+            "question": RunnablePassthrough()   # Передаем вопрос как есть
+        }
+        | prompt  # Формируем промпт
+        | get_llm()     # Отправляем в языковую модель
+    )
 
 # Тестирование RAG-системы
 @tool(
@@ -179,10 +308,29 @@ def rag_query_tool(query:str):
     #     print("-" * 80)
 
     try:
-        response = rag_chain.invoke(query)
+        response = get_rag_chain().invoke(query)
         return response.content or "Ничего не найдено."
         # print(f"Ответ: {response.content}\n")
     except Exception as e:
         print(f"\nОшибка: {e} in rag_query_tool\n")
         return "Ничего не найдено."
 
+
+# Старые имена модуля, создаются при первом обращении
+_LAZY_ATTRIBUTES = {
+    "llm": get_llm,
+    "client": get_client,
+    "embeddings": get_rag_embeddings,
+    "embedding_cache": get_embedding_cache,
+    "vectorstore": get_vectorstore,
+    "retriever": get_retriever,
+    "retriever_mmr": get_retriever_mmr,
+    "retriever_threshold": get_retriever_threshold,
+    "retriever_hybrid": get_retriever_hybrid,
+    "rag_chain": get_rag_chain,
+}
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,64 @@
+import logging
+import threading
+import time
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+# Имя ресурса -> функция, которая его лениво создаёт
+RESOURCES = {}
+
+
+def lazy_resource(name):
+    """
+    Декоратор для фабрики тяжёлого объекта (клиента API, vectorstore, цепочки).
+    Объект создаётся при первом вызове, один раз даже при одновременных вызовах из разных потоков,
+    дальше возвращается тот же экземпляр. Фабрика регистрируется в RESOURCES для warm_up().
+    """
+    def decorator(factory):
+        lock = threading.Lock()
+        state = {}
+
+        @wraps(factory)
+        def getter():
+            if "value" not in state:
+                with lock:
+                    if "value" not in state:
+                        started = time.perf_counter()
+                        state["value"] = factory()
+                        logger.info("resource %s initialized in %.3f s", name, time.perf_counter() - started)
+            return state["value"]
+
+        def reset():
+            with lock:
+                state.pop("value", None)
+
+        getter.initialized = lambda: "value" in state
+        getter.reset = reset
+        RESOURCES[name] = getter
+        return getter
+    return decorator
+
+
+def warm_up(names=None):
+    """
+    Заранее создаёт ресурсы (все или перечисленные), чтобы первый запрос не ждал их инициализации.
+    Возвращает {имя: секунды}; ошибка одного ресурса не мешает остальным.
+    """
+    timings = {}
+    for name in names or list(RESOURCES):
+        started = time.perf_counter()
+        try:
+            RESOURCES[name]()
+        except Exception as E:
+            logger.warning("warm-up of %s failed: %s", name, E)
+            continue
+        timings[name] = round(time.perf_counter() - started, 4)
+    return timings
+
+
+def warm_up_in_background(names=None):
+    """warm_up() в фоновом потоке: процесс сразу начинает принимать запросы"""
+    thread = threading.Thread(target=warm_up, args=(names,), name="tools-warm-up", daemon=True)
+    thread.start()
+    return thread
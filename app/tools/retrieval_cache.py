@@ -0,0 +1,210 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from typing import Any
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from utils.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Ключ метаданных коллекции со счётчиком версии. Каждый писатель в коллекции в этом репозитории
+# (reembed_collection, sync_book_vectors, бенчмарки) вызывает bump_collection_version(); позиция в журнале
+# локального Chroma (collection_log_position) дополнительно замечает записи чужих процессов и скриптов
+COLLECTION_VERSION_KEY = "version"
+# collection_log_position читает внутренние таблицы Chroma (max_seq_id, segments); схема проверена на этой версии,
+# она же закреплена в requirements.txt. При другой схеме позиция не используется, версия держится на счётчике
+CHROMA_LOG_SCHEMA_VERSION = "1.5.9"
+_log_schema_warned = []
+
+
+class StageStats:
+    """
+    Попадания и промахи кэшей по этапам (embedding, retrieval) и время этапа:
+    сэкономленное время = попадания x среднее время промаха - время, потраченное на попадания.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def record(self, stage, hit, seconds):
+        with self._lock:
+            stats = self._stages.setdefault(stage, {"hits": 0, "misses": 0, "hit_seconds": 0.0, "miss_seconds": 0.0})
+            stats["hits" if hit else "misses"] += 1
+            stats["hit_seconds" if hit else "miss_seconds"] += seconds
+
+    def stats(self):
+        with self._lock:
+            report = {}
+            for stage, stats in self._stages.items():
+                hits, misses = stats["hits"], stats["misses"]
+                miss_ms = stats["miss_seconds"] * 1000 / misses if misses else 0.0
+                hit_ms = stats["hit_seconds"] * 1000 / hits if hits else 0.0
+                report[stage] = {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+                    "avg_miss_ms": round(miss_ms, 3),
+                    "avg_hit_ms": round(hit_ms, 3),
+                    "saved_ms": round(hits * (miss_ms - hit_ms), 1) if misses else 0.0,
+                }
+            return report
+
+
+retrieval_stats = StageStats()
+
+# Нормализованный запрос -> вектор; повторы запроса внутри одного ask() и между пользователями не идут в API
+query_embedding_cache = LRUCache(
+    max_entries=int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", 4096)),
+    ttl=float(os.getenv("RAG_EMBEDDING_CACHE_TTL", 24 * 3600)),
+)
+# (коллекция, версия, тип поиска, параметры, хэш вектора) -> id документов
+retrieval_result_cache = LRUCache(
+    max_entries=int(os.getenv("RAG_RESULT_CACHE_SIZE", 4096)),
+    ttl=float(os.getenv("RAG_RESULT_CACHE_TTL", 3600)),
+)
+# Версия коллекции перечитывается не чаще раза в несколько секунд
+_collection_versions = LRUCache(max_entries=64, ttl=float(os.getenv("RAG_COLLECTION_VERSION_TTL", 5)))
+
+
+def normalize_query(query):
+    """Запросы, отличающиеся только регистром и пробелами, считаются одинаковыми"""
+    return " ".join(query.casefold().split())
+
+
+def vector_key(vector):
+    return hashlib.sha1(np.asarray(vector, dtype=np.float32).tobytes()).hexdigest()
+
+
+def collection_log_position(collection):
+    """
+    Номер последней записи коллекции в журнале локального Chroma (chroma.sqlite3 в persist_directory).
+    Растёт при каждом add/upsert/update/delete из любого процесса, в том числе не вызвавшего bump_collection_version().
+    None, если у клиента нет локальной базы (сервер Chroma по HTTP) или схема Chroma не та, что у
+    CHROMA_LOG_SCHEMA_VERSION (тогда один раз пишется предупреждение).
+    """
+    settings = collection._client.get_settings()
+    if not settings.is_persistent or not settings.persist_directory:
+        return None
+    path = Path(settings.persist_directory, "chroma.sqlite3").resolve()
+    try:
+        with closing(sqlite3.connect(f"{path.as_uri()}?mode=ro", uri=True)) as connection:
+            return connection.execute(
+                "SELECT max(m.seq_id) FROM max_seq_id m JOIN segments s ON s.id = m.segment_id WHERE s.collection = ?",
+                (str(collection.id),),
+            ).fetchone()[0]
+    except sqlite3.OperationalError as E:
+        # Нет таблицы или столбца: Chroma обновили, а запрос написан под CHROMA_LOG_SCHEMA_VERSION
+        if not _log_schema_warned:
+            _log_schema_warned.append(True)
+            logger.warning(
+                "Chroma log position unavailable (%s), schema checked with chromadb %s; "
+                "collection versions rely on bump_collection_version() only", E, CHROMA_LOG_SCHEMA_VERSION,
+            )
+        return None
+    except sqlite3.Error:
+        return None
+
+
+def collection_version(collection):
+    """(счётчик версии из метаданных, число документов, позиция в журнале): меняется при любой записи в коллекцию"""
+    version = _collection_versions.get(collection.name)
+    if version is None:
+        # Метаданные перечитываются с сервера: у объекта коллекции они те, что были при её открытии
+        metadata = collection._client.get_collection(collection.name).metadata or {}
+        version = (metadata.get(COLLECTION_VERSION_KEY, 0), collection.count(), collection_log_position(collection))
+        _collection_versions.set(collection.name, version)
+    return version
+
+
+def bump_collection_version(collection):
+    """Увеличивает версию коллекции после записи; кэш результатов этой коллекции перестаёт совпадать"""
+    metadata = dict(collection._client.get_collection(collection.name).metadata or {})
+    metadata[COLLECTION_VERSION_KEY] = metadata.get(COLLECTION_VERSION_KEY, 0) + 1
+    collection.modify(metadata=metadata)
+    _collection_versions.delete(collection.name)
+
+
+def embed_query_cached(embeddings, backend, query):
+    started = time.perf_counter()
+    key = (backend, normalize_query(query))
+    vector = query_embedding_cache.get(key)
+    if vector is None:
+        vector = embeddings.embed_query(query)
+        query_embedding_cache.set(key, vector)
+        retrieval_stats.record("embedding", False, time.perf_counter() - started)
+    else:
+        retrieval_stats.record("embedding", True, time.perf_counter() - started)
+    return vector
+
+
+class CachedRetriever(BaseRetriever):
+    """
+    Ретривер поверх Chroma с теми же search_type/search_kwargs, что и vectorstore.as_retriever(),
+    но с двумя кэшами: запрос -> вектор и (вектор, параметры, версия коллекции) -> id документов.
+    При попадании документы читаются из коллекции по id, поиск по индексу не выполняется.
+    """
+
+    vectorstore: Any
+    backend: str
+    search_type: str = "similarity"
+    search_kwargs: dict = {}
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        vector = embed_query_cached(self.vectorstore.embeddings, self.backend, query)
+
+        started = time.perf_counter()
+        collection = self.vectorstore._collection
+        key = (
+            collection.name,
+            collection_version(collection),
+            self.search_type,
+            json.dumps(self.search_kwargs, sort_keys=True),
+            vector_key(vector),
+        )
+        ids = retrieval_result_cache.get(key)
+        if ids is not None:
+            docs = self._fetch(collection, ids)
+            retrieval_stats.record("retrieval", True, time.perf_counter() - started)
+            return docs
+
+        docs = self._search(vector)
+        retrieval_result_cache.set(key, [doc.id for doc in docs])
+        retrieval_stats.record("retrieval", False, time.perf_counter() - started)
+        return docs
+
+    def _search(self, vector):
+        kwargs = dict(self.search_kwargs)
+        if self.search_type == "similarity":
+            return self.vectorstore.similarity_search_by_vector(vector, **kwargs)
+        if self.search_type == "mmr":
+            return self.vectorstore.max_marginal_relevance_search_by_vector(vector, **kwargs)
+        if self.search_type == "similarity_score_threshold":
+            threshold = kwargs.pop("score_threshold")
+            relevance = self.vectorstore._select_relevance_score_fn()
+            return [
+                doc for doc, distance in self.vectorstore.similarity_search_by_vector_with_relevance_scores(vector, **kwargs)
+                if relevance(distance) >= threshold
+            ]
+        raise ValueError(f"Unsupported search_type '{self.search_type}'")
+
+    @staticmethod
+    def _fetch(collection, ids):
+        if not ids:
+            return []
+        found = collection.get(ids=ids, include=["documents", "metadatas"])
+        by_id = {
+            doc_id: Document(id=doc_id, page_content=text, metadata=metadata or {})
+            for doc_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])
+        }
+        # Порядок ранжирования сохраняется; удалённые документы просто пропадают (версия их и так отсечёт)
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
@@ -1 +0,0 @@
-from .read_json import book_data_list
\ No newline at end of file
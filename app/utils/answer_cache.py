@@ -0,0 +1,265 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import numpy as np
+from utils.lru_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(question):
+    """Questions that differ only in case, spacing, "ё" or trailing punctuation share one cache key"""
+    question = (question or "").lower().replace("ё", "е")
+    question = re.sub(r"\s+", " ", question).strip()
+    return question.rstrip("?!.… ")
+
+
+def _key(model, normalized):
+    return hashlib.sha256(f"{model}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class MemoryAnswerStore:
+    """In-process storage: LRU + TTL, lost on restart and not shared between workers"""
+
+    def __init__(self, max_entries=1000, ttl=24 * 3600):
+        self._entries = LRUCache(max_entries=max_entries, ttl=ttl)
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def put(self, entry):
+        self._entries.set(entry["key"], entry)
+
+    def vectors(self, model, space):
+        """(entries, matrix of unit vectors) of the live entries of this model embedded in space"""
+        entries = [
+            entry for entry in self._entries.values()
+            if entry["model"] == model and entry["embedding"] is not None and entry.get("space") == space
+        ]
+        matrix = np.stack([entry["embedding"] for entry in entries]) if entries else None
+        return entries, matrix
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteAnswerStore:
+    """
+    On-disk storage in its own SQLite file, shared by every worker on the host and kept across restarts.
+    LRU is tracked with accessed_at, TTL with created_at.
+    """
+
+    def __init__(self, path="instance/answer_cache.db", max_entries=10000, ttl=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().execute("""CREATE TABLE IF NOT EXISTS answer_cache (
+            key TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            embedding BLOB,
+            created_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            space TEXT
+        )""")
+        self._connect().execute("CREATE INDEX IF NOT EXISTS ix_answer_cache_accessed_at ON answer_cache (accessed_at)")
+        columns = [row[1] for row in self._connect().execute("PRAGMA table_info(answer_cache)")]
+        if "space" not in columns:
+            # Files written before the column existed: their embeddings have no known space and are not matched
+            self._connect().execute("ALTER TABLE answer_cache ADD COLUMN space TEXT")
+
+    def _connect(self):
+        # sqlite3 connections can not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        now = time.time()
+        row = self._connect().execute(
+            "SELECT key, model, question, answer, embedding FROM answer_cache WHERE key = ? AND created_at > ?",
+            (key, now - self.ttl),
+        ).fetchone()
+        if row is None:
+            return None
+        self._connect().execute("UPDATE answer_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return self._entry(row)
+
+    def put(self, entry):
+        now = time.time()
+        embedding = None if entry["embedding"] is None else np.asarray(entry["embedding"], dtype=np.float32).tobytes()
+        connection = self._connect()
+        connection.execute(
+            "INSERT OR REPLACE INTO answer_cache (key, model, question, answer, embedding, created_at, accessed_at, space) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (entry["key"], entry["model"], entry["question"], entry["answer"], embedding, now, now, entry.get("space")),
+        )
+        connection.execute("DELETE FROM answer_cache WHERE created_at <= ?", (now - self.ttl,))
+        connection.execute(
+            "DELETE FROM answer_cache WHERE key IN (SELECT key FROM answer_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def vectors(self, model, space):
+        rows = self._connect().execute(
+            "SELECT key, model, question, answer, embedding FROM answer_cache "
+            "WHERE model = ? AND space = ? AND embedding IS NOT NULL AND created_at > ?",
+            (model, space, time.time() - self.ttl),
+        ).fetchall()
+        entries = [self._entry(row) for row in rows]
+        matrix = np.stack([entry["embedding"] for entry in entries]) if entries else None
+        return entries, matrix
+
+    def clear(self):
+        self._connect().execute("DELETE FROM answer_cache")
+
+    def __len__(self):
+        return self._connect().execute("SELECT count(*) FROM answer_cache").fetchone()[0]
+
+    @staticmethod
+    def _entry(row):
+        key, model, question, answer, embedding = row
+        return {
+            "key": key,
+            "model": model,
+            "question": question,
+            "answer": answer,
+            "embedding": None if embedding is None else np.frombuffer(embedding, dtype=np.float32),
+        }
+
+
+class AnswerCache:
+    """
+    Two-level cache of LLM answers:
+        exact - same normalized question and model,
+        semantic - a cached question of the same model whose embedding is within max_distance
+                   (cosine distance) of the new one. Opt-in: only used when an embed function and
+                   max_distance > 0 are given, and only for semantic_models (answers of other models,
+                   e.g. an agent whose answers depend on tool side effects, are matched exactly).
+    Embeddings are stored with their space, embedding_space (the embedding backend) and dimension:
+    after a backend change the old ones are not compared with the new vectors, they only age out.
+    """
+
+    def __init__(self, store, embed=None, max_distance=0.0, semantic_models=(), embedding_space=""):
+        self.store = store
+        self.embed = embed if max_distance > 0 else None
+        self.embedding_space = embedding_space
+        self.max_distance = max_distance
+        self.semantic_models = frozenset(semantic_models)
+        # Embeddings computed on a miss are reused by the following set()
+        self._pending = LRUCache(max_entries=256, ttl=600)
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def get(self, question, model):
+        normalized = normalize_question(question)
+        entry = self.store.get(_key(model, normalized))
+        if entry is not None:
+            self._count("exact_hits")
+            return entry["answer"]
+
+        # Misses of exact-only models do not pay for an embedding call
+        vector = self._embed(normalized) if model in self.semantic_models else None
+        if vector is not None:
+            self._pending.set((model, normalized), vector)
+            entries, matrix = self.store.vectors(model, self._space(vector))
+            if entries:
+                distances = 1.0 - matrix @ vector
+                best = int(np.argmin(distances))
+                if distances[best] <= self.max_distance:
+                    self._count("semantic_hits")
+                    logger.debug("semantic cache hit (%.3f): %r ~ %r", distances[best], normalized, entries[best]["question"])
+                    return entries[best]["answer"]
+
+        self._count("misses")
+        return None
+
+    def set(self, question, model, answer):
+        if not answer:
+            return
+        normalized = normalize_question(question)
+        vector = None
+        if model in self.semantic_models:
+            vector = self._pending.get((model, normalized))
+            if vector is None:
+                vector = self._embed(normalized)
+        self.store.put({
+            "key": _key(model, normalized),
+            "model": model,
+            "question": normalized,
+            "answer": answer,
+            "embedding": vector,
+            "space": None if vector is None else self._space(vector),
+        })
+
+    def clear(self):
+        self.store.clear()
+
+    def stats(self):
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self.store),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else None,
+        }
+
+    def _space(self, vector):
+        return f"{self.embedding_space}/{len(vector)}"
+
+    def _embed(self, normalized):
+        if self.embed is None or not normalized:
+            return None
+        try:
+            return _unit(self.embed(normalized))
+        except Exception as E:
+            # The semantic level is an optimization, a failing embedding API must not break answers
+            logger.warning("answer cache: embedding failed, semantic lookup skipped: %s", E)
+            return None
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+def create_answer_cache(embed=None, semantic_models=(), embedding_space=""):
+    """
+    Build the cache from the environment:
+        ANSWER_CACHE_BACKEND - "memory" (default) or "sqlite"
+        ANSWER_CACHE_PATH - SQLite file, instance/answer_cache.db by default
+        ANSWER_CACHE_TTL - seconds, 1 day by default
+        ANSWER_CACHE_MAX_ENTRIES - size bound, 1000 by default
+        ANSWER_CACHE_MAX_DISTANCE - cosine distance for semantic hits of semantic_models, 0 (exact match only)
+                                    by default; e.g. 0.08 turns the semantic level on
+    """
+    ttl = int(os.environ.get("ANSWER_CACHE_TTL", 24 * 3600))
+    max_entries = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 1000))
+    max_distance = float(os.environ.get("ANSWER_CACHE_MAX_DISTANCE", 0))
+
+    if os.environ.get("ANSWER_CACHE_BACKEND", "memory") == "sqlite":
+        store = SQLiteAnswerStore(os.environ.get("ANSWER_CACHE_PATH", "instance/answer_cache.db"), max_entries=max_entries, ttl=ttl)
+    else:
+        store = MemoryAnswerStore(max_entries=max_entries, ttl=ttl)
+    return AnswerCache(store, embed=embed, max_distance=max_distance, semantic_models=semantic_models, embedding_space=embedding_space)
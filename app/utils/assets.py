@@ -0,0 +1,125 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import shutil
+from pathlib import Path
+from flask import abort, request, send_file, url_for
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, only gzip variants are written without it
+    brotli = None
+
+ASSET_DIRS = ("css", "imgs")
+DIST_DIR = "dist"
+MANIFEST = "manifest.json"
+# Already compressed formats (png, jpg, woff2...) gain nothing from gzip/brotli
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".html", ".map"}
+IMMUTABLE = "public, max-age=31536000, immutable"
+# HTML/JSON responses smaller than this are sent as they are
+MIN_COMPRESS_SIZE = 500
+
+
+def build_assets(static_folder):
+    """
+    Copy every file of ASSET_DIRS to static/dist under a name with its content hash,
+    write .gz (and .br when brotli is installed) next to the compressible ones,
+    and a manifest {"css/style.css": "css/style.<hash>.css"}. Returns the manifest.
+    """
+    static_folder = Path(static_folder)
+    dist = static_folder / DIST_DIR
+    if dist.exists():
+        shutil.rmtree(dist)
+
+    manifest = {}
+    for directory in ASSET_DIRS:
+        for source in sorted((static_folder / directory).rglob("*")):
+            if not source.is_file():
+                continue
+            data = source.read_bytes()
+            name = source.relative_to(static_folder).as_posix()
+            hashed = Path(name).with_name(f"{source.stem}.{hashlib.sha256(data).hexdigest()[:12]}{source.suffix}").as_posix()
+
+            target = dist / hashed
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(data)
+            if source.suffix in COMPRESSIBLE:
+                target.with_name(target.name + ".gz").write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    target.with_name(target.name + ".br").write_bytes(brotli.compress(data, quality=11))
+            manifest[name] = hashed
+
+    (dist / MANIFEST).write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    return manifest
+
+
+class Assets:
+    """
+    Serves the fingerprinted files of static/dist at /assets/<name> with one-year immutable caching,
+    picking the .br/.gz variant the client accepts, and gzips HTML and JSON responses.
+    Templates use asset_url("css/style.css"); without a build it falls back to the plain static file.
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.dist = Path(app.static_folder) / DIST_DIR
+        self.load_manifest()
+        app.add_url_rule("/assets/<path:filename>", "assets", self.serve)
+        app.add_template_global(self.asset_url, "asset_url")
+        app.after_request(compress_response)
+        app.extensions["assets"] = self
+
+    def load_manifest(self):
+        path = self.dist / MANIFEST
+        self.manifest = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+
+    def asset_url(self, filename, **values):
+        hashed = self.manifest.get(filename)
+        if hashed is None:
+            return url_for("static", filename=filename, **values)
+        return url_for("assets", filename=hashed, **values)
+
+    def serve(self, filename):
+        path = (self.dist / filename).resolve()
+        if not path.is_relative_to(self.dist.resolve()) or not path.is_file():
+            abort(404)
+
+        encoding = None
+        for candidate, suffix in (("br", ".br"), ("gzip", ".gz")):
+            variant = path.with_name(path.name + suffix)
+            if candidate in request.accept_encodings and variant.is_file():
+                path, encoding = variant, candidate
+                break
+
+        response = send_file(path, mimetype=mimetypes.guess_type(filename)[0], conditional=True, etag=True)
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Cache-Control"] = IMMUTABLE
+        response.vary.add("Accept-Encoding")
+        return response
+
+
+def compress_response(response):
+    """gzip HTML and JSON bodies for clients that accept it (streamed responses such as SSE are left alone)"""
+    if (
+        response.mimetype not in ("text/html", "application/json")
+        or response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or "Content-Encoding" in response.headers
+        or "gzip" not in request.accept_encodings
+    ):
+        return response
+    data = response.get_data()
+    if len(data) < MIN_COMPRESS_SIZE:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=6))
+    response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    return response
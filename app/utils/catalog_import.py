@@ -0,0 +1,271 @@
+import csv
+import itertools
+import json
+import re
+import time
+import numpy as np
+import sqlalchemy as sa
+from pathlib import Path
+from db.base import db
+from db.dialects import dialect_insert
+from models.book import Book, NAME_MAX_LENGTH, AUTHOR_MAX_LENGTH, CATEGORY_MAX_LENGTH
+
+BOOK_COLUMNS = ("name", "author", "category", "describe", "publication_year")
+FORMATS = ("json", "jsonl", "csv")
+
+
+class CatalogFormatError(ValueError):
+    """A catalog file that can not be parsed; the message carries the character offset or the line"""
+
+
+def _open_array(f, key, buffer_size, max_prefix):
+    """
+    Read up to the opening bracket of the catalog array: the top-level array, or the value of
+    "key" in a top-level object. Returns (buffer after the bracket, its offset in the file).
+    """
+    buffer = ""
+    pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    while True:
+        stripped = buffer.lstrip()
+        if stripped[:1] == "[":
+            position = len(buffer) - len(stripped) + 1
+            return buffer[position:], position
+        if stripped[:1] == "{":
+            match = pattern.search(buffer)
+            if match:
+                return buffer[match.end():], match.end()
+        elif stripped:
+            raise CatalogFormatError(f"character {len(buffer) - len(stripped)}: expected a JSON array or object")
+        chunk = f.read(buffer_size)
+        if not chunk or len(buffer) > max_prefix:
+            raise CatalogFormatError(f"no \"{key}\" array in the first {len(buffer)} characters")
+        buffer += chunk
+
+
+def iter_json_array(path, key="books", buffer_size=1 << 16, max_item_size=1 << 20):
+    """
+    Yield the items of the catalog array one at a time, reading buffer_size characters at a time,
+    so memory stays bounded by the largest single item. Works for a top-level array and for
+    {"books": [...]} like static/books/literature.json (other keys before "books" are skipped,
+    up to max_item_size characters of them). An item that is malformed, or longer than
+    max_item_size characters, raises CatalogFormatError with its offset in the file.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buffer, offset = _open_array(f, key, buffer_size, max_item_size)
+        pos, separated = 0, True
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            if pos < len(buffer) and not separated:
+                if buffer[pos] != ",":
+                    raise CatalogFormatError(f"character {offset + pos}: expected ',' or ']' after an item")
+                pos, separated = pos + 1, True
+                continue
+            try:
+                if pos == len(buffer):
+                    raise json.JSONDecodeError("need more data", buffer, pos)
+                item, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as E:
+                # An item cut by the end of the buffer fails at its end or inside an unterminated string;
+                # an error anywhere else is a malformed item and more data will not fix it
+                truncated = E.pos >= len(buffer) - 1 or E.msg.startswith("Unterminated string")
+                if not truncated:
+                    raise CatalogFormatError(f"character {offset + E.pos}: {E.msg}") from None
+                if len(buffer) - pos > max_item_size:
+                    raise CatalogFormatError(f"character {offset + pos}: item longer than {max_item_size} characters") from None
+                chunk = f.read(buffer_size)
+                if not chunk:
+                    if buffer[pos:].strip():
+                        raise CatalogFormatError(f"character {offset + pos}: unexpected end of file ({E.msg})") from None
+                    return
+                buffer, offset, pos = buffer[pos:] + chunk, offset + pos, 0
+                continue
+            yield item
+            separated = False
+            if pos > buffer_size:
+                buffer, offset, pos = buffer[pos:], offset + pos, 0
+
+
+def _utf8_lines(f):
+    """Lines of a binary file decoded one by one, so a bad byte is reported with its line"""
+    for number, line in enumerate(f, 1):
+        try:
+            yield line.decode("utf-8")
+        except UnicodeDecodeError as E:
+            raise CatalogFormatError(f"line {number}: not UTF-8 ({E.reason} at byte {E.start})") from None
+
+
+def iter_jsonl(path):
+    with open(path, "rb") as f:
+        for number, line in enumerate(_utf8_lines(f), 1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as E:
+                    raise CatalogFormatError(f"line {number}: {E.msg}") from None
+
+
+def iter_csv(path):
+    with open(path, "rb") as f:
+        reader = csv.DictReader(_utf8_lines(f))
+        try:
+            yield from reader
+        except csv.Error as E:
+            raise CatalogFormatError(f"line {reader.line_num}: {E}") from None
+
+
+def iter_catalog(path, fmt=None):
+    """Rows of a catalog file; the format is taken from the file suffix unless given"""
+    fmt = fmt or Path(path).suffix.lstrip(".").lower()
+    if fmt == "json":
+        return iter_json_array(path)
+    if fmt == "jsonl":
+        return iter_jsonl(path)
+    if fmt == "csv":
+        return iter_csv(path)
+    raise ValueError(f"Unsupported catalog format '{fmt}', expected one of {', '.join(FORMATS)}")
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+def _column(rows, key):
+    return np.array([row.get(key) if isinstance(row, dict) else None for row in rows], dtype=object)
+
+
+def _is_str(values):
+    return np.fromiter((isinstance(value, str) for value in values), dtype=bool, count=len(values))
+
+
+def _str_len(values, is_str):
+    lengths = np.full(len(values), -1)
+    if is_str.any():
+        lengths[is_str] = np.char.str_len(values[is_str].astype(str))
+    return lengths
+
+
+def validate_chunk(rows):
+    """
+    Check a chunk of rows column by column with the rules of the Book validators (the values are
+    collected into NumPy columns once, the checks are masks over whole columns):
+    name/author/category are strings of at most 500 characters, describe is a string,
+    publication_year starts with four digits. Rows with a name or describe already seen
+    earlier in the chunk are rejected too (both columns are unique).
+    Returns (valid rows ready for insert, [(row, reason), ...]).
+    """
+    reasons = np.full(len(rows), None, dtype=object)
+
+    def reject(mask, reason):
+        reasons[mask & (reasons == None)] = reason  # noqa: E711 (elementwise comparison)
+
+    columns = {key: _column(rows, key) for key in BOOK_COLUMNS}
+    for key, max_length in (("name", NAME_MAX_LENGTH), ("author", AUTHOR_MAX_LENGTH), ("category", CATEGORY_MAX_LENGTH)):
+        is_str = _is_str(columns[key])
+        reject(~is_str | (_str_len(columns[key], is_str) > max_length), f"Invalid book {key}")
+    reject(~_is_str(columns["describe"]), "Invalid book describe")
+
+    years = columns["publication_year"]
+    year_text = np.array(["" if year is None else str(year) for year in years], dtype=str)
+    year_ok = (np.char.str_len(year_text) >= 4) & np.char.isdigit(year_text.astype("U4"))
+    reject(~year_ok, "Invalid book publication year")
+    # The column is an INTEGER: CSV gives strings, they must convert as a whole
+    year_int = np.char.isdigit(year_text)
+    reject(~year_int, "Publication year is not an integer")
+
+    for key in ("name", "describe"):
+        values = np.array([str(value) for value in columns[key]], dtype=object)
+        _, first = np.unique(values, return_index=True)
+        duplicate = np.ones(len(rows), dtype=bool)
+        duplicate[first] = False
+        reject(duplicate, f"Duplicate {key} in the same chunk")
+
+    valid = reasons == None  # noqa: E711
+    valid_rows = [
+        {**{key: columns[key][i] for key in BOOK_COLUMNS}, "publication_year": int(year_text[i])}
+        for i in np.flatnonzero(valid)
+    ]
+    rejected = [(rows[i], reasons[i]) for i in np.flatnonzero(~valid)]
+    return valid_rows, rejected
+
+
+def upsert_books(rows, batch_size=500):
+    """
+    Insert books or update the existing ones with the same name, batch_size rows per statement.
+    Rows whose values did not change are left alone (no write, no FTS re-index).
+    Returns the number of rows inserted or updated.
+    """
+    table = Book.__table__
+    stmt = dialect_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.name],
+        set_={column: stmt.excluded[column] for column in BOOK_COLUMNS if column != "name"},
+        where=sa.or_(*(table.c[column] != stmt.excluded[column] for column in BOOK_COLUMNS if column != "name")),
+    )
+    written = 0
+    for start in range(0, len(rows), batch_size):
+        batch = [{column: row[column] for column in BOOK_COLUMNS} for row in rows[start:start + batch_size]]
+        written += db.session.execute(stmt, batch).rowcount
+    return written
+
+
+def _upsert_one_by_one(rows):
+    """Fallback for a chunk that hit a unique constraint (describe already used by another book)"""
+    written, rejected = 0, []
+    for row in rows:
+        try:
+            with db.session.begin_nested():
+                written += upsert_books([row])
+        except sa.exc.IntegrityError as IE:
+            rejected.append((row, f"Integrity error: {IE.orig}"))
+    return written, rejected
+
+
+def import_catalog(path, fmt=None, chunk_size=5000, report=None, rejects=None):
+    """
+    Stream a JSON array / JSONL / CSV catalog into books: read chunk_size rows, validate them
+    column by column, upsert the valid ones in bulk and commit, so memory stays bounded by one chunk.
+    report(stats) is called after every chunk; rejected rows are written to the rejects file object
+    as JSON lines with the reason. Returns the totals.
+    """
+    totals = {"rows": 0, "written": 0, "rejected": 0, "seconds": 0.0}
+    started = time.perf_counter()
+
+    for number, rows in enumerate(chunked(iter_catalog(path, fmt), chunk_size), 1):
+        chunk_started = time.perf_counter()
+        valid_rows, rejected = validate_chunk(rows)
+        try:
+            written = upsert_books(valid_rows)
+            db.session.commit()
+        except sa.exc.IntegrityError:
+            db.session.rollback()
+            written, conflicts = _upsert_one_by_one(valid_rows)
+            db.session.commit()
+            rejected.extend(conflicts)
+
+        if rejects is not None:
+            for row, reason in rejected:
+                rejects.write(json.dumps({"reason": reason, "row": row}, ensure_ascii=False, default=str) + "\n")
+
+        seconds = time.perf_counter() - chunk_started
+        totals["rows"] += len(rows)
+        totals["written"] += written
+        totals["rejected"] += len(rejected)
+        if report is not None:
+            report({
+                "chunk": number,
+                "rows": len(rows),
+                "written": written,
+                "rejected": len(rejected),
+                "seconds": seconds,
+                "rows_per_second": len(rows) / seconds if seconds else None,
+            })
+
+    totals["seconds"] = time.perf_counter() - started
+    return totals
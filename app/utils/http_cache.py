@@ -0,0 +1,95 @@
+import hashlib
+import json
+import threading
+from datetime import timezone
+from functools import wraps
+from flask import make_response, request, session
+from db.versioning import get_archive_version, get_versions
+from utils.lru_cache import LRUCache
+
+
+class ConditionalGetStats:
+    """How many GETs of each page were answered with 304 Not Modified"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def count(self, endpoint, not_modified):
+        with self._lock:
+            counts = self._counts.setdefault(endpoint, {"not_modified": 0, "rendered": 0})
+            counts["not_modified" if not_modified else "rendered"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                endpoint: {**counts, "hit_rate": round(counts["not_modified"] / (counts["not_modified"] + counts["rendered"]), 4)}
+                for endpoint, counts in self._counts.items()
+            }
+
+
+conditional_get_stats = ConditionalGetStats()
+
+# Rendered page fragments keyed by the versions of the data they show; entries of old versions just age out
+fragment_cache = LRUCache(max_entries=512)
+
+
+def _page_etag(versions):
+    state = {
+        "versions": {key: counter for key, (counter, _) in versions.items()},
+        "path": request.full_path,
+        # Pages show links for the logged-in user
+        "user_id": session.get("user_id"),
+    }
+    return hashlib.sha1(json.dumps(state, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _last_modified(versions):
+    updated = [updated_at for _, updated_at in versions.values() if updated_at is not None]
+    if not updated:
+        return None
+    # Stored as naive UTC by SQLite; HTTP dates have one-second resolution
+    return max(updated).replace(tzinfo=timezone.utc, microsecond=0)
+
+
+def conditional_get(*keys, user_archive=False):
+    """
+    Serve the page with a weak ETag and Last-Modified derived from the app_meta counters in keys
+    (plus the logged-in user's ArchiveVersion with user_archive) and answer 304 Not Modified without running
+    the view when the client already has that version. Pages with pending flash messages are always rendered.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET" or session.get("_flashes"):
+                return view(*args, **kwargs)
+
+            versions = get_versions(*keys)
+            if user_archive and "user_id" in session:
+                versions = {**versions, "archive": get_archive_version(session["user_id"])}
+            etag = _page_etag(versions)
+            last_modified = _last_modified(versions)
+
+            not_modified = request.if_none_match.contains_weak(etag) if request.if_none_match else (
+                last_modified is not None and request.if_modified_since is not None and last_modified <= request.if_modified_since
+            )
+            conditional_get_stats.count(request.endpoint, not_modified)
+            response = make_response("", 304) if not_modified else make_response(view(*args, **kwargs))
+
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            # Browsers keep the page but ask every time; the answer is usually a 304
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+        return wrapper
+    return decorator
+
+
+def cached_fragment(key, render):
+    """render() result stored under key, the key must contain the versions of the data it shows"""
+    fragment = fragment_cache.get(key)
+    if fragment is None:
+        fragment = render()
+        fragment_cache.set(key, fragment)
+    return fragment
@@ -0,0 +1,60 @@
+import base64
+import json
+import sqlalchemy as sa
+from flask import request
+from db.base import db
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def get_page_size(default=DEFAULT_PAGE_SIZE):
+    """Read the ?size= query parameter, clamped to [1, MAX_PAGE_SIZE]"""
+    size = request.args.get("size", default, type=int)
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def encode_cursor(values):
+    """Pack the sort key of the last row of a page into an opaque url-safe token"""
+    raw = json.dumps(values, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Unpack a token made by encode_cursor, None if it is missing or broken"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw.decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def _after(columns, values):
+    """(c1, c2, ...) > (v1, v2, ...) written out so every backend can use the index"""
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        clauses.append(sa.and_(*equal, column > values[i]))
+    return sa.or_(*clauses)
+
+
+def keyset_page(stmt, columns, cursor=None, size=DEFAULT_PAGE_SIZE):
+    """
+    Seek pagination: return (rows, next_cursor) for the page after cursor.
+    The last of columns has to be unique (usually the primary key), so the order is total.
+    """
+    values = decode_cursor(cursor)
+    if values is not None and len(values) == len(columns):
+        stmt = stmt.where(_after(columns, values))
+
+    # One extra row tells whether there is a next page without COUNT(*)
+    rows = db.session.execute(stmt.order_by(*columns).limit(size + 1)).scalars().all()
+
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column in columns])
+    return rows, next_cursor
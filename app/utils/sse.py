@@ -0,0 +1,7 @@
+import json
+
+
+def sse_event(data, event=None):
+    """Format one Server-Sent Events message, data is sent as JSON"""
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"